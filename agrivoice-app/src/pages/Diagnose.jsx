@@ -37,8 +37,34 @@ export default function Diagnose() {
     setLoading(true)
     setError(null)
 
+    setDiagnosis(null)
+
+    // Show each stage as soon as it is ready instead of waiting for all of them
+    const onEvent = (event, data) => {
+      setDiagnosis((current) => {
+        const next = current || { diagnosis: { original_text: '', translated_text: '', language } }
+        switch (event) {
+          case 'tags':
+            return { ...next, detected_tags: data.detected_tags }
+          case 'token':
+            return {
+              ...next,
+              diagnosis: { ...next.diagnosis, original_text: next.diagnosis.original_text + data.text },
+            }
+          case 'diagnosis':
+            return { ...next, diagnosis: { ...next.diagnosis, original_text: data.original_text } }
+          case 'translation':
+            return { ...next, diagnosis: { ...next.diagnosis, ...data } }
+          case 'audio':
+            return { ...next, audio: data }
+          default:
+            return next
+        }
+      })
+    }
+
     try {
-      const result = await apiClient.diagnose(imageFile, question, language)
+      const result = await apiClient.diagnoseStream(imageFile, question, language, onEvent)
       setDiagnosis(result.data)
     } catch (err) {
       setError(err.message || 'Failed to diagnose crop')
@@ -209,13 +235,13 @@ export default function Diagnose() {
               )}
 
               {/* Audio */}
-              {diagnosis.audio?.base64 && (
+              {apiClient.audioSrc(diagnosis.audio?.url, diagnosis.audio?.base64) && (
                 <div>
                   <h3 className="font-bold mb-2">🔊 Listen to Advice:</h3>
                   <audio
                     controls
                     className="w-full"
-                    src={`data:audio/mp3;base64,${diagnosis.audio.base64}`}
+                    src={apiClient.audioSrc(diagnosis.audio.url, diagnosis.audio.base64)}
                   />
                 </div>
               )}
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { authService } from '@/services/auth'
 import { exportService } from '@/services/export'
+import { apiClient } from '@/services/api'
 
 const API_URL = import.meta.env.VITE_API_URL || 'https://agrivoice-backend-aefdd2d38be7.herokuapp.com'
 
@@ -322,13 +323,13 @@ export default function History() {
                 </>
               )}
 
-              {selectedDiagnosis.audio_base64 && (
+              {apiClient.audioSrc(selectedDiagnosis.audio_url, selectedDiagnosis.audio_base64) && (
                 <>
                   <h3 className="font-bold text-lg mt-6 mb-3">🔊 Audio</h3>
                   <audio
                     controls
                     className="w-full"
-                    src={`data:audio/mp3;base64,${selectedDiagnosis.audio_base64}`}
+                    src={apiClient.audioSrc(selectedDiagnosis.audio_url, selectedDiagnosis.audio_base64)}
                   />
                 </>
               )}
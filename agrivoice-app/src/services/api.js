@@ -25,6 +25,48 @@ export const apiClient = {
     }
   },
 
+  // Streaming diagnosis: calls onEvent(event, data) for each Server-Sent Event
+  // (tags, token, diagnosis, translation, audio) and resolves with the final data
+  diagnoseStream: async (imageFile, query, language = 'en', onEvent = () => {}) => {
+    const formData = new FormData()
+    formData.append('file', imageFile)
+    formData.append('query', query)
+    formData.append('language', language)
+
+    const response = await fetch(`${API_URL}/api/diagnose/stream`, {
+      method: 'POST',
+      body: formData,
+    })
+
+    if (!response.ok || !response.body) {
+      throw new Error(`API error: ${response.statusText}`)
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    for (;;) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += value
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const message = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        let event = 'message'
+        let data = ''
+        for (const line of message.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7)
+          else if (line.startsWith('data: ')) data += line.slice(6)
+        }
+        const payload = data ? JSON.parse(data) : null
+        if (event === 'error') throw new Error(payload?.error || 'Diagnosis failed')
+        if (event === 'done') return { status: 'success', data: payload }
+        onEvent(event, payload)
+      }
+    }
+    throw new Error('Diagnosis stream ended early')
+  },
+
   // Analytics endpoints
   getAnalyticsSummary: async () => {
     try {
@@ -79,4 +121,12 @@ export const apiClient = {
       return false
     }
   },
+
+  // Playable source for diagnosis audio: served by URL, or inline base64 on
+  // records saved before audio was stored on the server
+  audioSrc: (audioUrl, audioBase64) => {
+    if (audioUrl) return `${API_URL}${audioUrl}`
+    if (audioBase64) return `data:audio/mp3;base64,${audioBase64}`
+    return null
+  },
 }
@@ -34,6 +34,117 @@ class Settings(BaseSettings):
     FABRIC_LAKEHOUSE_ID: str = os.getenv("FABRIC_LAKEHOUSE_ID", "")
     FABRIC_TABLE_NAME: str = os.getenv("FABRIC_TABLE_NAME", "diagnoses")
     
+    # Outbound HTTP connection pools (shared by all Azure service calls)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "False").lower() == "true"  # requires httpx[http2]
+    
+    # End-to-end time budget for one diagnosis request (shared by all stages)
+    DIAGNOSIS_DEADLINE_SECONDS: float = float(os.getenv("DIAGNOSIS_DEADLINE_SECONDS", "25"))
+    
+    # Circuit breakers (one per Azure dependency)
+    BREAKER_FAILURE_RATE_THRESHOLD: float = float(os.getenv("BREAKER_FAILURE_RATE_THRESHOLD", "0.5"))
+    BREAKER_SLOW_CALL_RATE_THRESHOLD: float = float(os.getenv("BREAKER_SLOW_CALL_RATE_THRESHOLD", "0.8"))
+    BREAKER_WINDOW_SIZE: int = int(os.getenv("BREAKER_WINDOW_SIZE", "20"))
+    BREAKER_MINIMUM_CALLS: int = int(os.getenv("BREAKER_MINIMUM_CALLS", "5"))
+    BREAKER_OPEN_SECONDS: float = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    BREAKER_HALF_OPEN_MAX_CALLS: int = int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", "2"))
+    
+    # Bulkheads: concurrent calls per worker to each Azure dependency, plus a bounded wait queue
+    BULKHEAD_VISION_MAX_CONCURRENT: int = int(os.getenv("BULKHEAD_VISION_MAX_CONCURRENT", "8"))
+    BULKHEAD_OPENAI_MAX_CONCURRENT: int = int(os.getenv("BULKHEAD_OPENAI_MAX_CONCURRENT", "8"))
+    BULKHEAD_TRANSLATOR_MAX_CONCURRENT: int = int(os.getenv("BULKHEAD_TRANSLATOR_MAX_CONCURRENT", "16"))
+    BULKHEAD_SPEECH_MAX_CONCURRENT: int = int(os.getenv("BULKHEAD_SPEECH_MAX_CONCURRENT", "8"))
+    BULKHEAD_DEFAULT_MAX_CONCURRENT: int = int(os.getenv("BULKHEAD_DEFAULT_MAX_CONCURRENT", "8"))
+    BULKHEAD_MAX_QUEUE: int = int(os.getenv("BULKHEAD_MAX_QUEUE", "32"))
+    BULKHEAD_MAX_WAIT_SECONDS: float = float(os.getenv("BULKHEAD_MAX_WAIT_SECONDS", "5"))
+    # Adaptive (AIMD) bulkhead limits: the *_MAX_CONCURRENT values above are the starting points
+    ADAPTIVE_CONCURRENCY_ENABLED: bool = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "True").lower() == "true"
+    ADAPTIVE_MIN_CONCURRENT: int = int(os.getenv("ADAPTIVE_MIN_CONCURRENT", "1"))
+    ADAPTIVE_MAX_CONCURRENT: int = int(os.getenv("ADAPTIVE_MAX_CONCURRENT", "64"))
+    ADAPTIVE_DECREASE_FACTOR: float = float(os.getenv("ADAPTIVE_DECREASE_FACTOR", "0.5"))
+    ADAPTIVE_LATENCY_SPIKE_FACTOR: float = float(os.getenv("ADAPTIVE_LATENCY_SPIKE_FACTOR", "2.0"))
+    
+    # Client-side quota throttles (per worker: divide each deployment's quota by the worker count; 0 disables)
+    OPENAI_REQUESTS_PER_MINUTE: float = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "60"))
+    OPENAI_TOKENS_PER_MINUTE: float = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "10000"))
+    TRANSLATOR_REQUESTS_PER_MINUTE: float = float(os.getenv("TRANSLATOR_REQUESTS_PER_MINUTE", "0"))
+    TRANSLATOR_CHARS_PER_MINUTE: float = float(os.getenv("TRANSLATOR_CHARS_PER_MINUTE", "33000"))
+    SPEECH_REQUESTS_PER_MINUTE: float = float(os.getenv("SPEECH_REQUESTS_PER_MINUTE", "1200"))
+    THROTTLE_BURST_SECONDS: float = float(os.getenv("THROTTLE_BURST_SECONDS", "10"))
+    THROTTLE_MAX_WAIT_SECONDS: float = float(os.getenv("THROTTLE_MAX_WAIT_SECONDS", "10"))
+    THROTTLE_MAX_RETRIES: int = int(os.getenv("THROTTLE_MAX_RETRIES", "1"))
+    
+    # Result caches (memory tier per worker, SQLite tier shared by all workers)
+    CACHE_DIR: str = os.getenv("CACHE_DIR", "./data/cache")
+    VISION_CACHE_MAX_ENTRIES: int = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "1024"))
+    VISION_CACHE_TTL_SECONDS: float = float(os.getenv("VISION_CACHE_TTL_SECONDS", "604800"))
+    # Reuse tags for images whose 64-bit dHash differs by at most this many bits
+    VISION_PHASH_ENABLED: bool = os.getenv("VISION_PHASH_ENABLED", "True").lower() == "true"
+    VISION_PHASH_MAX_DISTANCE: int = int(os.getenv("VISION_PHASH_MAX_DISTANCE", "6"))
+    # The in-memory hash index is rebuilt from live cache rows (newest first,
+    # at most this many) when it outgrows the limit or gets this old
+    VISION_PHASH_MAX_ENTRIES: int = int(os.getenv("VISION_PHASH_MAX_ENTRIES", "50000"))
+    VISION_PHASH_REBUILD_SECONDS: float = float(os.getenv("VISION_PHASH_REBUILD_SECONDS", "3600"))
+    # GPT-4 advice keyed on normalized tags/question/language (+ v2 context)
+    ADVICE_CACHE_MAX_ENTRIES: int = int(os.getenv("ADVICE_CACHE_MAX_ENTRIES", "512"))
+    ADVICE_CACHE_TTL_SECONDS: float = float(os.getenv("ADVICE_CACHE_TTL_SECONDS", "86400"))
+    # Sentence-level translation memory
+    TRANSLATION_MEMORY_MAX_ENTRIES: int = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "4096"))
+    TRANSLATION_MEMORY_TTL_SECONDS: float = float(os.getenv("TRANSLATION_MEMORY_TTL_SECONDS", "7776000"))
+    
+    # Cross-request micro-batching of Translator calls (0 ms window disables)
+    TRANSLATION_BATCH_WINDOW_MS: float = float(os.getenv("TRANSLATION_BATCH_WINDOW_MS", "10"))
+    TRANSLATION_BATCH_MAX_ITEMS: int = int(os.getenv("TRANSLATION_BATCH_MAX_ITEMS", "100"))
+    TRANSLATION_BATCH_MAX_CHARS: int = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", "10000"))
+    
+    # Translate and voice advice sentence by sentence while GPT-4 is still writing
+    SPEECH_PIPELINE_ENABLED: bool = os.getenv("SPEECH_PIPELINE_ENABLED", "True").lower() == "true"
+    SPEECH_PIPELINE_TRANSLATE_CONCURRENCY: int = int(os.getenv("SPEECH_PIPELINE_TRANSLATE_CONCURRENCY", "4"))
+    SPEECH_PIPELINE_TTS_CONCURRENCY: int = int(os.getenv("SPEECH_PIPELINE_TTS_CONCURRENCY", "4"))
+    
+    # Uploaded photos: EXIF-rotated, stripped, downscaled and recompressed before Vision (0 workers = thread)
+    IMAGE_PREP_ENABLED: bool = os.getenv("IMAGE_PREP_ENABLED", "True").lower() == "true"
+    IMAGE_PREP_WORKERS: int = int(os.getenv("IMAGE_PREP_WORKERS", "2"))
+    IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+    IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+    
+    # Likely diseases/pests ranked from Vision tags and sent to GPT-4 in the v2 prompt
+    KNOWLEDGE_PROMPT_CANDIDATES: int = int(os.getenv("KNOWLEDGE_PROMPT_CANDIDATES", "5"))
+    
+    # Synthesized TTS audio (MP3 files named by hash of text + voice + format)
+    AUDIO_DIR: str = os.getenv("AUDIO_DIR", "./data/audio")
+    # Deferred audio: answer with the text and an audio job, synthesize TTS in the background
+    AUDIO_DEFERRED: bool = os.getenv("AUDIO_DEFERRED", "False").lower() == "true"
+    AUDIO_JOB_TIMEOUT_SECONDS: float = float(os.getenv("AUDIO_JOB_TIMEOUT_SECONDS", "60"))
+    AUDIO_JOB_TTL_SECONDS: float = float(os.getenv("AUDIO_JOB_TTL_SECONDS", "3600"))
+    AUDIO_JOB_MAX_WAIT_SECONDS: float = float(os.getenv("AUDIO_JOB_MAX_WAIT_SECONDS", "30"))
+    # Also inline the MP3 as base64 in Copilot responses (deprecated; for bots not yet using audio_url)
+    COPILOT_AUDIO_BASE64: bool = os.getenv("COPILOT_AUDIO_BASE64", "True").lower() == "true"
+    
+    # Diagnosis job queue (POST /api/jobs/diagnose): workers per process, attempts
+    # per job, and how long a silent running job keeps its claim before another
+    # worker takes it over (e.g. after a restart)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    JOB_DEADLINE_SECONDS: float = float(os.getenv("JOB_DEADLINE_SECONDS", "60"))
+    JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+    JOB_TTL_SECONDS: float = float(os.getenv("JOB_TTL_SECONDS", "86400"))
+    JOB_CALLBACK_ATTEMPTS: int = int(os.getenv("JOB_CALLBACK_ATTEMPTS", "3"))
+    JOB_CALLBACK_TIMEOUT_SECONDS: float = float(os.getenv("JOB_CALLBACK_TIMEOUT_SECONDS", "10"))
+    # Comma-separated hosts completion callbacks may be sent to (empty: callbacks
+    # disabled); hosts resolving to private or loopback addresses are refused
+    JOB_CALLBACK_ALLOWED_HOSTS: str = os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "")
+    
+    # Field surveys (POST /api/survey/diagnose): photos per request and photos
+    # analyzed by Vision at once
+    SURVEY_MAX_IMAGES: int = int(os.getenv("SURVEY_MAX_IMAGES", "50"))
+    SURVEY_VISION_CONCURRENCY: int = int(os.getenv("SURVEY_VISION_CONCURRENCY", "4"))
+    
     # Application Settings
     APP_NAME: str = "AgriVoice - Multilingual Crop Doctor"
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
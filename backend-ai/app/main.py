@@ -3,10 +3,27 @@ AgriVoice FastAPI Backend
 Main entry point for the AI-powered crop diagnosis API
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
-from .routers import diagnosis, copilot, enhanced, analytics, auth, history, export
+from .routers import diagnosis, copilot, enhanced, analytics, auth, history, export, metrics, audio, jobs, survey
+from .services import audio_jobs, http_client, image_prep, job_queue, knowledge_base
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the knowledge index, open connection pools and start image and job workers on startup; stop them (and cancel audio jobs) on shutdown"""
+    knowledge_base.startup()
+    await image_prep.startup()
+    await http_client.startup()
+    await job_queue.startup()
+    yield
+    await job_queue.shutdown()
+    await audio_jobs.shutdown()
+    await http_client.shutdown()
+    await image_prep.shutdown()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -14,7 +31,8 @@ app = FastAPI(
     description="AI-powered crop diagnosis and organic solution recommendations for African farmers",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS - allow all origins for hackathon
@@ -54,7 +72,7 @@ async def check_config():
     return {
         "vision": bool(settings.AZURE_VISION_KEY and settings.AZURE_VISION_ENDPOINT),
         "openai": bool(settings.AZURE_OPENAI_KEY and settings.AZURE_OPENAI_ENDPOINT),
-        "speech": bool(settings.AZURE_SPEECH_KEY and settings.AZURE_SPEECH_REGION),
+        "speech": bool(settings.AZURE_SPEECH_KEY and (settings.AZURE_SPEECH_ENDPOINT or settings.AZURE_SPEECH_REGION)),
         "translator": bool(settings.AZURE_TRANSLATOR_KEY and settings.AZURE_TRANSLATOR_REGION)
     }
 
@@ -67,6 +85,10 @@ app.include_router(export.router)
 app.include_router(copilot.router)
 app.include_router(enhanced.router)
 app.include_router(analytics.router)
+app.include_router(metrics.router)
+app.include_router(audio.router)
+app.include_router(jobs.router)
+app.include_router(survey.router)
 
 
 if __name__ == "__main__":
@@ -3,8 +3,10 @@ Enhanced Crop Diagnosis Models with Severity Scoring and Crop Awareness
 """
 
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from enum import Enum
+from pathlib import Path
+import json
 
 
 # ============================================================================
@@ -63,6 +65,7 @@ class EnhancedDiagnoseRequest(BaseModel):
     farmer_experience: Optional[FarmerExperience] = "intermediate"
     current_season: Optional[Season] = None
     field_size: Optional[str] = None  # e.g., "0.5 acres", "small"
+    bypass_cache: bool = False  # Ask GPT-4 again instead of reusing cached advice
     
     class Config:
         json_schema_extra = {
@@ -104,12 +107,19 @@ class EnhancedDiagnoseResponse(BaseModel):
     replanting_needed: Optional[bool] = None
     
     # Audio and language
-    audio_base64: Optional[str] = None
+    audio_url: Optional[str] = None  # GET /api/audio/{id}
+    audio_base64: Optional[str] = None  # Deprecated: audio is served by audio_url
     language: str
     
     # Reference
     tags: List[str]
     
+    # Pipeline stages cut off by the request deadline
+    cut_stages: List[str] = []
+    
+    # Stages served degraded because a dependency's circuit breaker is open
+    fallback_stages: List[str] = []
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -133,81 +143,30 @@ class EnhancedDiagnoseResponse(BaseModel):
 # Crop-Specific Information
 # ============================================================================
 
+# Diseases and pests per crop, with their symptoms and risky seasons.
+# Kept as data so agronomists can extend it without code changes; the
+# symptom index over it is built by app.services.knowledge_base.
+CROP_KNOWLEDGE_PATH = Path(__file__).parent / "crop_knowledge.json"
+
+
+def load_crop_knowledge(path: Path = CROP_KNOWLEDGE_PATH) -> Dict[CropType, dict]:
+    """Read the crop knowledge base file, keyed by crop"""
+    with open(path, encoding="utf-8") as f:
+        return {CropType(crop): info for crop, info in json.load(f).items()}
+
+
+CROP_KNOWLEDGE = load_crop_knowledge()
+
+# Per-crop summary (names only) used by the prompt and guidance helpers
 CROP_DISEASE_DATABASE = {
-    CropType.MAIZE: {
-        "common_diseases": [
-            "Gray Leaf Spot",
-            "Northern Corn Leaf Blight",
-            "Southern Corn Leaf Blight",
-            "Corn Rust",
-            "Maize Lethal Necrosis",
-            "Aflatoxin (Aspergillus)"
-        ],
-        "common_pests": [
-            "Fall Armyworm",
-            "Stem Borers",
-            "Grasshoppers",
-            "Cutworms"
-        ],
-        "critical_symptoms": ["wilting", "discolored leaves", "stunted growth"],
-        "high_risk_seasons": ["rainy_season"],
-        "crop_duration_days": 120,
-    },
-    
-    CropType.BEAN: {
-        "common_diseases": [
-            "Bean Rust",
-            "Angular Leaf Spot",
-            "Bean Common Mosaic Virus",
-            "Anthracnose"
-        ],
-        "common_pests": [
-            "Bean Beetles",
-            "Aphids",
-            "Spider Mites",
-            "Pod Borers"
-        ],
-        "critical_symptoms": ["yellow leaves", "wilting", "pod damage"],
-        "high_risk_seasons": ["rainy_season"],
-        "crop_duration_days": 90,
-    },
-    
-    CropType.TOMATO: {
-        "common_diseases": [
-            "Early Blight",
-            "Late Blight",
-            "Septoria Leaf Spot",
-            "Fusarium Wilt",
-            "Tomato Yellow Leaf Curl Virus"
-        ],
-        "common_pests": [
-            "Whiteflies",
-            "Spider Mites",
-            "Fruit Flies",
-            "Leaf Miners"
-        ],
-        "critical_symptoms": ["yellowing", "wilting", "fruit spots", "vine disease"],
-        "high_risk_seasons": ["rainy_season"],
-        "crop_duration_days": 75,
-    },
-    
-    CropType.POTATO: {
-        "common_diseases": [
-            "Late Blight",
-            "Early Blight",
-            "Bacterial Wilt",
-            "Potato Virus Y"
-        ],
-        "common_pests": [
-            "Potato Beetles",
-            "Aphids",
-            "Cutworms",
-            "Mites"
-        ],
-        "critical_symptoms": ["leaf spots", "wilting", "stem rot", "tuber damage"],
-        "high_risk_seasons": ["rainy_season"],
-        "crop_duration_days": 90,
-    },
+    crop: {
+        "common_diseases": [p["name"] for p in info["problems"] if p["kind"] == "disease"],
+        "common_pests": [p["name"] for p in info["problems"] if p["kind"] == "pest"],
+        "critical_symptoms": info["critical_symptoms"],
+        "high_risk_seasons": info["high_risk_seasons"],
+        "crop_duration_days": info["crop_duration_days"],
+    }
+    for crop, info in CROP_KNOWLEDGE.items()
 }
 
 
@@ -311,9 +270,16 @@ def get_seasonal_guidance(season: Season) -> dict:
 def generate_enhanced_system_prompt(
     crop_type: Optional[CropType] = None,
     farmer_experience: FarmerExperience = FarmerExperience.INTERMEDIATE,
-    season: Optional[Season] = None
+    season: Optional[Season] = None,
+    likely_problems: Optional[List[str]] = None
 ) -> str:
-    """Generate context-aware system prompt"""
+    """
+    Generate context-aware system prompt
+    
+    Args:
+        likely_problems: Candidate diseases/pests ranked from the image tags
+            (one line each); listed instead of the crop's common problems
+    """
     
     base_prompt = """You are AgriVoice, an expert agronomist specializing in organic farming for African smallholder farmers.
 
@@ -325,7 +291,15 @@ YOUR ROLE:
     
     # Add crop-specific context
     crop_context = ""
-    if crop_type:
+    if likely_problems:
+        crop_name = crop_type.value.upper() if crop_type else "CROP NOT GIVEN"
+        problem_lines = "\n".join(f"- {line}" for line in likely_problems)
+        crop_context = f"""
+
+LIKELY PROBLEMS ({crop_name}), best match with the detected symptoms first:
+{problem_lines}
+Confirm or rule these out from the symptoms before naming another cause."""
+    elif crop_type:
         crop_info = get_crop_specific_guidance(crop_type)
         if crop_info:
             crop_context = f"""
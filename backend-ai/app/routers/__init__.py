@@ -6,5 +6,9 @@ from . import enhanced
 from . import auth
 from . import history
 from . import export
+from . import metrics
+from . import audio
+from . import jobs
+from . import survey
 
-__all__ = ["diagnosis", "copilot", "enhanced", "auth", "history", "export"]
+__all__ = ["diagnosis", "copilot", "enhanced", "auth", "history", "export", "metrics", "audio", "jobs", "survey"]
@@ -0,0 +1,134 @@
+"""
+Audio Router
+Serves synthesized TTS audio by id, so diagnosis responses carry a URL
+instead of inline base64, and the status of deferred audio jobs
+"""
+
+from typing import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from ..config import settings
+from ..services import audio_jobs, audio_store, speech
+from ..services.circuit_breaker import CircuitOpenError
+
+router = APIRouter(prefix="/api/audio", tags=["audio"])
+
+# Audio ids are content hashes, so a given URL never changes
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Longest text /speak will synthesize in one request
+MAX_SPEAK_CHARS = 5000
+
+
+@router.get("/speak")
+async def speak(
+    text: str = Query(..., min_length=1, max_length=MAX_SPEAK_CHARS),
+    language: str = Query(default="en")
+):
+    """
+    Speak text as a chunked audio/mpeg stream
+    
+    Azure TTS output is relayed while it is being generated, so playback
+    can start after the first frames (use the URL directly as an <audio>
+    src). The audio is stored on the way through; X-Audio-Url gives its
+    permanent URL, and repeated requests are served from disk.
+    """
+    audio_id = audio_store.audio_id(text, speech.voice_for(language))
+    if audio_store.exists(audio_id):
+        return FileResponse(
+            audio_store.path_for(audio_id),
+            media_type="audio/mpeg",
+            headers={
+                "ETag": f'"{audio_id}"',
+                "Cache-Control": CACHE_CONTROL,
+                "X-Audio-Url": audio_store.audio_url(audio_id)
+            }
+        )
+    
+    # Pull the first chunk before answering so upstream errors get a proper status
+    chunks = speech.stream_audio(text, language)
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Speech unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    # The relay may still be cut short (upstream drop), so it must not be
+    # cached as the audio; caches should use X-Audio-Url, which is immutable
+    return StreamingResponse(
+        _prepend(first_chunk, chunks),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-store", "X-Audio-Url": audio_store.audio_url(audio_id)}
+    )
+
+
+async def _prepend(first_chunk: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first_chunk
+    async for chunk in chunks:
+        yield chunk
+
+
+@router.get("/jobs/{job_id}")
+async def get_audio_job(
+    job_id: str,
+    request: Request,
+    response: Response,
+    wait: float = Query(default=0, ge=0)
+):
+    """
+    Status of a deferred audio job
+    
+    With wait > 0 the request is held (long-poll, up to
+    AUDIO_JOB_MAX_WAIT_SECONDS) until the job finishes. Status is
+    "pending", "done" (audio_id and url are set) or "failed" (error is set).
+    The ETag changes with the status, so If-None-Match -> 304 while
+    nothing has changed.
+    """
+    if wait > 0:
+        job = await audio_jobs.wait(job_id, min(wait, settings.AUDIO_JOB_MAX_WAIT_SECONDS))
+    else:
+        job = await audio_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Audio job not found")
+    
+    etag = audio_jobs.etag(job)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return {"status": "success", "data": job}
+
+
+@router.get("/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    """
+    MP3 audio for an id returned by a diagnosis endpoint
+    
+    Supports conditional requests (If-None-Match -> 304) and byte ranges
+    (Range -> 206) so browsers can seek and re-use cached audio.
+    """
+    if not audio_store.exists(audio_id):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    etag = f'"{audio_id}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    
+    if _etag_matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(
+        audio_store.path_for(audio_id),
+        media_type="audio/mpeg",
+        headers=headers
+    )
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag"""
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
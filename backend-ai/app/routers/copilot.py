@@ -8,12 +8,44 @@ from pydantic import BaseModel
 from typing import Optional
 import base64
 
-from app.services import vision, gpt4, speech
+from app.config import settings
+from app.services import audio_store, vision, image_prep
+from app.services.deadline import Deadline
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.diagnosis_pipeline import DIAGNOSIS_PIPELINE
+from app.services.pipeline import PipelineRun, Stage
 from app.services.fabric import log_diagnosis_event
 
 router = APIRouter(prefix="/api/copilot", tags=["copilot"])
 
 
+async def log_run(run: PipelineRun) -> None:
+    """Log the Copilot diagnosis (runs alongside audio)"""
+    await log_diagnosis_event({
+        "source": "copilot_studio",
+        "user_id": run.inputs["user_id"],
+        "tags": run["vision"],
+        "question": run.inputs["question"],
+        "diagnosis": run["diagnosis"],
+        "language": run.inputs["language"],
+        "translated_diagnosis": run["translation"]["text"]
+    })
+
+
+PIPELINE = DIAGNOSIS_PIPELINE.with_stages(
+    "copilot",
+    Stage("log", log_run, after=("vision", "diagnosis", "translation"), timed=False)
+)
+
+
+async def inline_audio(audio_id: Optional[str]) -> Optional[str]:
+    """Base64 of the stored audio, for bots that still read audio_base64"""
+    if not settings.COPILOT_AUDIO_BASE64 or not audio_id:
+        return None
+    audio_bytes = await audio_store.read(audio_id)
+    return base64.b64encode(audio_bytes).decode("utf-8") if audio_bytes else None
+
+
 class CopilotDiagnoseRequest(BaseModel):
     """Request payload from Copilot Studio bot"""
     image_base64: str  # Base64-encoded image from Copilot
@@ -27,9 +59,12 @@ class CopilotDiagnoseResponse(BaseModel):
     status: str
     diagnosis: str  # Plain text for bot to speak
     diagnosis_original: str  # Original English version
-    audio_base64: Optional[str] = None  # Optional audio
+    audio_url: Optional[str] = None  # Optional audio (GET /api/audio/{id})
+    audio_base64: Optional[str] = None  # Deprecated: use audio_url (set while COPILOT_AUDIO_BASE64 is on)
     language: str
     tags: list
+    cut_stages: list = []  # Pipeline stages cut off by the request deadline
+    fallback_stages: list = []  # Stages served degraded because a dependency is down
 
 
 @router.post("/diagnose-crop", response_model=CopilotDiagnoseResponse)
@@ -47,66 +82,41 @@ async def copilot_diagnose_crop(request: CopilotDiagnoseRequest):
         Response with diagnosis text and optional audio (Copilot bot will speak this)
     """
     try:
+        deadline = Deadline()
+        
         # Step 1: Decode base64 image
         try:
             image_bytes = base64.b64decode(request.image_base64)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
         
-        # Step 2: Analyze image to get tags
-        detected_tags = await vision.analyze_image(image_bytes)
-        
-        # Step 3: Get diagnosis from GPT-4
-        diagnosis_original = await gpt4.get_agronomist_advice(
-            detected_tags, 
-            request.question, 
-            "en"  # Always get English first
-        )
-        
-        # Step 4: Translate if needed
-        if request.language != "en":
-            diagnosis_translated = await speech.translate_text(
-                diagnosis_original, 
-                request.language
-            )
-        else:
-            diagnosis_translated = diagnosis_original
-        
-        # Step 5: Generate audio for Copilot to read
-        try:
-            audio_base64 = await speech.generate_audio(
-                diagnosis_translated, 
-                request.language
-            )
-        except Exception as e:
-            # Audio generation is optional
-            print(f"Warning: Audio generation failed: {str(e)}")
-            audio_base64 = None
-        
-        # Step 6: Log event
-        log_data = {
-            "source": "copilot_studio",
-            "user_id": request.user_id,
-            "tags": detected_tags,
+        # Steps 2-6: Image prep, vision, diagnosis (always asked in English
+        # first), translation, audio for Copilot to read, logging
+        run = await PIPELINE.run({
+            "image": image_bytes,
             "question": request.question,
-            "diagnosis": diagnosis_original,
             "language": request.language,
-            "translated_diagnosis": diagnosis_translated
-        }
-        await log_diagnosis_event(log_data)
+            "advice_language": "en",
+            "user_id": request.user_id
+        }, deadline)
         
         # Step 7: Return response in Copilot format
         return CopilotDiagnoseResponse(
             status="success",
-            diagnosis=diagnosis_translated,  # For bot to speak
-            diagnosis_original=diagnosis_original,  # Original English
-            audio_base64=audio_base64,  # Optional audio file
+            diagnosis=run["translation"]["text"],  # For bot to speak
+            diagnosis_original=run["diagnosis"],  # Original English
+            audio_url=run["audio"]["url"],  # Optional audio file
+            audio_base64=await inline_audio(run["audio"]["id"]),
             language=request.language,
-            tags=detected_tags
+            tags=run["vision"],
+            cut_stages=run.cut_stages,
+            fallback_stages=run.fallback_stages
         )
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Copilot diagnosis unavailable: {str(e)}")
     except Exception as e:
         print(f"Copilot diagnosis error: {str(e)}")
         raise HTTPException(
@@ -136,7 +146,7 @@ async def copilot_validate_image(request: CopilotDiagnoseRequest):
     Useful for bot to check if image is valid crop image.
     """
     try:
-        image_bytes = base64.b64decode(request.image_base64)
+        image_bytes = await image_prep.prepare_image(base64.b64decode(request.image_base64))
         
         # Try to analyze
         tags = await vision.analyze_image(image_bytes)
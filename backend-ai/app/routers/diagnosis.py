@@ -4,10 +4,15 @@ Main endpoint orchestrating: Image Analysis -> Diagnosis -> Translation -> Audio
 """
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
-import io
+from fastapi.responses import StreamingResponse
+from typing import Dict, Optional
+import asyncio
 
-from ..services import vision, gpt4, speech
+from ..config import settings
+from ..services import sse
+from ..services.deadline import Deadline
+from ..services.diagnosis_pipeline import DIAGNOSIS_PIPELINE, diagnosis_source
+from ..services.pipeline import PipelineRun, Stage
 from ..services.fabric import log_diagnosis_event
 from ..services.data_logger import log_diagnosis
 
@@ -18,7 +23,9 @@ router = APIRouter(prefix="/api", tags=["diagnosis"])
 async def diagnose(
     file: UploadFile = File(...),
     query: str = Form(...),
-    language: str = Form(default="en")
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False),
+    defer_audio: Optional[bool] = Form(default=None)
 ):
     """
     Complete diagnosis pipeline: analyze image -> diagnose -> translate -> generate audio
@@ -27,6 +34,9 @@ async def diagnose(
         - file: Crop image (JPG/PNG)
         - query: Farmer's question
         - language: Target language code (en, sw, ar, fr, es, pt)
+        - bypass_cache: Ask GPT-4 again instead of reusing cached advice
+        - defer_audio: Return once the text is ready and synthesize audio
+          in the background (default: AUDIO_DEFERRED)
     
     Response:
         {
@@ -36,60 +46,48 @@ async def diagnose(
                 "diagnosis": {
                     "original_text": "English advice...",
                     "translated_text": "Swahili advice...",
-                    "language": "sw"
+                    "language": "sw",
+                    "source": "gpt4"
                 },
                 "audio": {
-                    "base64": "..."
-                }
+                    "id": "<sha256>",
+                    "url": "/api/audio/<sha256>"
+                },
+                "cut_stages": [],
+                "fallback_stages": []
             }
         }
+    
+    The whole pipeline shares one deadline (DIAGNOSIS_DEADLINE_SECONDS).
+    Audio is skipped when the budget runs out; cut_stages lists any stage
+    that was cut off. When the Translator or Speech circuit breaker is open
+    the English text or no audio is returned and fallback_stages says so.
+    When GPT-4 fails or misses its share of the deadline, rule-based offline
+    advice is returned instead: diagnosis.source is "offline_rules" and
+    fallback_stages includes "diagnosis".
+    
+    With deferred audio, audio also carries job_id, job_url and status
+    ("pending" until the audio lands; id and url are filled in once it has);
+    poll GET /api/audio/jobs/{job_id} for the result.
     """
     try:
+        deadline = Deadline()
+        
         # Step 1: Read image file
         image_bytes = await file.read()
         if not image_bytes:
             raise HTTPException(status_code=400, detail="No image provided")
         
-        # Step 2: Analyze image with Azure Vision
-        detected_tags = await vision.analyze_image(image_bytes)
-        
-        # Step 3: Get diagnosis from GPT-4
-        diagnosis_text = await gpt4.get_agronomist_advice(detected_tags, query, language)
-        
-        # Step 4: Translate if needed
-        if language != "en":
-            translated_text = await speech.translate_text(diagnosis_text, language)
-        else:
-            translated_text = diagnosis_text
-        
-        # Step 5: Generate audio
-        audio_base64 = await speech.generate_audio(translated_text, language)
-        
-        # Step 6: Log event for analytics
-        log_data = {
-            "detected_tags": detected_tags,
-            "query": query,
-            "diagnosis": diagnosis_text,
-            "language": language,
-            "translated_text": translated_text
-        }
-        await log_diagnosis_event(log_data)
-        await log_diagnosis(log_data)  # Also log to persistent data store
+        # Steps 2-6: Image prep, vision, diagnosis, translation, audio and logging
+        data = await run_diagnosis(
+            deadline, image_bytes, query, language, bypass_cache,
+            defer_audio=settings.AUDIO_DEFERRED if defer_audio is None else defer_audio
+        )
         
         # Return response with exact contract
         return {
             "status": "success",
-            "data": {
-                "detected_tags": detected_tags,
-                "diagnosis": {
-                    "original_text": diagnosis_text,
-                    "translated_text": translated_text,
-                    "language": language
-                },
-                "audio": {
-                    "base64": audio_base64
-                }
-            }
+            "data": data
         }
         
     except Exception as e:
@@ -99,6 +97,136 @@ async def diagnose(
         }
 
 
+@router.post("/diagnose/stream")
+async def diagnose_stream(
+    file: UploadFile = File(...),
+    query: str = Form(...),
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False),
+    defer_audio: Optional[bool] = Form(default=None)
+):
+    """
+    Streaming variant of /api/diagnose (Server-Sent Events)
+    
+    Same inputs as /api/diagnose. Events are sent as each stage completes:
+        - tags: {"detected_tags": [...]}
+        - token: {"text": "..."} (diagnosis text as GPT-4 generates it)
+        - diagnosis: {"original_text": "...", "source": "gpt4" | "offline_rules"}
+        - translation: {"translated_text": "...", "language": "sw"}
+        - audio: {"id": "...", "url": "/api/audio/..."} (id/url null if skipped;
+          with deferred audio, the job reference /api/diagnose returns)
+        - done: the same data object /api/diagnose returns
+        - error: {"error": "..."}
+    """
+    image_bytes = await file.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="No image provided")
+    
+    return StreamingResponse(
+        _diagnosis_events(
+            image_bytes, query, language, bypass_cache,
+            settings.AUDIO_DEFERRED if defer_audio is None else defer_audio
+        ),
+        media_type="text/event-stream",
+        headers=sse.SSE_HEADERS
+    )
+
+
+async def _diagnosis_events(
+    image_bytes: bytes,
+    query: str,
+    language: str,
+    bypass_cache: bool,
+    defer_audio: bool = False
+):
+    """Run the diagnosis pipeline, yielding SSE events as stages finish"""
+    try:
+        deadline = Deadline()
+        
+        # Tags, tokens, translation and audio are relayed as the stages produce them
+        events = asyncio.Queue()
+        work = asyncio.create_task(run_diagnosis(
+            deadline, image_bytes, query, language, bypass_cache, defer_audio, events
+        ))
+        async for event, data in sse.relay(work, events):
+            yield sse.format_event(event, data)
+        
+        yield sse.format_event("done", work.result())
+        
+    except Exception as e:
+        yield sse.format_event("error", {"error": str(e)})
+
+
+async def log_run(run: PipelineRun) -> None:
+    """Log the diagnosis for analytics (runs alongside audio)"""
+    log_data = {
+        "detected_tags": run["vision"],
+        "query": run.inputs["question"],
+        "diagnosis": run["diagnosis"],
+        "language": run.inputs["language"],
+        "translated_text": run["translation"]["text"]
+    }
+    await log_diagnosis_event(log_data)
+    await log_diagnosis(log_data)  # Also log to persistent data store
+
+
+PIPELINE = DIAGNOSIS_PIPELINE.with_stages(
+    "diagnose",
+    Stage("log", log_run, after=("vision", "diagnosis", "translation"), timed=False)
+)
+
+
+async def run_diagnosis(
+    deadline: Deadline,
+    image_bytes: bytes,
+    query: str,
+    language: str,
+    bypass_cache: bool = False,
+    defer_audio: bool = False,
+    events: Optional[asyncio.Queue] = None,
+    prepared: bool = False
+) -> Dict:
+    """
+    Vision -> diagnosis -> translation -> audio and analytics log for one
+    image (see diagnosis_pipeline for the stages).
+    
+    With SPEECH_PIPELINE_ENABLED the advice is streamed and each sentence
+    is translated and voiced while later ones are still being generated.
+    
+    Args:
+        image_bytes: The photo
+        events: If given, the stages' progress events ("tags", "token",
+            "diagnosis", "translation", "audio") are put on it as they happen
+        defer_audio: Hand audio to a background job; its share of the
+            deadline goes to the other stages
+        prepared: image_bytes already passed through image_prep
+    
+    Returns:
+        The data object of the /api/diagnose response
+    """
+    run = await PIPELINE.run({
+        "image": image_bytes,
+        "prepared": prepared,
+        "question": query,
+        "language": language,
+        "bypass_cache": bypass_cache,
+        "defer_audio": defer_audio
+    }, deadline, events)
+    
+    return {
+        "detected_tags": run["vision"],
+        "diagnosis": {
+            "original_text": run["diagnosis"],
+            "translated_text": run["translation"]["text"],
+            "language": language,
+            "source": diagnosis_source(run)
+        },
+        "audio": run["audio"],
+        "cut_stages": run.cut_stages,
+        "fallback_stages": run.fallback_stages
+    }
+
+
 @router.get("/health/diagnosis")
 async def diagnosis_health():
     """Check diagnosis service health"""
@@ -3,7 +3,9 @@ Enhanced Copilot Router with Crop Awareness and Severity Scoring
 """
 
 from fastapi import APIRouter, HTTPException
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+import asyncio
 import base64
 
 from app.models import (
@@ -17,7 +19,12 @@ from app.models import (
     get_severity_info,
     generate_enhanced_system_prompt
 )
-from app.services import vision, gpt4, speech
+from app.config import settings
+from app.services import speech, knowledge_base, sse
+from app.services.deadline import Deadline
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.diagnosis_pipeline import DIAGNOSIS_PIPELINE
+from app.services.pipeline import PipelineRun, Stage
 from app.services.fabric import log_diagnosis_event
 
 router = APIRouter(prefix="/api/v2", tags=["enhanced"])
@@ -43,40 +50,115 @@ async def enhanced_diagnose(request: EnhancedDiagnoseRequest):
     """
     try:
         # Step 1: Decode base64 image
-        try:
-            image_bytes = base64.b64decode(request.image_base64)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+        image_bytes = decode_image(request)
         
-        # Step 2: Analyze image to get tags
-        detected_tags = await vision.analyze_image(image_bytes)
-        
-        # Step 3: Determine severity if not provided
-        severity = request.severity_estimate or SeverityLevel.MODERATE
-        severity_info = get_severity_info(severity)
-        
-        # Get farmer experience, ensuring it's an enum
-        farmer_exp = request.farmer_experience
-        if isinstance(farmer_exp, str):
-            farmer_exp = FarmerExperience(farmer_exp)
-        elif farmer_exp is None:
-            farmer_exp = FarmerExperience.INTERMEDIATE
-        
-        # Step 4: Get crop-specific guidance
-        crop_guidance = {}
-        if request.crop_type:
-            crop_guidance = get_crop_specific_guidance(request.crop_type)
-        
-        # Step 5: Generate context-aware system prompt
-        system_prompt = generate_enhanced_system_prompt(
-            crop_type=request.crop_type,
-            farmer_experience=farmer_exp,
-            season=request.current_season
-        )
+        # Steps 2-12: Image prep, vision, structured prompt, GPT-4, structured
+        # fields, translation, audio, logging
+        run = await run_enhanced(request, {"image": image_bytes}, Deadline())
+        return build_response(run)
+    
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Diagnosis unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Diagnosis failed: {str(e)}")
+
+
+@router.post("/diagnose-enhanced/stream")
+async def enhanced_diagnose_stream(request: EnhancedDiagnoseRequest):
+    """
+    Streaming variant of /api/v2/diagnose-enhanced (Server-Sent Events)
+    
+    Same request body. Events are sent as each stage completes:
+        - tags: {"detected_tags": [...]}
+        - token: {"text": "..."} (English diagnosis as GPT-4 generates it)
+        - diagnosis: {"original_text": "...", "source": "gpt4" | "offline_rules"}
+        - translation: translated diagnosis, disease name and action lists
+        - audio: {"id": "...", "url": "/api/audio/..."} (id/url null if skipped)
+        - done: the same object /api/v2/diagnose-enhanced returns
+        - error: {"error": "..."}
+    """
+    image_bytes = decode_image(request)
+    return StreamingResponse(
+        _enhanced_events(request, image_bytes),
+        media_type="text/event-stream",
+        headers=sse.SSE_HEADERS
+    )
+
+
+async def _enhanced_events(request: EnhancedDiagnoseRequest, image_bytes: bytes):
+    """Run the enhanced pipeline, yielding SSE events as stages finish"""
+    try:
+        # Tags, tokens, translation and audio are relayed as the stages produce them
+        events = asyncio.Queue()
+        work = asyncio.create_task(run_enhanced(request, {"image": image_bytes}, Deadline(), events))
+        async for event, data in sse.relay(work, events):
+            yield sse.format_event(event, data)
+        yield sse.format_event("done", build_response(work.result()).model_dump(mode="json"))
         
-        # Step 6: Add structured context to user message
-        user_context = f"""
-IMAGE ANALYSIS: {', '.join(detected_tags)}
+    except Exception as e:
+        yield sse.format_event("error", {"error": str(e)})
+
+
+def decode_image(request: EnhancedDiagnoseRequest) -> bytes:
+    """Decode the base64 image (400 if it is not valid base64)"""
+    try:
+        return base64.b64decode(request.image_base64)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+
+
+def build_advice_inputs(request: EnhancedDiagnoseRequest, detected_tags: List[str]) -> Dict[str, Any]:
+    """
+    Severity, experience level and the structured GPT-4 prompt for a request.
+    
+    The system prompt lists the diseases and pests that best match the
+    detected tags (ranked with the knowledge index) rather than the crop's
+    generic lists.
+    
+    Returns:
+        severity, severity_info, farmer_experience, candidates (ranked
+        problem names), system_prompt, user_context (the question sent to
+        GPT-4) and context (cache key inputs)
+    """
+    # Determine severity if not provided
+    severity = request.severity_estimate or SeverityLevel.MODERATE
+    severity_info = get_severity_info(severity)
+    
+    # Get farmer experience, ensuring it's an enum
+    farmer_exp = request.farmer_experience
+    if isinstance(farmer_exp, str):
+        farmer_exp = FarmerExperience(farmer_exp)
+    elif farmer_exp is None:
+        farmer_exp = FarmerExperience.INTERMEDIATE
+    
+    # Get crop-specific guidance
+    crop_guidance = {}
+    if request.crop_type:
+        crop_guidance = get_crop_specific_guidance(request.crop_type)
+    
+    # Rank likely diseases/pests from the tags so the model is given the
+    # relevant candidates (the prompt is determined by the cache key inputs)
+    matches = knowledge_base.rank(
+        detected_tags,
+        request.question,
+        crop=request.crop_type,
+        season=request.current_season,
+        limit=settings.KNOWLEDGE_PROMPT_CANDIDATES
+    )
+    
+    # Generate context-aware system prompt
+    system_prompt = generate_enhanced_system_prompt(
+        crop_type=request.crop_type,
+        farmer_experience=farmer_exp,
+        season=request.current_season,
+        likely_problems=[match.describe() for match in matches]
+    )
+    
+    # Add structured context to user message
+    user_context = f"""
+IMAGE ANALYSIS: {', '.join(sorted(detected_tags))}
 CROP: {request.crop_type.value if request.crop_type else 'Unknown'}
 SEVERITY: {severity.value}
 AFFECTED AREA: {request.affected_area or 'Unknown'}
@@ -90,73 +172,185 @@ Please provide a diagnosis following this structure:
 5. TIMELINE (when to expect improvement)
 6. PREVENTION (for next season)
 """
-        
-        # Step 7: Get enhanced diagnosis from GPT-4
-        diagnosis_text = await gpt4.get_agronomist_advice(
-            detected_tags,
-            user_context,
-            request.language
-        )
-        
-        # Step 8: Extract structured information from response
-        # (In production, you'd parse the response to extract fields)
-        disease_name = extract_field_from_response(diagnosis_text, "DISEASE")
-        immediate_actions = extract_actions_from_response(diagnosis_text, "IMMEDIATE")
-        ongoing_actions = extract_actions_from_response(diagnosis_text, "ONGOING")
-        prevention = extract_actions_from_response(diagnosis_text, "PREVENTION")
-        
-        # Step 9: Translate diagnosis if needed
-        diagnosis_translated = diagnosis_text
-        if request.language != "en":
-            diagnosis_translated = await speech.translate_text(diagnosis_text, request.language)
-        
-        # Step 10: Generate audio
-        audio_base64 = None
-        try:
-            audio_base64 = await speech.generate_audio(diagnosis_translated, request.language)
-        except Exception as e:
-            print(f"Audio generation failed (non-blocking): {str(e)}")
-        
-        # Step 11: Log to Fabric
-        await log_diagnosis_event({
-            "crop_type": request.crop_type.value if request.crop_type else "unknown",
-            "severity": severity.value,
-            "detected_tags": detected_tags,
-            "disease_name": disease_name,
-            "diagnosis": diagnosis_text,
-            "farmer_experience": farmer_exp.value
-        })
-        
-        # Step 12: Prepare response
-        return EnhancedDiagnoseResponse(
-            status="success",
-            diagnosis=diagnosis_translated,
-            diagnosis_original=diagnosis_text,
-            disease_name=disease_name,
-            severity=severity,
-            affected_plant_parts=extract_plant_parts(diagnosis_text),
-            confidence_score=0.85,  # Placeholder - could be calculated
-            immediate_actions=immediate_actions,
-            ongoing_actions=ongoing_actions,
-            prevention_strategies=prevention,
-            timeline_to_recovery=extract_timeline(diagnosis_text),
-            yield_impact=severity_info.get("yield_impact"),
-            replanting_needed=severity == SeverityLevel.SEVERE,
-            audio_base64=audio_base64,
-            language=request.language,
-            tags=detected_tags
-        )
     
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Diagnosis failed: {str(e)}")
+    return {
+        "severity": severity,
+        "severity_info": severity_info,
+        "farmer_experience": farmer_exp,
+        "candidates": [match.problem.name for match in matches],
+        "system_prompt": system_prompt,
+        "user_context": user_context,
+        "context": {
+            "crop": request.crop_type.value if request.crop_type else None,
+            "experience": farmer_exp.value,
+            "season": request.current_season.value if request.current_season else None,
+            "severity": severity.value
+        }
+    }
+
+
+async def _prompt(run: PipelineRun) -> Dict[str, Any]:
+    inputs = build_advice_inputs(run.inputs["request"], run["vision"])
+    return {
+        **inputs,
+        "question": inputs["user_context"],
+        "language": run.inputs["language"]
+    }
+
+
+async def _fields(run: PipelineRun) -> Dict[str, Any]:
+    # Extract structured information from response
+    # (In production, you'd parse the response to extract fields)
+    diagnosis_text = run["diagnosis"]
+    return {
+        "text": diagnosis_text,
+        "disease_name": extract_field_from_response(diagnosis_text, "DISEASE"),
+        "immediate_actions": extract_actions_from_response(diagnosis_text, "IMMEDIATE"),
+        "ongoing_actions": extract_actions_from_response(diagnosis_text, "ONGOING"),
+        "prevention_strategies": extract_actions_from_response(diagnosis_text, "PREVENTION")
+    }
+
+
+async def _translate(run: PipelineRun) -> Dict[str, Any]:
+    # The diagnosis and every structured field in one Translator round trip
+    fields = run["fields"]
+    disease_name = fields["disease_name"]
+    translated = await translate_fields([
+        [fields["text"]],
+        [disease_name] if disease_name else None,
+        fields["immediate_actions"],
+        fields["ongoing_actions"],
+        fields["prevention_strategies"]
+    ], run.inputs["language"])
+    [text], disease, immediate_actions, ongoing_actions, prevention = translated
+    return {
+        "text": text,
+        "disease_name": disease[0] if disease else None,
+        "immediate_actions": immediate_actions,
+        "ongoing_actions": ongoing_actions,
+        "prevention_strategies": prevention
+    }
+
+
+async def log_run(run: PipelineRun) -> None:
+    """Log to Fabric (runs alongside audio)"""
+    request = run.inputs["request"]
+    await log_diagnosis_event({
+        "crop_type": request.crop_type.value if request.crop_type else "unknown",
+        "severity": run["prompt"]["severity"].value,
+        "detected_tags": run["vision"],
+        "disease_name": run["translation"]["disease_name"],
+        "diagnosis": run["diagnosis"],
+        "farmer_experience": run["prompt"]["farmer_experience"].value
+    })
+
+
+def _translation_event(run: PipelineRun, translated: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "diagnosis": translated["text"],
+        "disease_name": translated["disease_name"],
+        "immediate_actions": translated["immediate_actions"],
+        "ongoing_actions": translated["ongoing_actions"],
+        "prevention_strategies": translated["prevention_strategies"],
+        "language": run.inputs["language"]
+    }
+
+
+# The shared pipeline with the structured prompt, and the structured fields
+# translated along with the diagnosis (English fields if Translator is down)
+PIPELINE = DIAGNOSIS_PIPELINE.with_stages(
+    "enhanced",
+    Stage("prompt", _prompt, after=("vision",), timed=False),
+    Stage("fields", _fields, after=("diagnosis",), timed=False),
+    Stage(
+        "translation", _translate, after=("fields",),
+        fallback=lambda run, error: run["fields"], fallback_on=(CircuitOpenError,),
+        when=lambda run: run.inputs["language"] != "en",
+        otherwise=lambda run: run["fields"],
+        event="translation", event_data=_translation_event
+    ),
+    Stage("log", log_run, after=("vision", "prompt", "diagnosis", "translation"), timed=False)
+)
+
+
+async def run_enhanced(
+    request: EnhancedDiagnoseRequest,
+    inputs: Dict[str, Any],
+    deadline: Deadline,
+    events: Optional[asyncio.Queue] = None
+) -> PipelineRun:
+    """
+    Run the enhanced pipeline for a request.
+    
+    Args:
+        request: The v2 request (question, language, crop, season...)
+        inputs: The image ({"image": bytes}), or tags from an earlier
+            Vision call ({"detected_tags": [...]})
+        events: Queue for the stages' progress events
+    """
+    return await PIPELINE.run({
+        **inputs,
+        "request": request,
+        "question": request.question,
+        "language": request.language,
+        "crop": request.crop_type,
+        "season": request.current_season,
+        "bypass_cache": request.bypass_cache,
+        # Translation covers the structured fields too, so the text is
+        # translated as a whole rather than sentence by sentence
+        "speech_pipeline": False
+    }, deadline, events)
+
+
+def build_response(run: PipelineRun) -> EnhancedDiagnoseResponse:
+    """The /api/v2/diagnose-enhanced response for a finished run"""
+    request = run.inputs["request"]
+    inputs = run["prompt"]
+    severity = inputs["severity"]
+    diagnosis_text = run["diagnosis"]
+    translated = run["translation"]
+    return EnhancedDiagnoseResponse(
+        status="success",
+        diagnosis=translated["text"],
+        diagnosis_original=diagnosis_text,
+        disease_name=translated["disease_name"],
+        severity=severity,
+        affected_plant_parts=extract_plant_parts(diagnosis_text),
+        confidence_score=0.85,  # Placeholder - could be calculated
+        immediate_actions=translated["immediate_actions"],
+        ongoing_actions=translated["ongoing_actions"],
+        prevention_strategies=translated["prevention_strategies"],
+        timeline_to_recovery=extract_timeline(diagnosis_text),
+        yield_impact=inputs["severity_info"].get("yield_impact"),
+        replanting_needed=severity == SeverityLevel.SEVERE,
+        audio_url=run["audio"]["url"],
+        language=request.language,
+        tags=run["vision"],
+        cut_stages=run.cut_stages,
+        fallback_stages=run.fallback_stages
+    )
 
 
 # ============================================================================
 # Helper Functions for Response Parsing
 # ============================================================================
 
+async def translate_fields(fields: List[Optional[List[str]]], language: str) -> List[Optional[List[str]]]:
+    """
+    Translate several lists of strings with a single batched Translator call.
+    
+    Args:
+        fields: Lists of strings (None for fields that were not found)
+        language: Target language code
+    
+    Returns:
+        The same structure with every string translated
+    """
+    flat = [text for field in fields if field for text in field]
+    translated = iter(await speech.translate_texts(flat, language))
+    return [[next(translated) for _ in field] if field else field for field in fields]
+
+
 def extract_field_from_response(response: str, field_name: str) -> Optional[str]:
     """Extract a specific field from the diagnosis response"""
     lines = response.split('\n')
@@ -5,13 +5,21 @@ Handles storage and retrieval of user diagnosis history
 
 from fastapi import APIRouter, HTTPException, Depends, Header, File, UploadFile, Form
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Iterator, Optional, List
+from contextlib import contextmanager
+import fcntl
 import json
+import os
+import tempfile
 from pathlib import Path
 from datetime import datetime
 import uuid
 
-from ..services import vision, gpt4, speech
+from ..config import settings
+from ..services import audio_jobs
+from ..services.deadline import Deadline
+from ..services.diagnosis_pipeline import DIAGNOSIS_PIPELINE, diagnosis_source
+from ..services.pipeline import PipelineRun, Stage
 from ..services.fabric import log_diagnosis_event
 from ..services.data_logger import log_diagnosis
 from ..routers.auth import get_current_user
@@ -22,6 +30,18 @@ router = APIRouter(prefix="/api/history", tags=["history"])
 HISTORY_DIR = Path("./data/history")
 HISTORY_DIR.mkdir(parents=True, exist_ok=True)
 
+# Extensions for photos kept as uploaded (preprocessing off or failed);
+# prepared photos are always JPEG
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tiff",
+    "image/heic": ".heic",
+}
+
 
 class DiagnosisCreate(BaseModel):
     """Diagnosis input model"""
@@ -38,7 +58,11 @@ class DiagnosisRecord(BaseModel):
     detected_tags: List[str]
     diagnosis_text: str
     translated_text: str
-    audio_base64: Optional[str]
+    audio_id: Optional[str] = None
+    audio_url: Optional[str] = None
+    audio_base64: Optional[str] = None  # Records saved before the audio store
+    audio_job_id: Optional[str] = None  # Deferred audio
+    audio_status: Optional[str] = None  # "pending", "done" or "failed"
     timestamp: str
     image_filename: Optional[str]
 
@@ -48,14 +72,69 @@ def get_user_history_file(user_id: str) -> Path:
     return HISTORY_DIR / f"{user_id}.jsonl"
 
 
+@contextmanager
+def history_lock(user_id: str) -> Iterator[None]:
+    """
+    Hold a user's history lock (across processes) while the file is changed
+    
+    A separate lock file is used because rewrites swap the history file out.
+    """
+    lock_file = HISTORY_DIR / f"{user_id}.lock"
+    with open(lock_file, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def save_diagnosis_to_history(user_id: str, diagnosis_record: dict):
     """Save a diagnosis to user's history"""
     history_file = get_user_history_file(user_id)
     
-    with open(history_file, 'a') as f:
+    with history_lock(user_id), open(history_file, 'a') as f:
         f.write(json.dumps(diagnosis_record) + '\n')
 
 
+def update_history_record(user_id: str, diagnosis_id: str, changes: dict) -> bool:
+    """
+    Update fields of one saved diagnosis in place
+    
+    The history file is rewritten to a temporary file and swapped in, so a
+    reader never sees it half-written, under the user's history lock.
+    
+    Returns:
+        True if the record was found
+    """
+    history_file = get_user_history_file(user_id)
+    if not history_file.exists():
+        return False
+    
+    # Locked so an append made while the file is rewritten is not lost
+    with history_lock(user_id):
+        with open(history_file, 'r') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        
+        found = False
+        for record in records:
+            if record.get("id") == diagnosis_id:
+                record.update(changes)
+                found = True
+        if not found:
+            return False
+        
+        fd, temp_name = tempfile.mkstemp(dir=HISTORY_DIR, prefix=f"{user_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+            os.replace(temp_name, history_file)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+    return True
+
+
 def load_user_history(user_id: str, limit: int = 50) -> List[dict]:
     """Load user's diagnosis history"""
     history_file = get_user_history_file(user_id)
@@ -73,91 +152,142 @@ def load_user_history(user_id: str, limit: int = 50) -> List[dict]:
     return list(reversed(records))[-limit:]
 
 
+def image_extension(run: PipelineRun) -> str:
+    """Extension of the photo being kept: .jpg once prepared, else the upload's own"""
+    if run["prepare"] is not run.inputs["image"]:
+        return ".jpg"
+    extension = IMAGE_EXTENSIONS.get(run.inputs.get("content_type") or "")
+    if extension is None:
+        suffix = Path(run.inputs.get("filename") or "").suffix.lower()
+        extension = ".jpg" if suffix == ".jpeg" else suffix if suffix in IMAGE_EXTENSIONS.values() else ".bin"
+    return extension
+
+
+async def store_image(run: PipelineRun) -> str:
+    """Keep the prepared photo (or the upload, if it was not prepared) with the record; returns its filename"""
+    image_filename = f"{run.inputs['user_id']}/{run.inputs['diagnosis_id']}{image_extension(run)}"
+    image_path = Path("./data/images") / image_filename
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(image_path, 'wb') as f:
+        f.write(run["prepare"])
+    return image_filename
+
+
+async def save_record(run: PipelineRun) -> dict:
+    """Create the history record and append it to the user's history"""
+    audio = run["audio"]
+    if audio.get("job_id"):
+        # The job may have finished before its record existed to be
+        # updated: take its current state (no await from here to the save)
+        job = audio_jobs.local_status(audio["job_id"])
+        if job is not None:
+            audio = audio_jobs.audio_reference(job)
+    diagnosis_record = {
+        "id": run.inputs["diagnosis_id"],
+        "user_id": run.inputs["user_id"],
+        "query": run.inputs["question"],
+        "language": run.inputs["language"],
+        "detected_tags": run["vision"],
+        "diagnosis_text": run["diagnosis"],
+        "translated_text": run["translation"]["text"],
+        "audio_id": audio["id"],
+        "audio_url": audio["url"],
+        "timestamp": datetime.now().isoformat(),
+        "image_filename": run["image"]
+    }
+    if audio.get("job_id"):
+        diagnosis_record["audio_job_id"] = audio["job_id"]
+        diagnosis_record["audio_status"] = audio["status"]
+    save_diagnosis_to_history(run.inputs["user_id"], diagnosis_record)
+    return diagnosis_record
+
+
+async def log_run(run: PipelineRun) -> None:
+    """Log the diagnosis for analytics (runs alongside audio)"""
+    log_data = {
+        "user_id": run.inputs["user_id"],
+        "detected_tags": run["vision"],
+        "query": run.inputs["question"],
+        "diagnosis": run["diagnosis"],
+        "language": run.inputs["language"],
+        "translated_text": run["translation"]["text"]
+    }
+    await log_diagnosis_event(log_data)
+    await log_diagnosis(log_data)
+
+
+PIPELINE = DIAGNOSIS_PIPELINE.with_stages(
+    "history",
+    Stage("image", store_image, after=("prepare",), timed=False),
+    Stage("save", save_record, after=("image", "vision", "diagnosis", "translation", "audio"), timed=False),
+    Stage("log", log_run, after=("vision", "diagnosis", "translation"), timed=False)
+)
+
+
 @router.post("/save")
 async def save_diagnosis(
     file: UploadFile = File(...),
     query: str = Form(...),
     language: str = Form(default="en"),
+    defer_audio: Optional[bool] = Form(default=None),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Save a diagnosis to user's history
     
     Orchestrates: Image Upload -> Analysis -> Diagnosis -> Translation -> Audio -> Save to History
+    (the shared diagnosis pipeline, plus stages that keep the photo and
+    save the record)
+    
+    With defer_audio (default: AUDIO_DEFERRED) the record is saved without
+    waiting for the audio; audio_status is "pending" and the record is
+    updated in place with the audio id and URL once the audio job finishes.
     """
     try:
+        deadline = Deadline()
         user_id = current_user["user_id"]
         diagnosis_id = str(uuid.uuid4())
+        if defer_audio is None:
+            defer_audio = settings.AUDIO_DEFERRED
         
         # Step 1: Read image file
         image_bytes = await file.read()
         if not image_bytes:
             raise HTTPException(status_code=400, detail="No image provided")
         
-        # Save image file
-        image_filename = f"{user_id}/{diagnosis_id}.jpg"
-        image_path = Path("./data/images") / image_filename
-        image_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(image_path, 'wb') as f:
-            f.write(image_bytes)
-        
-        # Step 2: Analyze image
-        detected_tags = await vision.analyze_image(image_bytes)
-        
-        # Step 3: Get diagnosis
-        diagnosis_text = await gpt4.get_agronomist_advice(detected_tags, query, language)
-        
-        # Step 4: Translate if needed
-        if language != "en":
-            translated_text = await speech.translate_text(diagnosis_text, language)
-        else:
-            translated_text = diagnosis_text
-        
-        # Step 5: Generate audio
-        audio_base64 = await speech.generate_audio(translated_text, language)
-        
-        # Step 6: Create diagnosis record
-        diagnosis_record = {
-            "id": diagnosis_id,
-            "user_id": user_id,
-            "query": query,
+        # Steps 2-8: Image prep (the prepared copy is the one kept, so no
+        # full-size photo is stored), vision, diagnosis, translation, audio
+        # or an audio job that fills in the saved record, save and logging
+        run = await PIPELINE.run({
+            "image": image_bytes,
+            "question": query,
             "language": language,
-            "detected_tags": detected_tags,
-            "diagnosis_text": diagnosis_text,
-            "translated_text": translated_text,
-            "audio_base64": audio_base64,
-            "timestamp": datetime.now().isoformat(),
-            "image_filename": image_filename
-        }
-        
-        # Step 7: Save to history
-        save_diagnosis_to_history(user_id, diagnosis_record)
-        
-        # Step 8: Log for analytics
-        log_data = {
+            "defer_audio": defer_audio,
+            "on_audio_done": lambda job: update_history_record(user_id, diagnosis_id, {
+                "audio_id": job["audio_id"],
+                "audio_url": job["url"],
+                "audio_status": job["status"]
+            }),
             "user_id": user_id,
-            "detected_tags": detected_tags,
-            "query": query,
-            "diagnosis": diagnosis_text,
-            "language": language,
-            "translated_text": translated_text
-        }
-        await log_diagnosis_event(log_data)
-        await log_diagnosis(log_data)
+            "diagnosis_id": diagnosis_id,
+            "filename": file.filename,
+            "content_type": file.content_type
+        }, deadline)
         
         return {
             "status": "success",
             "data": {
                 "id": diagnosis_id,
-                "detected_tags": detected_tags,
+                "detected_tags": run["vision"],
                 "diagnosis": {
-                    "original_text": diagnosis_text,
-                    "translated_text": translated_text,
-                    "language": language
+                    "original_text": run["diagnosis"],
+                    "translated_text": run["translation"]["text"],
+                    "language": language,
+                    "source": diagnosis_source(run)
                 },
-                "audio": {
-                    "base64": audio_base64
-                }
+                "audio": run["audio"],
+                "cut_stages": run.cut_stages,
+                "fallback_stages": run.fallback_stages
             }
         }
         
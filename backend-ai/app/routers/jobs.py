@@ -0,0 +1,118 @@
+"""
+Jobs Router
+Asynchronous diagnosis for slow connections: submit a photo, get a job id
+at once, then poll for progress (or receive a callback) while a worker
+runs the pipeline
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from ..config import settings
+from ..services import image_prep, job_queue, sse
+from ..services.deadline import Deadline
+from ..routers import diagnosis
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+# Stage reached when a pipeline event arrives, with the job's progress then
+STAGE_AFTER_EVENT = {
+    "tags": ("diagnosis", 0.25),
+    "diagnosis": ("translation", 0.5),
+    "translation": ("audio", 0.75),
+    "audio": ("logging", 0.9),
+}
+
+
+async def run_diagnosis_job(params: Dict, image_bytes: bytes, progress: job_queue.Progress) -> Dict:
+    """
+    Job handler: the /api/diagnose pipeline on a stored, prepared image.
+
+    Jobs get their own deadline (JOB_DEADLINE_SECONDS): nobody is holding a
+    connection open, so stages can take longer than a live request allows.
+
+    Returns:
+        The data object /api/diagnose returns
+    """
+    deadline = Deadline(settings.JOB_DEADLINE_SECONDS)
+    progress("vision", 0.0)
+    events = asyncio.Queue()
+    work = asyncio.create_task(diagnosis.run_diagnosis(
+        deadline, image_bytes, params["query"], params["language"], params.get("bypass_cache", False),
+        events=events, prepared=True
+    ))
+    async for event, _ in sse.relay(work, events):
+        if event in STAGE_AFTER_EVENT:
+            progress(*STAGE_AFTER_EVENT[event])
+    return work.result()
+
+
+job_queue.register("diagnose", run_diagnosis_job)
+
+
+@router.post("/diagnose", status_code=202)
+async def submit_diagnosis(
+    file: UploadFile = File(...),
+    query: str = Form(...),
+    language: str = Form(default="en"),
+    bypass_cache: bool = Form(default=False),
+    callback_url: Optional[str] = Form(default=None)
+):
+    """
+    Queue a diagnosis and return its job id at once
+
+    Request: the /api/diagnose form fields, plus
+        - callback_url: Optional http(s) URL that is POSTed the finished job
+          (host must be in JOB_CALLBACK_ALLOWED_HOSTS; callbacks are off without it)
+
+    Response (202):
+        {
+            "status": "success",
+            "data": {"job_id": "...", "job_url": "/api/jobs/...", "status": "queued", ...}
+        }
+
+    Jobs are kept in SQLite, so a job survives a worker restart: another
+    worker picks it up once its lease (JOB_LEASE_SECONDS) runs out. Failed
+    attempts are retried up to JOB_MAX_ATTEMPTS times.
+    """
+    image_bytes = await file.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="No image provided")
+
+    # Stored prepared: smaller, and the worker does not need to redo it
+    image_bytes = await image_prep.prepare_image(image_bytes)
+    try:
+        job = job_queue.submit(
+            "diagnose",
+            {"query": query, "language": language, "bypass_cache": bypass_cache},
+            image_bytes,
+            callback_url
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "status": "success",
+        "data": job
+    }
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Progress of a job
+
+    status is "queued", "running" (stage and progress 0-1 show how far it
+    has got), "done" (result is the /api/diagnose data object) or "failed"
+    (error says why). callback_status reports the callback delivery.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "status": "success",
+        "data": job
+    }
@@ -0,0 +1,171 @@
+"""
+Service Metrics Router
+Operational view of the Azure dependency layer (breakers, bulkheads, throttles, caches, pools)
+"""
+
+from fastapi import APIRouter
+
+from app.services import audio_jobs, http_client, image_prep, job_queue, knowledge_base, vision
+from app.services.adaptive_limit import limiter_states
+from app.services.bulkhead import bulkhead_states
+from app.services.cache import cache_stats
+from app.services.circuit_breaker import breaker_states
+from app.services.micro_batcher import batcher_stats
+from app.services.pipeline import pipeline_stats
+from app.services.single_flight import single_flight_stats
+from app.services.throttle import throttle_stats
+from app.services.translation_memory import translation_memory
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/breakers")
+async def get_breakers():
+    """
+    Circuit breaker state per Azure dependency
+    
+    Returns:
+        - state: closed, open or half_open
+        - failure_rate / slow_call_rate: over the rolling window
+        - rejected_calls: calls refused while open
+        - retry_after_seconds: time until the next probe when open
+    """
+    return {
+        "status": "success",
+        "data": breaker_states()
+    }
+
+
+@router.get("/bulkheads")
+async def get_bulkheads():
+    """
+    Concurrency limit and wait queue per Azure dependency
+    
+    Returns:
+        - active / max_concurrent: calls in flight and the per-worker limit
+        - queue_length / peak_queue: calls waiting for a slot
+        - avg_wait_ms / max_wait_ms: time spent queued
+        - rejected_queue_full / rejected_wait_timeout: calls turned away
+    """
+    return {
+        "status": "success",
+        "data": bulkhead_states()
+    }
+
+
+@router.get("/concurrency")
+async def get_concurrency():
+    """
+    Adaptive (AIMD) concurrency limit per Azure dependency
+    
+    Returns:
+        - limit: concurrent calls currently allowed (between min_limit and max_limit)
+        - latency_ewma_ms / target_latency_ms: recent latency against the target
+        - increases / decreases: limit changes, with the last decrease reason
+    """
+    return {
+        "status": "success",
+        "data": limiter_states()
+    }
+
+
+@router.get("/throttles")
+async def get_throttles():
+    """
+    Client-side quota throttle per Azure deployment
+    
+    Returns:
+        - requests_available / tokens_available: quota left in the buckets
+        - delayed_calls / avg_wait_ms: calls held back to stay under quota
+        - rate_limited_responses / retries: 429s received and retried
+        - blocked_for_seconds: Retry-After back-off still in effect
+    """
+    return {
+        "status": "success",
+        "data": throttle_stats()
+    }
+
+
+@router.get("/cache")
+async def get_caches():
+    """Hit/miss counters per result cache, plus near-duplicate image matching"""
+    return {
+        "status": "success",
+        "data": {
+            **cache_stats(),
+            "translation_memory": translation_memory.stats(),
+            "vision_near_duplicates": vision.near_duplicate_stats()
+        }
+    }
+
+
+@router.get("/batching")
+async def get_batchers():
+    """Micro-batcher batch counts, flush reasons and batch-size histograms"""
+    return {
+        "status": "success",
+        "data": batcher_stats()
+    }
+
+
+@router.get("/single-flight")
+async def get_single_flight():
+    """Identical in-flight calls that were coalesced into one upstream request"""
+    return {
+        "status": "success",
+        "data": single_flight_stats()
+    }
+
+
+@router.get("/images")
+async def get_image_prep():
+    """Upload preprocessing: images processed, bytes before/after and time per image"""
+    return {
+        "status": "success",
+        "data": image_prep.prep_stats()
+    }
+
+
+@router.get("/knowledge")
+async def get_knowledge_index():
+    """Crop knowledge index: size and time per candidate ranking"""
+    return {
+        "status": "success",
+        "data": knowledge_base.index_stats()
+    }
+
+
+@router.get("/audio-jobs")
+async def get_audio_jobs():
+    """Deferred audio jobs: counts and average time to audio"""
+    return {
+        "status": "success",
+        "data": audio_jobs.job_stats()
+    }
+
+
+@router.get("/jobs")
+async def get_job_queue():
+    """Diagnosis job queue: jobs per status, outcomes and average times"""
+    return {
+        "status": "success",
+        "data": job_queue.queue_stats()
+    }
+
+
+@router.get("/pipeline")
+async def get_pipeline():
+    """Diagnosis pipeline stages: runs, skips, retries, fallbacks, failures and average time"""
+    return {
+        "status": "success",
+        "data": pipeline_stats()
+    }
+
+
+@router.get("/http")
+async def get_http_pools():
+    """Outbound connection pool usage"""
+    return {
+        "status": "success",
+        "data": http_client.pool_stats()
+    }
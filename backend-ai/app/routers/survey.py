@@ -0,0 +1,204 @@
+"""
+Field Survey Router
+Batch diagnosis for extension officers: many photos of one field in a
+single request, with photos showing the same problem answered by one
+GPT-4 call and results streamed per photo as they complete
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from ..config import settings
+from ..models import CropType, EnhancedDiagnoseRequest, FarmerExperience, Season
+from ..services import image_prep, knowledge_base, sse, vision
+from ..services.deadline import Deadline
+from ..services.diagnosis_pipeline import diagnosis_source
+from ..routers.enhanced import build_response, run_enhanced
+
+router = APIRouter(prefix="/api/survey", tags=["survey"])
+
+# Symptom words a photo's best candidate must match (unless a word of the
+# problem's own name matches) for the photo to join that problem's group
+GROUP_MIN_MATCHED = 2
+
+
+@router.post("/diagnose")
+async def diagnose_survey(
+    files: List[UploadFile] = File(...),
+    query: str = Form(default="What is wrong with this crop?"),
+    language: str = Form(default="en"),
+    crop_type: Optional[CropType] = Form(default=None),
+    season: Optional[Season] = Form(default=None),
+    farmer_experience: FarmerExperience = Form(default=FarmerExperience.INTERMEDIATE)
+):
+    """
+    Diagnose a field survey (Server-Sent Events)
+    
+    Request (multipart form):
+        - files: The survey photos (up to SURVEY_MAX_IMAGES)
+        - query, language, crop_type, season, farmer_experience: Shared by
+          every photo
+    
+    Photos go through Vision SURVEY_VISION_CONCURRENCY at a time. Each is
+    grouped by its best-matching disease or pest from the knowledge index
+    (or by its exact tags when nothing matches well), and each group gets
+    one structured diagnosis (/api/v2 prompt, translation and audio).
+    
+    Events:
+        - image: {"index", "filename", "detected_tags", "group"} once Vision is done
+        - group: {"group", "problem", "source", "diagnosis"} once per group;
+          diagnosis is the /api/v2/diagnose-enhanced response
+        - result: {"index", "filename", "group", "problem"} once the photo's
+          group diagnosis is ready
+        - image_error: {"index", "filename", "error"} for a photo that failed
+        - done: {"images", "failed", "gpt_calls", "groups": [{"group", "problem", "images"}]}
+        - error: {"error": "..."}
+    """
+    if len(files) > settings.SURVEY_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.SURVEY_MAX_IMAGES} images per survey")
+    images = [(file.filename, await file.read()) for file in files]
+    if not any(image_bytes for _, image_bytes in images):
+        raise HTTPException(status_code=400, detail="No image provided")
+    
+    request = EnhancedDiagnoseRequest(
+        image_base64="",
+        question=query,
+        language=language,
+        crop_type=crop_type,
+        current_season=season,
+        farmer_experience=farmer_experience
+    )
+    return StreamingResponse(
+        _survey_events(request, images),
+        media_type="text/event-stream",
+        headers=sse.SSE_HEADERS
+    )
+
+
+async def _survey_events(request: EnhancedDiagnoseRequest, images: List[Tuple[str, bytes]]):
+    """Run the survey, yielding SSE events as photos and groups finish"""
+    try:
+        events = asyncio.Queue()
+        work = asyncio.create_task(run_survey(request, images, events))
+        async for event, data in sse.relay(work, events):
+            yield sse.format_event(event, data)
+        yield sse.format_event("done", work.result())
+    
+    except Exception as e:
+        yield sse.format_event("error", {"error": str(e)})
+
+
+def group_for(
+    detected_tags: List[str],
+    crop_type: Optional[CropType] = None,
+    season: Optional[Season] = None
+) -> Tuple[str, Optional[str]]:
+    """
+    Group key and problem name for a photo's tags.
+    
+    Ranked on the tags alone: the shared question would pull every photo
+    towards the same problem.
+    
+    Returns:
+        ("crop:problem", problem name) for a convincing best match, else
+        ("tags:...", None) so only photos with identical tags share a group
+    """
+    matches = knowledge_base.rank(detected_tags, crop=crop_type, season=season, limit=1)
+    if matches and (matches[0].names_problem or len(matches[0].matched) >= GROUP_MIN_MATCHED):
+        problem = matches[0].problem
+        return f"{problem.crop.value}:{problem.name}", problem.name
+    return "tags:" + ",".join(sorted(set(tag.lower() for tag in detected_tags))), None
+
+
+async def run_survey(
+    request: EnhancedDiagnoseRequest,
+    images: List[Tuple[str, bytes]],
+    events: asyncio.Queue
+) -> Dict:
+    """
+    Diagnose every photo, one GPT-4 call per group of similar photos.
+    
+    A group's diagnosis starts as soon as its first photo is analyzed;
+    later photos of the same group wait for it instead of asking again.
+    
+    Args:
+        request: Shared question, language, crop, season and experience
+        images: (filename, bytes) per photo
+        events: Queue the progress events are put on
+    
+    Returns:
+        The summary sent as the "done" event
+    """
+    vision_slots = asyncio.Semaphore(settings.SURVEY_VISION_CONCURRENCY)
+    groups: Dict[str, Dict] = {}
+    failed: List[int] = []
+    
+    async def advise(group_id: str, problem: Optional[str], detected_tags: List[str]) -> None:
+        # Vision has run already; the whole budget goes to the later stages
+        run = await run_enhanced(request, {"detected_tags": detected_tags}, Deadline())
+        events.put_nowait(("group", {
+            "group": group_id,
+            "problem": problem,
+            "source": diagnosis_source(run),
+            "diagnosis": build_response(run).model_dump(mode="json")
+        }))
+    
+    async def survey_one(index: int, filename: str, image_bytes: bytes) -> None:
+        try:
+            if not image_bytes:
+                raise ValueError("Empty image")
+            async with vision_slots:
+                # Upright, metadata-free and downscaled before upload (worker process)
+                image_bytes = await image_prep.prepare_image(image_bytes)
+                detected_tags = await vision.analyze_image(image_bytes)
+    
+            key, problem = group_for(detected_tags, request.crop_type, request.current_season)
+            group = groups.get(key)
+            if group is None:
+                group_id = f"g{len(groups) + 1}"
+                group = groups[key] = {
+                    "group": group_id,
+                    "problem": problem,
+                    "images": [],
+                    "task": asyncio.create_task(advise(group_id, problem, detected_tags))
+                }
+            group["images"].append(index)
+            events.put_nowait(("image", {
+                "index": index,
+                "filename": filename,
+                "detected_tags": detected_tags,
+                "group": group["group"]
+            }))
+    
+            await group["task"]
+            events.put_nowait(("result", {
+                "index": index,
+                "filename": filename,
+                "group": group["group"],
+                "problem": group["problem"]
+            }))
+        except Exception as e:
+            failed.append(index)
+            events.put_nowait(("image_error", {"index": index, "filename": filename, "error": str(e)}))
+    
+    try:
+        await asyncio.gather(*(
+            survey_one(index, filename, image_bytes)
+            for index, (filename, image_bytes) in enumerate(images)
+        ))
+    finally:
+        for group in groups.values():
+            group["task"].cancel()
+    
+    return {
+        "images": len(images),
+        "failed": sorted(failed),
+        "gpt_calls": len(groups),
+        "groups": [
+            {"group": group["group"], "problem": group["problem"], "images": sorted(group["images"])}
+            for group in groups.values()
+        ]
+    }
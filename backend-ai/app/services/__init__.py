@@ -4,5 +4,14 @@ from . import vision
 from . import gpt4
 from . import speech
 from . import fabric
+from . import http_client
+from . import audio_store
+from . import audio_jobs
+from . import image_prep
+from . import knowledge_base
+from . import offline_diagnosis
+from . import job_queue
+from . import pipeline
+from . import diagnosis_pipeline
 
-__all__ = ["vision", "gpt4", "speech", "fabric"]
+__all__ = ["vision", "gpt4", "speech", "fabric", "http_client", "audio_store", "audio_jobs", "image_prep", "knowledge_base", "offline_diagnosis", "job_queue", "pipeline", "diagnosis_pipeline"]
@@ -0,0 +1,148 @@
+"""
+Adaptive Concurrency Limits
+AIMD control of each dependency's bulkhead limit: grow it while Azure
+answers within target latency, halve it on 429s, timeouts and latency spikes
+"""
+
+import time
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.bulkhead import Bulkhead, get_bulkhead
+
+# Latency a healthy call should stay under; above TARGET * spike factor the
+# dependency is treated as overloaded
+DEFAULT_TARGET_LATENCY_SECONDS: Dict[str, float] = {
+    "vision": 2.0,
+    "openai": 6.0,
+    "translator": 1.0,
+    "speech": 2.0,
+}
+
+
+class AIMDLimit:
+    """
+    Additive-increase / multiplicative-decrease limit for one bulkhead,
+    in the manner of TCP congestion control.
+
+    Each call within the target latency adds 1/limit, so the limit grows by
+    about one per round of calls. A 429, a timeout or a latency spike
+    multiplies it by `decrease_factor`; further decreases are ignored for
+    one target latency, so the calls that were in flight together only cut
+    the limit once. Calls between target and spike leave it unchanged.
+    """
+
+    def __init__(
+        self,
+        bulkhead: Bulkhead,
+        target_latency_seconds: float,
+        min_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        decrease_factor: Optional[float] = None,
+        spike_factor: Optional[float] = None
+    ):
+        self.bulkhead = bulkhead
+        self.target_latency_seconds = target_latency_seconds
+        self.min_limit = settings.ADAPTIVE_MIN_CONCURRENT if min_limit is None else min_limit
+        self.max_limit = settings.ADAPTIVE_MAX_CONCURRENT if max_limit is None else max_limit
+        self.decrease_factor = settings.ADAPTIVE_DECREASE_FACTOR if decrease_factor is None else decrease_factor
+        self.spike_factor = settings.ADAPTIVE_LATENCY_SPIKE_FACTOR if spike_factor is None else spike_factor
+
+        self.limit = float(min(max(bulkhead.max_concurrent, self.min_limit), self.max_limit))
+        self.bulkhead.set_limit(int(self.limit))
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease_reason: Optional[str] = None
+        self.latency_ewma: Optional[float] = None
+
+    def record(
+        self,
+        latency: float,
+        throttled: bool = False,
+        timed_out: bool = False,
+        cancelled: bool = False
+    ) -> None:
+        """
+        Adjust the limit after a call.
+
+        Args:
+            latency: Seconds until the response headers (or the failure)
+            throttled: The dependency answered 429
+            timed_out: The request timed out
+            cancelled: The caller gave up (deadline); only a spike counts
+        """
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if throttled:
+            self._decrease("throttled")
+        elif timed_out:
+            self._decrease("timeout")
+        elif latency > self.target_latency_seconds * self.spike_factor:
+            self._decrease("latency_spike")
+        elif latency <= self.target_latency_seconds and not cancelled:
+            self._increase()
+
+    def _increase(self) -> None:
+        if self.limit >= self.max_limit:
+            return
+        self.limit = min(self.limit + 1 / self.limit, float(self.max_limit))
+        if int(self.limit) > self.bulkhead.max_concurrent:
+            self.increases += 1
+            self.bulkhead.set_limit(int(self.limit))
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.target_latency_seconds:
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * self.decrease_factor, float(self.min_limit))
+        self.decreases += 1
+        self.last_decrease_reason = reason
+        self.bulkhead.set_limit(int(self.limit))
+        print(f"Adaptive limit '{self.bulkhead.name}': {reason}, limit -> {int(self.limit)}")
+
+    def snapshot(self) -> Dict:
+        """Current limit and counters for the metrics endpoint"""
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.bulkhead.active,
+            "queue_length": self.bulkhead.queue_length,
+            "target_latency_ms": round(self.target_latency_seconds * 1000),
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "last_decrease_reason": self.last_decrease_reason,
+        }
+
+
+limiters: Dict[str, AIMDLimit] = {}
+
+
+def get_limiter(dependency: str) -> Optional[AIMDLimit]:
+    """
+    Get the adaptive limit of a dependency's bulkhead, creating it on first use.
+
+    Returns:
+        None when adaptive concurrency is disabled (bulkhead limits stay static)
+    """
+    if not settings.ADAPTIVE_CONCURRENCY_ENABLED:
+        return None
+    limiter = limiters.get(dependency)
+    if limiter is None:
+        limiter = AIMDLimit(
+            get_bulkhead(dependency),
+            target_latency_seconds=DEFAULT_TARGET_LATENCY_SECONDS.get(dependency, 5.0),
+        )
+        limiters[dependency] = limiter
+    return limiter
+
+
+def limiter_states() -> Dict[str, Dict]:
+    """Snapshot of every adaptive limit (empty when disabled)"""
+    if not settings.ADAPTIVE_CONCURRENCY_ENABLED:
+        return {}
+    for dependency in DEFAULT_TARGET_LATENCY_SECONDS:
+        get_limiter(dependency)
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
@@ -0,0 +1,368 @@
+"""
+Deferred Audio Jobs
+Takes TTS off the request's critical path: the text answer is returned with
+an audio job id while the audio is synthesized in the background, and
+clients long-poll GET /api/audio/jobs/{id} for the result
+"""
+
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.services import audio_store, speech
+from app.services.cache import SQLiteStore, TTLCache, cache_file
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# Job state shared by all workers, so any worker can answer a poll
+_store = SQLiteStore(cache_file("audio_jobs.sqlite3"), "audio_jobs")
+
+# Jobs running in this worker: their tasks, completion events and callbacks
+_tasks: Dict[str, asyncio.Task] = {}
+_finished: Dict[str, asyncio.Event] = {}
+_callbacks: Dict[str, List[Callable[[Dict], None]]] = {}
+
+# Latest record of every job this worker started, so it can answer for
+# them without reading the store
+LOCAL_JOBS_MAX = 1024
+_local = TTLCache(LOCAL_JOBS_MAX, settings.AUDIO_JOB_TTL_SECONDS)
+
+# How often a poll re-reads a job that runs in another worker
+POLL_INTERVAL_SECONDS = 0.25
+
+# A running job always records its outcome within AUDIO_JOB_TIMEOUT_SECONDS;
+# one still pending this long after that was left by a worker that died
+STALE_GRACE_SECONDS = 5.0
+
+_stats = {
+    "submitted": 0,
+    "reused": 0,
+    "coalesced": 0,
+    "taken_over": 0,
+    "done": 0,
+    "failed": 0,
+    "total_seconds": 0.0,
+}
+
+
+def job_url(job_id: str) -> str:
+    """Relative URL clients poll for a job"""
+    return f"/api/audio/jobs/{job_id}"
+
+
+def _record(job_id: str, status: str, error: Optional[str] = None, created_at: Optional[float] = None,
+            started_at: Optional[float] = None) -> Dict:
+    done = status == DONE
+    return {
+        "job_id": job_id,
+        "status": status,
+        "audio_id": job_id if done else None,
+        "url": audio_store.audio_url(job_id) if done else None,
+        "error": error,
+        "created_at": created_at or time.time(),
+        "started_at": started_at or time.time(),
+        "finished_at": time.time() if status != PENDING else None,
+    }
+
+
+def _input_key(job_id: str) -> str:
+    """Store key of a job's text and language (kept so another worker can take it over)"""
+    return f"input:{job_id}"
+
+
+async def submit(
+    text: str,
+    language: str,
+    work: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+    on_done: Optional[Callable[[Dict], None]] = None,
+    cleanup: Optional[Callable[[], None]] = None
+) -> Dict:
+    """
+    Start synthesizing text in the background.
+
+    The job id is the audio id of the text (a content hash), so the same
+    answer requested twice shares one job, and audio already on disk is
+    reported as done straight away.
+
+    Args:
+        text: Text to voice
+        language: Language code (picks the voice)
+        work: Coroutine function that stores the audio of `text` (e.g. a
+            speech pipeline's audio); defaults to speech.synthesize_audio
+        on_done: Called with the finished job (done or failed)
+        cleanup: Called once `work` is finished with or not needed (e.g. to
+            cancel the speech pipeline's leftover sentence tasks)
+
+    Returns:
+        The job record (status "pending" unless the audio already exists)
+    """
+    job_id = audio_store.audio_id(text, speech.voice_for(language))
+    if audio_store.exists(job_id):
+        _stats["reused"] += 1
+        _release(cleanup)
+        job = _record(job_id, DONE)
+        if on_done is not None:
+            _notify(job, [on_done])
+        return job
+
+    if on_done is not None:
+        _callbacks.setdefault(job_id, []).append(on_done)
+    if job_id in _finished:
+        _stats["coalesced"] += 1
+        _release(cleanup)
+        return _local.get(job_id) or _record(job_id, PENDING)
+
+    _stats["submitted"] += 1
+    return await _start(
+        _record(job_id, PENDING),
+        work or (lambda: speech.synthesize_audio(text, language)),
+        cleanup,
+        inputs={"text": text, "language": language}
+    )
+
+
+async def _start(
+    job: Dict,
+    work: Callable[[], Awaitable[Optional[str]]],
+    cleanup: Optional[Callable[[], None]] = None,
+    inputs: Optional[Dict] = None
+) -> Dict:
+    job_id = job["job_id"]
+    # Registered before the first await, so the same job is not started twice
+    _local.set(job_id, job)
+    _finished[job_id] = asyncio.Event()
+    try:
+        # Stored before the work starts: polls answered by other workers find
+        # the job, and the outcome saved at the end cannot be overwritten
+        if inputs is not None:
+            await _save_input(job_id, inputs)
+        await _save(job)
+    except BaseException:
+        _local.delete(job_id)
+        _finished.pop(job_id).set()
+        _callbacks.pop(job_id, None)
+        _release(cleanup)
+        raise
+    # A fresh context: the job must not inherit the request's stage deadline
+    task = asyncio.get_running_loop().create_task(_run(job, work, cleanup), context=contextvars.Context())
+    _tasks[job_id] = task
+    return job
+
+
+def _stale(job: Dict) -> bool:
+    """Whether a pending job was left behind by a worker that stopped"""
+    started_at = job.get("started_at") or job["created_at"]
+    return (
+        job["status"] == PENDING
+        and job["job_id"] not in _finished
+        and time.time() - started_at > settings.AUDIO_JOB_TIMEOUT_SECONDS + STALE_GRACE_SECONDS
+    )
+
+
+async def _take_over(job: Dict) -> Dict:
+    """
+    Restart a stale job in this worker from its stored text (the job is
+    failed instead if its text is gone).
+    """
+    job_id = job["job_id"]
+    try:
+        inputs = await _store.get(_input_key(job_id))
+    except Exception as e:
+        print(f"Audio job store read failed: {str(e)}")
+        inputs = None
+    if job_id in _finished:
+        # Another poll took it over while the text was read
+        return _local.get(job_id) or job
+    if inputs is None:
+        failed = _record(job_id, FAILED, "Abandoned by a stopped worker", created_at=job["created_at"])
+        _local.set(job_id, failed)
+        await _save(failed)
+        return failed
+
+    print(f"Audio job {job_id[:12]} taken over after its worker stopped")
+    _stats["taken_over"] += 1
+    text, language = inputs["text"], inputs["language"]
+    return await _start(
+        _record(job_id, PENDING, created_at=job["created_at"]),
+        lambda: speech.synthesize_audio(text, language)
+    )
+
+
+async def _run(
+    job: Dict,
+    work: Callable[[], Awaitable[Optional[str]]],
+    cleanup: Optional[Callable[[], None]] = None
+) -> None:
+    job_id = job["job_id"]
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(work(), settings.AUDIO_JOB_TIMEOUT_SECONDS)
+        if not audio_store.exists(job_id):
+            raise RuntimeError("No audio was produced for the text")
+        result = _record(job_id, DONE, created_at=job["created_at"], started_at=job["started_at"])
+        _stats["done"] += 1
+    except asyncio.CancelledError:
+        result = _record(job_id, FAILED, "Cancelled", created_at=job["created_at"], started_at=job["started_at"])
+        _stats["failed"] += 1
+        raise
+    except Exception as e:
+        print(f"Audio job {job_id[:12]} failed: {str(e)}")
+        result = _record(
+            job_id, FAILED, str(e) or type(e).__name__, created_at=job["created_at"], started_at=job["started_at"]
+        )
+        _stats["failed"] += 1
+    finally:
+        _stats["total_seconds"] += time.monotonic() - started
+        _release(cleanup)
+        _local.set(job_id, result)
+        try:
+            await _save(result)
+        finally:
+            _tasks.pop(job_id, None)
+            _finished.pop(job_id).set()
+            _notify(result, _callbacks.pop(job_id, []))
+
+
+def _release(cleanup: Optional[Callable[[], None]]) -> None:
+    if cleanup is None:
+        return
+    try:
+        cleanup()
+    except Exception as e:
+        print(f"Audio job cleanup failed: {str(e)}")
+
+
+def _notify(job: Dict, callbacks: List[Callable[[Dict], None]]) -> None:
+    for callback in callbacks:
+        try:
+            callback(job)
+        except Exception as e:
+            print(f"Audio job callback failed: {str(e)}")
+
+
+async def _save(job: Dict) -> None:
+    try:
+        await _store.set(job["job_id"], job, settings.AUDIO_JOB_TTL_SECONDS)
+    except Exception as e:
+        print(f"Audio job store write failed: {str(e)}")
+
+
+async def _save_input(job_id: str, inputs: Dict) -> None:
+    try:
+        await _store.set(_input_key(job_id), inputs, settings.AUDIO_JOB_TTL_SECONDS)
+    except Exception as e:
+        print(f"Audio job store write failed: {str(e)}")
+
+
+def _with_audio(job_id: str, job: Optional[Dict]) -> Optional[Dict]:
+    if (job is None or job["status"] != DONE) and audio_store.exists(job_id):
+        # Content-addressed: the audio is there whoever produced it
+        return _record(job_id, DONE, created_at=job["created_at"] if job else None)
+    return job
+
+
+def local_status(job_id: str) -> Optional[Dict]:
+    """
+    State of a job this worker started, without reading the store (and so
+    without giving the job a chance to finish in between).
+
+    Returns:
+        The job record, or None if the job is not this worker's
+    """
+    job = _local.get(job_id)
+    return _with_audio(job_id, job) if job is not None else None
+
+
+async def status(job_id: str) -> Optional[Dict]:
+    """
+    Current state of a job, from any worker.
+
+    A job left pending by a worker that stopped is taken over (restarted
+    here) once it is older than AUDIO_JOB_TIMEOUT_SECONDS.
+
+    Returns:
+        The job record, or None for an unknown id
+    """
+    if not audio_store.is_valid_id(job_id):
+        return None
+    job = _local.get(job_id)
+    if job is None:
+        try:
+            job = await _store.get(job_id)
+        except Exception as e:
+            print(f"Audio job store read failed: {str(e)}")
+    job = _with_audio(job_id, job)
+    if job is not None and _stale(job):
+        return await _take_over(job)
+    return job
+
+
+async def wait(job_id: str, timeout: float) -> Optional[Dict]:
+    """
+    Long-poll: wait up to `timeout` seconds while a job is pending.
+
+    Jobs running in this worker wake the waiter as soon as they finish;
+    jobs of other workers are re-read every POLL_INTERVAL_SECONDS.
+
+    Returns:
+        The job record (possibly still pending), or None for an unknown id
+    """
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + timeout
+    while True:
+        job = await status(job_id)
+        remaining = give_up_at - loop.time()
+        if job is None or job["status"] != PENDING or remaining <= 0:
+            return job
+        finished = _finished.get(job_id)
+        try:
+            if finished is not None:
+                await asyncio.wait_for(finished.wait(), remaining)
+            else:
+                await asyncio.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+        except asyncio.TimeoutError:
+            pass
+
+
+def etag(job: Dict) -> str:
+    """Validator that changes whenever the job's status does"""
+    return f'"{job["job_id"]}-{job["status"]}"'
+
+
+def audio_reference(job: Dict) -> Dict:
+    """The "audio" object of a deferred diagnosis response"""
+    return {
+        "id": job["audio_id"],
+        "url": job["url"],
+        "job_id": job["job_id"],
+        "job_url": job_url(job["job_id"]),
+        "status": job["status"],
+    }
+
+
+async def shutdown() -> None:
+    """Cancel jobs still running (called from app lifespan); they are marked failed"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def job_stats() -> Dict:
+    """Job counters for the metrics endpoint"""
+    finished = _stats["done"] + _stats["failed"]
+    return {
+        "submitted": _stats["submitted"],
+        "reused": _stats["reused"],
+        "coalesced": _stats["coalesced"],
+        "taken_over": _stats["taken_over"],
+        "running": len(_tasks),
+        "done": _stats["done"],
+        "failed": _stats["failed"],
+        "avg_seconds": round(_stats["total_seconds"] / finished, 3) if finished else 0.0,
+        "deferred_by_default": settings.AUDIO_DEFERRED,
+    }
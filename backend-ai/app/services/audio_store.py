@@ -0,0 +1,133 @@
+"""
+TTS Audio Store
+Synthesized MP3 files on disk, content-addressed by hash(text, voice, format)
+and served by reference from /api/audio/{audio_id}
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+# MP3 output requested from Azure TTS
+OUTPUT_FORMAT = "audio-16khz-32kbitrate-mono-mp3"
+
+_AUDIO_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def audio_id(text: str, voice: str, output_format: str = OUTPUT_FORMAT) -> str:
+    """Content address of a synthesis request"""
+    payload = "\x00".join((voice, output_format, text))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_valid_id(value: str) -> bool:
+    """Only lowercase SHA-256 hex ids map to files (no path tricks)"""
+    return bool(_AUDIO_ID.match(value))
+
+
+def audio_dir() -> Path:
+    return Path(settings.AUDIO_DIR)
+
+
+def path_for(audio_id_: str) -> Path:
+    """File path for an audio id, fanned out by its first two hex digits"""
+    if not is_valid_id(audio_id_):
+        raise ValueError(f"Invalid audio id: {audio_id_}")
+    return audio_dir() / audio_id_[:2] / f"{audio_id_}.mp3"
+
+
+def exists(audio_id_: str) -> bool:
+    return is_valid_id(audio_id_) and path_for(audio_id_).exists()
+
+
+def audio_url(audio_id_: str) -> str:
+    """Relative URL clients use to fetch the audio"""
+    return f"/api/audio/{audio_id_}"
+
+
+def _strip_id3(data: bytes, keep_header: bool) -> bytes:
+    """Drop ID3 tags so MP3 frames from several files can be joined"""
+    if not keep_header and data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2: 10-byte header, then a 28-bit "synchsafe" size
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]  # ID3v1 trailer
+    return data
+
+
+def concat_mp3(segments: List[bytes]) -> bytes:
+    """
+    Join MP3 files into one stream, in order.
+
+    MP3 is a sequence of self-contained frames, so constant-bitrate files in
+    the same format play back-to-back once their tags are removed; only the
+    first file's leading ID3v2 tag is kept.
+    """
+    return b"".join(_strip_id3(segment, keep_header=i == 0) for i, segment in enumerate(segments))
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write via a temp file + rename so readers never see a partial MP3"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class AudioWriter:
+    """
+    Incremental writer for audio that is being streamed to a client.
+
+    Chunks go to a temp file next to the final path; commit() renames it
+    into place, discard() (or an unfinished stream) leaves nothing behind.
+    """
+
+    def __init__(self, audio_id_: str):
+        self.path = path_for(audio_id_)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self.committed = False
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        self.committed = True
+
+    def discard(self) -> None:
+        if self.committed:
+            return
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+async def save(audio_id_: str, data: bytes) -> None:
+    """Store audio bytes under their id (off the event loop)"""
+    await asyncio.to_thread(_write_atomic, path_for(audio_id_), data)
+
+
+async def read(audio_id_: str) -> Optional[bytes]:
+    """Audio bytes for an id, or None if not stored"""
+    path = path_for(audio_id_)
+    try:
+        return await asyncio.to_thread(path.read_bytes)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,198 @@
+"""
+Bulkheads for Azure Dependencies
+Caps how many calls each worker has in flight per Azure service, with a
+bounded wait queue, so a burst queues briefly instead of triggering 429s
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitOpenError
+
+
+class BulkheadFullError(CircuitOpenError):
+    """
+    Raised when a dependency's wait queue is full or the wait timed out.
+
+    Subclasses CircuitOpenError so routers fall back exactly as they do for
+    an open breaker: the dependency is unavailable to this request right now.
+    """
+
+    def __init__(self, dependency: str, reason: str):
+        Exception.__init__(self, f"{dependency} is busy ({reason})")
+        self.dependency = dependency
+        self.retry_after = 0
+        self.reason = reason
+
+
+def _default(value, fallback):
+    """Use the configured setting when no explicit value is given"""
+    return fallback if value is None else value
+
+
+class Bulkhead:
+    """
+    Async semaphore with a bounded FIFO wait queue.
+
+    At most `max_concurrent` calls run at once; up to `max_queue` more wait
+    (each for at most `max_wait_seconds`) and anything beyond that is
+    rejected immediately.
+
+    Usage:
+        bulkhead = get_bulkhead("openai")
+        await bulkhead.acquire()
+        try:
+            ...
+        finally:
+            bulkhead.release()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: Optional[int] = None,
+        max_wait_seconds: Optional[float] = None
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = _default(max_queue, settings.BULKHEAD_MAX_QUEUE)
+        self.max_wait_seconds = _default(max_wait_seconds, settings.BULKHEAD_MAX_WAIT_SECONDS)
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued_calls = 0
+        self.rejected_queue_full = 0
+        self.rejected_wait_timeout = 0
+        self.peak_queue = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_observed = 0.0
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """
+        Take a slot, waiting in the queue if all slots are in use.
+
+        Raises:
+            BulkheadFullError: The queue is full, or no slot freed up in time
+        """
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise BulkheadFullError(self.name, "wait queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_calls += 1
+        self.peak_queue = max(self.peak_queue, len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.rejected_wait_timeout += 1
+            self._record_wait(time.monotonic() - started)
+            raise BulkheadFullError(self.name, f"no slot within {self.max_wait_seconds:g}s")
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        # release() handed its slot straight to this waiter
+        self.admitted += 1
+        self._record_wait(time.monotonic() - started)
+
+    def release(self) -> None:
+        """Give a slot back, handing it to the longest waiter if there is one"""
+        if self.active <= self.max_concurrent and self._hand_over():
+            return
+        self.active = max(self.active - 1, 0)
+
+    def set_limit(self, max_concurrent: int) -> None:
+        """
+        Change the concurrency limit.
+
+        A higher limit admits waiters straight away; with a lower one,
+        calls already running finish and their slots are not handed on.
+        """
+        self.max_concurrent = max(max_concurrent, 1)
+        while self.active < self.max_concurrent and self._hand_over():
+            self.active += 1
+
+    def _hand_over(self) -> bool:
+        """Pass a slot to the longest waiter; False if nobody is waiting"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        """Leave the queue; a slot handed over in the meantime is passed on"""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _record_wait(self, seconds: float) -> None:
+        self.total_wait_seconds += seconds
+        self.max_wait_observed = max(self.max_wait_observed, seconds)
+
+    def snapshot(self) -> Dict:
+        """Current usage and counters for the metrics endpoint"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queue_length": len(self._waiters),
+            "max_queue": self.max_queue,
+            "peak_queue": self.peak_queue,
+            "admitted": self.admitted,
+            "queued_calls": self.queued_calls,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_wait_timeout": self.rejected_wait_timeout,
+            "avg_wait_ms": round(self.total_wait_seconds / self.queued_calls * 1000, 1) if self.queued_calls else 0.0,
+            "max_wait_ms": round(self.max_wait_observed * 1000, 1),
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+# Per-worker concurrency limit for each Azure dependency
+DEFAULT_MAX_CONCURRENT: Dict[str, int] = {
+    "vision": settings.BULKHEAD_VISION_MAX_CONCURRENT,
+    "openai": settings.BULKHEAD_OPENAI_MAX_CONCURRENT,
+    "translator": settings.BULKHEAD_TRANSLATOR_MAX_CONCURRENT,
+    "speech": settings.BULKHEAD_SPEECH_MAX_CONCURRENT,
+}
+
+bulkheads: Dict[str, Bulkhead] = {
+    name: Bulkhead(name, max_concurrent)
+    for name, max_concurrent in DEFAULT_MAX_CONCURRENT.items()
+}
+
+
+def get_bulkhead(dependency: str) -> Bulkhead:
+    """Get the bulkhead for a dependency, creating one for unknown names"""
+    bulkhead = bulkheads.get(dependency)
+    if bulkhead is None:
+        bulkhead = Bulkhead(dependency, settings.BULKHEAD_DEFAULT_MAX_CONCURRENT)
+        bulkheads[dependency] = bulkhead
+    return bulkhead
+
+
+def bulkhead_states() -> Dict[str, Dict]:
+    """Snapshot of every bulkhead"""
+    return {name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()}
@@ -0,0 +1,276 @@
+"""
+Result Caches
+In-memory LRU/TTL tier backed by a SQLite tier shared by all workers
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+
+# Every named cache, for the metrics endpoint
+_registry: Dict[str, "TieredCache"] = {}
+
+_MISSING = object()
+
+# A store's file: a path, or a function giving it when the store is first opened
+StorePath = Union[Path, str, Callable[[], Path]]
+
+
+def resolve_path(path: StorePath) -> Path:
+    """The path of a store's file"""
+    return Path(path()) if callable(path) else Path(path)
+
+
+class TTLCache:
+    """Least-recently-used in-memory cache whose entries expire after `ttl_seconds`"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a live entry and mark it most recently used"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Store an entry, evicting the least recently used ones past capacity"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """
+    Key/value table in a local SQLite file.
+
+    WAL mode lets every gunicorn worker read and write the same file
+    concurrently. Values are stored as JSON with an absolute expiry time.
+    Nothing is created on disk until the store is first used.
+
+    Queries can wait on another worker's write lock (up to the 5 s busy
+    timeout), so the methods run them in a thread and are awaited.
+    """
+
+    # Purge expired rows once every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: StorePath, table: str):
+        self._path = path
+        self.table = table
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open (or reopen after a fork) the connection for this process"""
+        if self._conn is None or self._pid != os.getpid():
+            path = self.path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @property
+    def path(self) -> Path:
+        return resolve_path(self._path)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return await asyncio.to_thread(self._get, key, default)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl_seconds)
+
+    async def items_since(self, rowid: int) -> List[Tuple[int, str, Any]]:
+        """Live rows written after a given rowid, oldest first"""
+        return await asyncio.to_thread(self._items_since, rowid)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._execute, f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._execute, f"DELETE FROM {self.table}", ())
+
+    def _get(self, key: str, default: Any) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return default
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+
+    def _items_since(self, rowid: int) -> List[Tuple[int, str, Any]]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT rowid, key, value FROM {self.table} "
+                "WHERE rowid > ? AND expires_at >= ? ORDER BY rowid",
+                (rowid, time.time()),
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._connection().execute(sql, params)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class TieredCache:
+    """
+    Memory tier in front of an optional disk tier.
+
+    Reads check memory first, then disk (promoting hits into memory);
+    writes go to both. Hits, misses and per-tier hit counts are tracked.
+    A memory hit returns without leaving the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl_seconds: float,
+        disk_path: Optional[StorePath] = None
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLCache(max_entries, ttl_seconds)
+        self.disk = SQLiteStore(disk_path, name) if disk_path else None
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        _registry[name] = self
+
+    async def get(self, key: str) -> Any:
+        """
+        Look a key up in memory, then on disk.
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        if self.disk is not None:
+            try:
+                value = await self.disk.get(key, _MISSING)
+            except sqlite3.Error as e:
+                print(f"Cache '{self.name}' disk read failed: {str(e)}")
+                value = _MISSING
+            if value is not _MISSING:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a value in both tiers"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, value, self.ttl_seconds)
+            except sqlite3.Error as e:
+                print(f"Cache '{self.name}' disk write failed: {str(e)}")
+
+    def record_saved(self, seconds: float) -> None:
+        """Add the upstream latency a hit avoided"""
+        self.saved_seconds += seconds
+
+    async def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            await self.disk.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def cache_dir() -> Path:
+    """Directory holding the on-disk cache tiers"""
+    return Path(settings.CACHE_DIR)
+
+
+def cache_file(name: str) -> Callable[[], Path]:
+    """
+    A file in the cache directory, for stores created at import time.
+
+    The path is looked up when the store is first opened, so importing a
+    module creates nothing on disk and CACHE_DIR set later still applies.
+    """
+    return lambda: cache_dir() / name
+
+
+def cache_stats() -> Dict[str, Dict]:
+    """Stats for every named cache"""
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,198 @@
+"""
+Circuit Breakers for Azure Dependencies
+Stops calling a degraded service (Vision, OpenAI, Translator, Speech) so
+requests fail fast and routers can fall back instead of waiting on it
+"""
+
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+from app.config import settings
+
+# Calls slower than this count towards the slow-call rate of the dependency
+DEFAULT_SLOW_CALL_SECONDS: Dict[str, float] = {
+    "vision": 8.0,
+    "openai": 15.0,
+    "translator": 4.0,
+    "speech": 8.0,
+}
+
+
+class BreakerState(str, Enum):
+    """Circuit breaker states"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        self.dependency = dependency
+        self.retry_after = retry_after
+        super().__init__(f"{dependency} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+
+
+def _default(value, fallback):
+    """Use the configured setting when no explicit value is given"""
+    return fallback if value is None else value
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker.
+
+    Opens when, over the last `window_size` calls (and at least
+    `minimum_calls`), the failure rate or the slow-call rate crosses its
+    threshold. After `open_seconds` it lets `half_open_max_calls` probes
+    through: all succeeding closes it, any failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float,
+        failure_rate_threshold: Optional[float] = None,
+        slow_call_rate_threshold: Optional[float] = None,
+        window_size: Optional[int] = None,
+        minimum_calls: Optional[int] = None,
+        open_seconds: Optional[float] = None,
+        half_open_max_calls: Optional[int] = None
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_rate_threshold = _default(failure_rate_threshold, settings.BREAKER_FAILURE_RATE_THRESHOLD)
+        self.slow_call_rate_threshold = _default(slow_call_rate_threshold, settings.BREAKER_SLOW_CALL_RATE_THRESHOLD)
+        self.window_size = _default(window_size, settings.BREAKER_WINDOW_SIZE)
+        self.minimum_calls = _default(minimum_calls, settings.BREAKER_MINIMUM_CALLS)
+        self.open_seconds = _default(open_seconds, settings.BREAKER_OPEN_SECONDS)
+        self.half_open_max_calls = _default(half_open_max_calls, settings.BREAKER_HALF_OPEN_MAX_CALLS)
+
+        self.state = BreakerState.CLOSED
+        self.opened_at: Optional[float] = None
+        # (failed, slow) per recorded call
+        self._window: Deque[tuple] = deque(maxlen=self.window_size)
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.rejected_calls = 0
+        self.times_opened = 0
+
+    def before_call(self) -> None:
+        """
+        Admit or reject a call.
+
+        Raises:
+            CircuitOpenError: The breaker is open, or half-open with all probes taken
+        """
+        if self.state == BreakerState.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.open_seconds:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.name, self.open_seconds - elapsed)
+            self._transition(BreakerState.HALF_OPEN)
+
+        if self.state == BreakerState.HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.name, 0)
+            self._half_open_in_flight += 1
+
+    def record(self, failed: bool, duration: float) -> None:
+        """Record the outcome of an admitted call"""
+        slow = duration >= self.slow_call_seconds
+
+        if self.state == BreakerState.HALF_OPEN:
+            self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+            if failed or slow:
+                self._transition(BreakerState.OPEN)
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                self._transition(BreakerState.CLOSED)
+            return
+
+        self._window.append((failed, slow))
+        if len(self._window) < self.minimum_calls:
+            return
+
+        failure_rate, slow_rate = self._rates()
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._transition(BreakerState.OPEN)
+
+    def release(self) -> None:
+        """Give back a half-open probe slot for a call that recorded nothing (e.g. cancelled)"""
+        if self.state == BreakerState.HALF_OPEN:
+            self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+
+    def _rates(self) -> tuple:
+        """Failure rate and slow-call rate over the rolling window"""
+        calls = len(self._window)
+        if not calls:
+            return 0.0, 0.0
+        failures = sum(1 for failed, _ in self._window if failed)
+        slow = sum(1 for _, is_slow in self._window if is_slow)
+        return failures / calls, slow / calls
+
+    def _transition(self, state: BreakerState) -> None:
+        """Move to a new state and reset the counters that belong to it"""
+        if state == self.state:
+            return
+        print(f"Circuit breaker '{self.name}': {self.state.value} -> {state.value}")
+        self.state = state
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        if state == BreakerState.OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        elif state == BreakerState.CLOSED:
+            self.opened_at = None
+            self._window.clear()
+
+    def snapshot(self) -> Dict:
+        """Current state and counters for the metrics endpoint"""
+        failure_rate, slow_rate = self._rates()
+        retry_after = None
+        if self.state == BreakerState.OPEN:
+            retry_after = round(max(self.open_seconds - (time.monotonic() - self.opened_at), 0), 1)
+        return {
+            "state": self.state.value,
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+            "calls_in_window": len(self._window),
+            "slow_call_seconds": self.slow_call_seconds,
+            "rejected_calls": self.rejected_calls,
+            "times_opened": self.times_opened,
+            "retry_after_seconds": retry_after,
+        }
+
+
+# One breaker per Azure dependency
+breakers: Dict[str, CircuitBreaker] = {
+    name: CircuitBreaker(name, slow_call_seconds=seconds)
+    for name, seconds in DEFAULT_SLOW_CALL_SECONDS.items()
+}
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    """Get the breaker for a dependency, creating one for unknown names"""
+    breaker = breakers.get(dependency)
+    if breaker is None:
+        breaker = CircuitBreaker(dependency, slow_call_seconds=10.0)
+        breakers[dependency] = breaker
+    return breaker
+
+
+def is_open(dependency: str) -> bool:
+    """True when calls to the dependency are currently being rejected"""
+    breaker = breakers.get(dependency)
+    if breaker is None or breaker.state != BreakerState.OPEN:
+        return False
+    return time.monotonic() - breaker.opened_at < breaker.open_seconds
+
+
+def breaker_states() -> Dict[str, Dict]:
+    """Snapshot of every breaker"""
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
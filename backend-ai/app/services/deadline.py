@@ -0,0 +1,173 @@
+"""
+Request Deadline Propagation
+Shares one time budget across the Vision -> GPT-4 -> Translate -> Audio stages
+"""
+
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from app.config import settings
+
+# Relative share of the remaining budget each stage may use. A stage gets
+# weight / (sum of weights of stages not yet run), so time saved by a fast
+# stage flows to the later ones.
+PIPELINE_STAGE_WEIGHTS: Dict[str, float] = {
+    "vision": 2.0,
+    "diagnosis": 4.0,
+    "translation": 1.0,
+    "audio": 1.0,
+}
+
+# Below this a stage is not worth starting
+MIN_STAGE_BUDGET_SECONDS = 0.05
+
+# Absolute monotonic time at which the currently running stage must finish
+# (or the SharedDeadline of a call made for several callers). Read by
+# http_client so outbound sockets never outlive their stage.
+_stage_expires_at: contextvars.ContextVar[Union[float, "SharedDeadline", None]] = contextvars.ContextVar(
+    "stage_expires_at", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """A required pipeline stage ran out of time"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Deadline exceeded during {stage} stage")
+
+
+def _current_expires_at() -> Optional[float]:
+    expires_at = _stage_expires_at.get()
+    if isinstance(expires_at, SharedDeadline):
+        return expires_at.expires_at
+    return expires_at
+
+
+def stage_time_left() -> Optional[float]:
+    """
+    Seconds left for the currently running stage.
+
+    Returns:
+        Remaining seconds, or None when no deadline is active
+    """
+    expires_at = _current_expires_at()
+    if expires_at is None:
+        return None
+    return max(expires_at - time.monotonic(), 0.0)
+
+
+class SharedDeadline:
+    """
+    Stage deadline of one call made on behalf of several callers (a
+    coalesced or micro-batched call): the latest of the callers' deadlines,
+    or none once a caller without a deadline has joined.
+
+    The call runs in context() instead of any one caller's context, so the
+    first caller's deadline does not cut it short for the others while it
+    is still bounded by the longest of them. A caller joining a running
+    call extends the deadline for what the call has not started yet.
+    """
+
+    def __init__(self):
+        self.expires_at: Optional[float] = None
+        self.callers = 0
+
+    def join(self) -> None:
+        """Add the current caller's stage deadline"""
+        expires_at = _current_expires_at()
+        if self.callers == 0:
+            self.expires_at = expires_at
+        elif self.expires_at is not None:
+            self.expires_at = None if expires_at is None else max(self.expires_at, expires_at)
+        self.callers += 1
+
+    def context(self) -> contextvars.Context:
+        """Fresh context (no caller state) whose stage deadline is this one"""
+        context = contextvars.Context()
+        context.run(_stage_expires_at.set, self)
+        return context
+
+
+class Deadline:
+    """Time budget for one request, handed out to pipeline stages as they run"""
+
+    def __init__(
+        self,
+        budget_seconds: Optional[float] = None,
+        stage_weights: Optional[Dict[str, float]] = None
+    ):
+        self.budget_seconds = budget_seconds if budget_seconds is not None else settings.DIAGNOSIS_DEADLINE_SECONDS
+        self.expires_at = time.monotonic() + self.budget_seconds
+        self._pending = dict(stage_weights or PIPELINE_STAGE_WEIGHTS)
+        self.cut_stages: List[str] = []
+
+    def remaining(self) -> float:
+        """Seconds left in the whole request budget"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def stage_budget(self, stage: str) -> float:
+        """Share of the remaining budget that a stage may use"""
+        weight = self._pending.get(stage, 1.0)
+        others = sum(w for name, w in self._pending.items() if name != stage)
+        return self.remaining() * weight / (weight + others)
+
+    def skip(self, stage: str) -> None:
+        """Drop a stage that will not run so its share goes to the others"""
+        self._pending.pop(stage, None)
+
+    async def run(
+        self,
+        stage: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        optional: bool = False,
+        default: Any = None,
+        **kwargs
+    ) -> Any:
+        """
+        Run one stage within its share of the remaining budget.
+
+        Args:
+            stage: Stage name (key of the stage weights)
+            func: Async service function to call
+            *args, **kwargs: Arguments for func
+            optional: Skip the stage instead of failing when time runs out
+            default: Value returned for a skipped optional stage
+
+        Returns:
+            The stage result, or `default` when an optional stage was cut off
+
+        Raises:
+            DeadlineExceeded: A required stage did not finish in time
+        """
+        budget = self.stage_budget(stage)
+        self._pending.pop(stage, None)
+
+        if budget < MIN_STAGE_BUDGET_SECONDS:
+            return self._cut(stage, optional, default)
+
+        stage_expires_at = time.monotonic() + budget
+        token = _stage_expires_at.set(stage_expires_at)
+        try:
+            return await asyncio.wait_for(func(*args, **kwargs), timeout=budget)
+        except asyncio.TimeoutError:
+            return self._cut(stage, optional, default)
+        except Exception:
+            # The capped socket timeout can fire just before wait_for does;
+            # the service then reports a wrapped error rather than a timeout
+            if time.monotonic() >= stage_expires_at - MIN_STAGE_BUDGET_SECONDS:
+                return self._cut(stage, optional, default)
+            raise
+        finally:
+            _stage_expires_at.reset(token)
+
+    def _cut(self, stage: str, optional: bool, default: Any) -> Any:
+        """Record a stage that ran out of time"""
+        self.cut_stages.append(stage)
+        print(f"Deadline: {stage} stage cut off ({self.remaining():.2f}s left of {self.budget_seconds}s)")
+        if optional:
+            return default
+        raise DeadlineExceeded(stage)
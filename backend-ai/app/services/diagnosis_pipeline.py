@@ -0,0 +1,176 @@
+"""
+Diagnosis Pipeline Stages
+The Vision -> GPT-4 -> Translate -> Audio stages every diagnosis endpoint
+shares, declared once; routers add their own stages (logging, saving,
+structured fields) with Pipeline.with_stages
+"""
+
+from typing import Dict
+
+from app.config import settings
+from app.services import audio_jobs, audio_store, gpt4, image_prep, offline_diagnosis, speech, vision
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.pipeline import Pipeline, PipelineRun, Stage
+from app.services.speech_pipeline import SpeechPipeline
+
+# Inputs (run.inputs) the stages read:
+#   image: Photo bytes; prepared: already passed through image_prep
+#   detected_tags: Tags from an earlier Vision call (skips prepare and vision)
+#   question, language: Farmer's question and answer language
+#   advice_language: Language GPT-4 is asked in (default: language)
+#   crop, season: Context for the offline fallback, if known
+#   bypass_cache: Ask GPT-4 again instead of reusing cached advice
+#   speech_pipeline: Allow the sentence pipeline (default True; it is only
+#       used with SPEECH_PIPELINE_ENABLED)
+#   defer_audio: Hand audio to a background job instead of waiting for it
+#   on_audio_done: Called with the finished audio job (deferred audio)
+
+
+def no_audio() -> Dict:
+    """The "audio" object when there is no audio"""
+    return {"id": None, "url": None}
+
+
+def audio_language(run: PipelineRun) -> str:
+    """Language to voice: English when the translation fell back to it"""
+    return "en" if "translation" in run.fallback_stages else run.inputs["language"]
+
+
+def diagnosis_source(run: PipelineRun) -> str:
+    """Where the diagnosis text came from"""
+    return "offline_rules" if "diagnosis" in run.fallback_stages else "gpt4"
+
+
+def _drop_speech(run: PipelineRun) -> None:
+    """Cancel the sentence pipeline's outstanding work, if the run has one"""
+    pipeline = run.state.pop("speech", None)
+    if pipeline is not None:
+        pipeline.cancel()
+
+
+async def _prepare(run: PipelineRun) -> bytes:
+    # Upright, metadata-free and downscaled before upload (worker process)
+    return await image_prep.prepare_image(run.inputs["image"])
+
+
+async def _analyze(run: PipelineRun):
+    return await vision.analyze_image(run["prepare"])
+
+
+async def _prompt(run: PipelineRun) -> Dict:
+    return {
+        "question": run.inputs["question"],
+        "language": run.inputs.get("advice_language", run.inputs["language"]),
+        "context": None,
+        "system_prompt": None,
+    }
+
+
+async def _advise(run: PipelineRun) -> str:
+    detected_tags = run["vision"]
+    prompt = run["prompt"]
+    arguments = (detected_tags, prompt["question"], prompt["language"])
+    options = {
+        "context": prompt["context"],
+        "bypass_cache": run.inputs.get("bypass_cache", False),
+        "system_prompt": prompt["system_prompt"],
+    }
+    if settings.SPEECH_PIPELINE_ENABLED and run.inputs.get("speech_pipeline", True):
+        # Each sentence is translated and voiced while later ones are
+        # still being generated
+        run.state["speech"] = SpeechPipeline(run.inputs["language"])
+    pipeline = run.state.get("speech")
+    if pipeline is None and run.events is None:
+        return await gpt4.get_agronomist_advice(*arguments, **options)
+
+    parts = []
+    async for token in gpt4.stream_agronomist_advice(*arguments, **options):
+        parts.append(token)
+        if pipeline is not None:
+            pipeline.feed(token)
+        run.emit("token", {"text": token})
+    if pipeline is not None:
+        pipeline.close()
+    return "".join(parts)
+
+
+def _offline_advice(run: PipelineRun, error: Exception) -> str:
+    # GPT-4 down or too slow: answer from the crop knowledge base rather
+    # than failing the whole request. Sentences already fed to the
+    # pipeline belong to the abandoned answer.
+    _drop_speech(run)
+    return offline_diagnosis.advise(
+        run["vision"], run.inputs["question"], crop=run.inputs.get("crop"), season=run.inputs.get("season")
+    )
+
+
+async def _translate(run: PipelineRun) -> Dict:
+    pipeline = run.state.get("speech")
+    if pipeline is not None:
+        return {"text": await pipeline.translation()}
+    return {"text": await speech.translate_text(run["diagnosis"], run.inputs["language"])}
+
+
+def _english(run: PipelineRun, error: Exception) -> Dict:
+    # The pipeline's audio is in the target language; voice the English instead
+    _drop_speech(run)
+    return {"text": run["diagnosis"]}
+
+
+async def _speak(run: PipelineRun) -> Dict:
+    pipeline = run.state.get("speech")
+    if pipeline is not None:
+        audio_id = await pipeline.audio()
+    else:
+        audio_id = await speech.synthesize_audio(run["translation"]["text"], audio_language(run))
+    return {"id": audio_id, "url": audio_store.audio_url(audio_id) if audio_id else None}
+
+
+async def _start_audio_job(run: PipelineRun) -> Dict:
+    # The job takes over the sentence pipeline and cancels it when done
+    pipeline = run.state.pop("speech", None)
+    job = await audio_jobs.submit(
+        run["translation"]["text"],
+        audio_language(run),
+        work=pipeline.audio if pipeline is not None else None,
+        on_done=run.inputs.get("on_audio_done"),
+        cleanup=pipeline.cancel if pipeline is not None else None
+    )
+    return audio_jobs.audio_reference(job)
+
+
+DIAGNOSIS_PIPELINE = Pipeline("diagnosis", [
+    Stage(
+        "prepare", _prepare, timed=False,
+        when=lambda run: not run.inputs.get("prepared") and "detected_tags" not in run.inputs,
+        otherwise=lambda run: run.inputs.get("image")
+    ),
+    Stage(
+        "vision", _analyze, after=("prepare",), retries=1,
+        when=lambda run: "detected_tags" not in run.inputs,
+        otherwise=lambda run: run.inputs["detected_tags"],
+        event="tags", event_data=lambda run, tags: {"detected_tags": tags}
+    ),
+    Stage("prompt", _prompt, after=("vision",), timed=False),
+    Stage(
+        "diagnosis", _advise, after=("vision", "prompt"),
+        fallback=_offline_advice,
+        event="diagnosis",
+        event_data=lambda run, text: {"original_text": text, "source": diagnosis_source(run)}
+    ),
+    Stage(
+        "translation", _translate, after=("diagnosis",),
+        fallback=_english, fallback_on=(CircuitOpenError,),
+        when=lambda run: run.inputs["language"] != "en",
+        otherwise=lambda run: {"text": run["diagnosis"]},
+        event="translation",
+        event_data=lambda run, result: {"translated_text": result["text"], "language": run.inputs["language"]}
+    ),
+    Stage(
+        "audio", _speak, after=("translation",), optional=True, default=no_audio(),
+        fallback=lambda run, error: no_audio(),
+        when=lambda run: not run.inputs.get("defer_audio"),
+        otherwise=_start_audio_job,
+        event="audio"
+    ),
+], cleanup=_drop_speech)
@@ -3,23 +3,277 @@ Azure OpenAI GPT-4 Service
 Handles crop diagnosis and organic solution recommendations
 """
 
-import requests
-from typing import List
+import hashlib
+import json
+import re
+import time
+import httpx
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from app.config import settings
+from app.services import http_client
+from app.services.cache import TieredCache, cache_file
+from app.services.single_flight import SingleFlight, SingleFlightStream
+from app.services.throttle import Throttle
 
+# Rough size of a token in English text, and the per-message chat overhead
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
 
-async def get_agronomist_advice(tags: List[str], user_query: str, language: str) -> str:
+# Advice keyed on the canonical form of the inputs. Traffic is dominated by a
+# few dozen tag/question patterns per crop and season, so most calls repeat.
+_advice_cache = TieredCache(
+    "advice",
+    max_entries=settings.ADVICE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ADVICE_CACHE_TTL_SECONDS,
+    disk_path=cache_file("advice.sqlite3"),
+)
+
+# Advice requests being answered right now, by cache key: whole answers,
+# and streamed ones (followers replay the leader's tokens)
+_in_flight = SingleFlight("advice")
+_in_flight_streams = SingleFlightStream("advice_stream")
+
+# Requests-per-minute and tokens-per-minute quota of the deployment
+_throttle = Throttle(
+    f"openai:{settings.AZURE_OPENAI_DEPLOYMENT}",
+    requests_per_minute=settings.OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.OPENAI_TOKENS_PER_MINUTE,
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+def estimate_prompt_tokens(payload: Dict) -> int:
+    """Approximate prompt tokens of a chat completions payload"""
+    return sum(
+        len(message.get("content") or "") // CHARS_PER_TOKEN + TOKENS_PER_MESSAGE
+        for message in payload.get("messages", [])
+    )
+
+
+def estimate_tokens(payload: Dict) -> int:
+    """
+    Tokens a chat completions call counts against the TPM quota.
+    
+    Azure reserves the prompt plus max_tokens when the request arrives, so
+    that is what the throttle reserves too.
+    """
+    return estimate_prompt_tokens(payload) + payload.get("max_tokens", 0)
+
+
+def advice_cache_key(
+    tags: List[str],
+    user_query: str,
+    language: str,
+    context: Optional[Dict[str, Optional[str]]] = None
+) -> str:
+    """
+    Canonical cache key for an advice request.
+    
+    Tags are lowercased, deduplicated and sorted; the question is normalized;
+    context carries the v2 fields (crop, experience level, season...).
+    """
+    canonical = {
+        "tags": sorted({tag.strip().lower() for tag in tags if tag.strip()}),
+        "question": normalize_question(user_query),
+        "language": language.lower(),
+        "context": {k: v for k, v in sorted((context or {}).items()) if v is not None},
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def get_agronomist_advice(
+    tags: List[str],
+    user_query: str,
+    language: str,
+    context: Optional[Dict[str, Optional[str]]] = None,
+    bypass_cache: bool = False,
+    system_prompt: Optional[str] = None
+) -> str:
     """
     Get agronomist advice using Azure OpenAI GPT-4.
     
+    Answers are cached on the canonical form of the inputs (see
+    advice_cache_key). With bypass_cache the model is always called and the
+    fresh answer replaces the cached one.
+    
     Args:
         tags: List of detected image tags
         user_query: User's question about the crop
         language: Target language code (e.g., 'en', 'sw', 'ar')
+        context: Extra prompt inputs that change the answer (v2 crop, experience, season)
+        bypass_cache: Skip the cache lookup
+        system_prompt: Replaces the default agronomist prompt; it must be
+            determined by the inputs and context, as it is not in the cache key
     
     Returns:
         Advice text in the specified language (under 100 words)
     """
+    key = advice_cache_key(tags, user_query, language, context)
+    if not bypass_cache:
+        cached = await _advice_cache.get(key)
+        if cached is not None:
+            _advice_cache.record_saved(cached["latency"])
+            return cached["advice"]
+    
+    # Identical questions asked at the same time share one GPT-4 call,
+    # whether it is being streamed or not
+    if _in_flight_streams.in_flight(key):
+        return "".join([
+            piece async for piece in _in_flight_streams.stream(
+                key, _stream_and_cache, key, tags, user_query, language, system_prompt
+            )
+        ])
+    return await _in_flight.do(key, _request_and_cache, key, tags, user_query, language, system_prompt)
+
+
+async def _request_and_cache(
+    key: str,
+    tags: List[str],
+    user_query: str,
+    language: str,
+    system_prompt: Optional[str] = None
+) -> str:
+    started = time.monotonic()
+    advice = await _request_advice(tags, user_query, language, system_prompt)
+    await _advice_cache.set(key, {"advice": advice, "latency": round(time.monotonic() - started, 3)})
+    return advice
+
+
+async def stream_agronomist_advice(
+    tags: List[str],
+    user_query: str,
+    language: str,
+    context: Optional[Dict[str, Optional[str]]] = None,
+    bypass_cache: bool = False,
+    system_prompt: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Stream agronomist advice as GPT-4 generates it.
+    
+    Same inputs and cache as get_agronomist_advice; a cached answer is
+    yielded in one piece, otherwise text deltas are yielded as they arrive
+    and the complete answer is cached at the end. Identical questions
+    streamed at the same time share one GPT-4 stream; a question already
+    being answered without streaming is yielded in one piece once ready.
+    
+    Yields:
+        Pieces of the advice text, in order
+    """
+    key = advice_cache_key(tags, user_query, language, context)
+    if not bypass_cache:
+        cached = await _advice_cache.get(key)
+        if cached is not None:
+            _advice_cache.record_saved(cached["latency"])
+            yield cached["advice"]
+            return
+    
+    if _in_flight.in_flight(key):
+        yield await _in_flight.do(key, _request_and_cache, key, tags, user_query, language, system_prompt)
+        return
+    async for piece in _in_flight_streams.stream(
+        key, _stream_and_cache, key, tags, user_query, language, system_prompt
+    ):
+        yield piece
+
+
+async def _stream_and_cache(
+    key: str,
+    tags: List[str],
+    user_query: str,
+    language: str,
+    system_prompt: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream from the chat completions endpoint, caching the whole answer"""
+    url, headers, params, payload = _chat_request(tags, user_query, language, system_prompt)
+    payload["stream"] = True
+    
+    reserved = estimate_tokens(payload)
+    
+    started = time.monotonic()
+    parts = []
+    completed = False
+    try:
+        async with _throttle.stream(
+            lambda: http_client.stream("POST", url, dependency="openai", headers=headers, params=params, json=payload),
+            tokens=reserved
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: "data: {chunk json}" ... "data: [DONE]"
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    completed = True
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except httpx.HTTPError as e:
+        print(f"Error streaming from Azure OpenAI API: {str(e)}")
+        raise Exception(f"Diagnosis failed: {str(e)}")
+    
+    advice = "".join(parts)
+    # Streamed responses carry no usage; estimate the completion from its length
+    _throttle.settle(reserved, estimate_prompt_tokens(payload) + len(advice) // CHARS_PER_TOKEN)
+    # A stream that ended without [DONE] (connection dropped) or with no
+    # text is not a whole answer; it must not be served from the cache.
+    # A stream abandoned by all its readers never gets here.
+    if completed and advice.strip():
+        await _advice_cache.set(key, {"advice": advice, "latency": round(time.monotonic() - started, 3)})
+
+
+async def _request_advice(
+    tags: List[str],
+    user_query: str,
+    language: str,
+    system_prompt: Optional[str] = None
+) -> str:
+    """Call the Azure OpenAI chat completions endpoint"""
+    url, headers, params, payload = _chat_request(tags, user_query, language, system_prompt)
+    
+    reserved = estimate_tokens(payload)
+    
+    try:
+        response = await _throttle.call(
+            lambda: http_client.post(url, dependency="openai", headers=headers, params=params, json=payload),
+            tokens=reserved
+        )
+        response.raise_for_status()
+        
+        data = response.json()
+        advice = data["choices"][0]["message"]["content"]
+        _throttle.settle(reserved, (data.get("usage") or {}).get("total_tokens", reserved))
+        
+        return advice
+        
+    except httpx.HTTPError as e:
+        print(f"Error calling Azure OpenAI API: {str(e)}")
+        raise Exception(f"Diagnosis failed: {str(e)}")
+
+
+def _chat_request(
+    tags: List[str],
+    user_query: str,
+    language: str,
+    system_prompt: Optional[str] = None
+) -> Tuple[str, Dict, Dict, Dict]:
+    """
+    Build the chat completions call for an advice request.
+    
+    Args:
+        system_prompt: Replaces the default agronomist prompt
+    
+    Returns:
+        (url, headers, params, payload)
+    """
     if not settings.AZURE_OPENAI_KEY or not settings.AZURE_OPENAI_ENDPOINT:
         raise ValueError("Azure OpenAI credentials not configured")
     
@@ -34,7 +288,8 @@ async def get_agronomist_advice(tags: List[str], user_query: str, language: str)
         "api-version": settings.AZURE_OPENAI_API_VERSION
     }
     
-    system_prompt = """You are AgriVoice, an expert agronomist specializing in organic farming for African smallholder farmers.
+    if system_prompt is None:
+        system_prompt = """You are AgriVoice, an expert agronomist specializing in organic farming for African smallholder farmers.
 
 YOUR ROLE:
 - Diagnose crop diseases and pest problems from visual symptoms
@@ -85,15 +340,4 @@ Based on these visual indicators, provide a diagnosis with specific organic reme
         "max_tokens": 150
     }
     
-    try:
-        response = requests.post(url, headers=headers, params=params, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        advice = data["choices"][0]["message"]["content"]
-        
-        return advice
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Azure OpenAI API: {str(e)}")
-        raise Exception(f"Diagnosis failed: {str(e)}")
+    return url, headers, params, payload
@@ -0,0 +1,264 @@
+"""
+Shared Async HTTP Client
+Pooled keep-alive connections to the Azure services, one pool per host
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import settings
+from app.services.adaptive_limit import get_limiter
+from app.services.bulkhead import Bulkhead, get_bulkhead
+from app.services.circuit_breaker import get_breaker
+from app.services.deadline import stage_time_left
+
+# One AsyncClient per scheme://host[:port] so every Azure resource keeps its
+# own warm pool of TCP/TLS connections between requests
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _origin(url: str) -> str:
+    """Return the scheme://host[:port] part of a URL"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Create a pooled client using the configured limits"""
+    http2 = settings.HTTP2_ENABLED
+    if http2 and not _http2_available():
+        print("Warning: HTTP2_ENABLED is set but 'h2' is not installed, using HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    timeout = httpx.Timeout(
+        settings.HTTP_TIMEOUT_SECONDS,
+        connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """
+    Get the pooled client for the host of a URL, creating it on first use.
+
+    Args:
+        url: Any URL on the target host
+
+    Returns:
+        Shared httpx.AsyncClient for that host
+    """
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[origin] = client
+    return client
+
+
+def _is_dependency_failure(response: httpx.Response) -> bool:
+    """Server errors and throttling count against a dependency; client errors do not"""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _cap_timeout(kwargs: dict) -> None:
+    """Cap the request timeout at the time the current stage has left"""
+    time_left = stage_time_left()
+    if time_left is not None and "timeout" not in kwargs:
+        kwargs["timeout"] = httpx.Timeout(
+            max(time_left, 0.001),
+            connect=min(settings.HTTP_CONNECT_TIMEOUT_SECONDS, max(time_left, 0.001)),
+        )
+
+
+async def request(
+    method: str,
+    url: str,
+    dependency: Optional[str] = None,
+    **kwargs
+) -> httpx.Response:
+    """
+    Send a request through the shared pool for the URL's host.
+
+    When a pipeline stage deadline is active the request timeout is capped at
+    the time the stage has left. When a dependency name is given the call
+    goes through that dependency's circuit breaker and bulkhead, and its
+    latency and outcome adjust the bulkhead's adaptive limit.
+
+    Args:
+        method: HTTP method
+        url: Absolute URL
+        dependency: Breaker name ("vision", "openai", "translator", "speech")
+        **kwargs: Passed through to httpx (headers, params, json, content...)
+
+    Returns:
+        httpx.Response (status is not checked here)
+
+    Raises:
+        CircuitOpenError: The dependency's breaker is open
+        BulkheadFullError: Too many calls to the dependency are already queued
+    """
+    _cap_timeout(kwargs)
+    client = get_client(url)
+    if dependency is None:
+        return await client.request(method, url, **kwargs)
+
+    breaker = get_breaker(dependency)
+    bulkhead = await _admit(dependency)
+    started = time.monotonic()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        duration = time.monotonic() - started
+        breaker.record(failed=True, duration=duration)
+        _observe(dependency, duration, timed_out=isinstance(e, httpx.TimeoutException))
+        raise
+    except asyncio.CancelledError:
+        # Cut off by a deadline: only counts if it had already been slow
+        duration = time.monotonic() - started
+        if duration >= breaker.slow_call_seconds:
+            breaker.record(failed=False, duration=duration)
+        else:
+            breaker.release()
+        _observe(dependency, duration, cancelled=True)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    finally:
+        bulkhead.release()
+    duration = time.monotonic() - started
+    breaker.record(failed=_is_dependency_failure(response), duration=duration)
+    _observe(dependency, duration, throttled=response.status_code == 429)
+    return response
+
+
+def _observe(dependency: str, duration: float, **outcome) -> None:
+    """Feed a call's latency and outcome to the dependency's adaptive limit"""
+    limiter = get_limiter(dependency)
+    if limiter is not None:
+        limiter.record(duration, **outcome)
+
+
+async def _admit(dependency: str) -> Bulkhead:
+    """
+    Pass the dependency's breaker, then take a slot in its bulkhead.
+
+    Returns:
+        The bulkhead, to be released when the call is done
+    """
+    breaker = get_breaker(dependency)
+    breaker.before_call()
+    bulkhead = get_bulkhead(dependency)
+    try:
+        await bulkhead.acquire()
+    except BaseException:
+        breaker.release()
+        raise
+    return bulkhead
+
+
+@asynccontextmanager
+async def stream(
+    method: str,
+    url: str,
+    dependency: Optional[str] = None,
+    **kwargs
+) -> AsyncIterator[httpx.Response]:
+    """
+    Send a request and stream the response body as it arrives.
+
+    Same pooling, deadline, breaker and bulkhead handling as request(); the
+    breaker records the call once the status line and headers are in, so a
+    long body (e.g. GPT tokens, TTS audio) does not count as a slow call,
+    while the bulkhead slot is held until the body is closed.
+
+    Usage:
+        async with http_client.stream("POST", url, dependency="openai", json=body) as response:
+            async for line in response.aiter_lines():
+                ...
+    """
+    _cap_timeout(kwargs)
+    client = get_client(url)
+    breaker = get_breaker(dependency) if dependency else None
+    bulkhead = await _admit(dependency) if dependency else None
+    try:
+        started = time.monotonic()
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        except httpx.HTTPError as e:
+            if breaker is not None:
+                duration = time.monotonic() - started
+                breaker.record(failed=True, duration=duration)
+                _observe(dependency, duration, timed_out=isinstance(e, httpx.TimeoutException))
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            duration = time.monotonic() - started
+            breaker.record(failed=_is_dependency_failure(response), duration=duration)
+            _observe(dependency, duration, throttled=response.status_code == 429)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+    finally:
+        if bulkhead is not None:
+            bulkhead.release()
+
+
+async def post(url: str, dependency: Optional[str] = None, **kwargs) -> httpx.Response:
+    """POST through the shared pool (and the dependency's breaker and bulkhead, if named)"""
+    return await request("POST", url, dependency=dependency, **kwargs)
+
+
+async def startup() -> None:
+    """Warm up clients for the configured Azure hosts (called from app lifespan)"""
+    for url in (
+        settings.AZURE_VISION_ENDPOINT,
+        settings.AZURE_OPENAI_ENDPOINT,
+        settings.AZURE_TRANSLATOR_ENDPOINT,
+    ):
+        if url:
+            get_client(url)
+    if settings.AZURE_SPEECH_ENDPOINT:
+        get_client(settings.AZURE_SPEECH_ENDPOINT)
+    elif settings.AZURE_SPEECH_REGION:
+        get_client(f"https://{settings.AZURE_SPEECH_REGION}.tts.speech.microsoft.com")
+
+
+async def shutdown() -> None:
+    """Close every pooled client (called from app lifespan)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def pool_stats() -> Dict[str, int]:
+    """Number of open pools and configured per-pool limits"""
+    return {
+        "pools": len(_clients),
+        "max_connections": settings.HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    }
@@ -0,0 +1,205 @@
+"""
+Perceptual Image Hashing
+dHash fingerprints and a BK-tree for finding near-duplicate crop photos
+(recompressed by WhatsApp, slightly re-cropped, resized...)
+"""
+
+import io
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+from app.services.cache import SQLiteStore
+
+HASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+
+
+def dhash(image_bytes: bytes, hash_size: int = HASH_SIZE) -> int:
+    """
+    Difference hash of an image.
+
+    The image is shrunk to (hash_size + 1) x hash_size greyscale pixels and
+    each bit records whether a pixel is brighter than its right neighbour,
+    so the hash survives recompression, scaling and small crops.
+
+    Args:
+        image_bytes: Encoded image (JPEG, PNG, ...)
+        hash_size: Bits per row/column
+
+    Returns:
+        hash_size * hash_size bit integer
+
+    Raises:
+        OSError: The bytes are not a decodable image
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let the JPEG decoder downscale while decoding; full-size decode of
+        # a 12 MP photo is the expensive part otherwise
+        img.draft("L", (hash_size * 16, hash_size * 16))
+        img = ImageOps.exif_transpose(img).convert("L")
+        small = img.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance.
+
+    Each child edge is labelled with its distance to the parent, so a query
+    within radius r only descends edges labelled d-r..d+r (triangle
+    inequality) instead of scanning every stored hash.
+    """
+
+    def __init__(self):
+        # node: [hash, values, {distance: child node}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, hash_value: int, value: Any) -> bool:
+        """
+        Store a value under a hash.
+
+        Returns:
+            False if the value was already stored under that hash
+        """
+        if self._root is None:
+            self._root = [hash_value, [value], {}]
+            self.size += 1
+            return True
+
+        node = self._root
+        while True:
+            distance = hamming(hash_value, node[0])
+            if distance == 0:
+                if value in node[1]:
+                    return False
+                node[1].append(value)
+                self.size += 1
+                return True
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                self.size += 1
+                return True
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        All stored values within max_distance of a hash.
+
+        Returns:
+            (distance, value) pairs, closest first
+        """
+        if self._root is None:
+            return []
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(hash_value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of analyzed images, searchable by Hamming distance.
+
+    Hashes are persisted next to the Vision cache so every worker can match
+    images first analyzed by another; new rows are pulled in incrementally.
+    A BK-tree cannot drop entries, so once it holds more than max_entries
+    hashes or is rebuild_seconds old it is rebuilt from the live (unexpired)
+    rows, newest first.
+    """
+
+    def __init__(
+        self,
+        store: SQLiteStore,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        rebuild_seconds: Optional[float] = None
+    ):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = settings.VISION_PHASH_MAX_ENTRIES if max_entries is None else max_entries
+        self.rebuild_seconds = settings.VISION_PHASH_REBUILD_SECONDS if rebuild_seconds is None else rebuild_seconds
+        self.tree = BKTree()
+        self._last_rowid = 0
+        self._built_at = time.monotonic()
+        self.rebuilds = 0
+        self.lookups = 0
+        self.hits = 0
+        self.distances: Dict[int, int] = {}
+
+    async def _sync(self) -> None:
+        """Load hashes added (by any worker) since the last sync"""
+        if time.monotonic() - self._built_at >= self.rebuild_seconds:
+            await self._rebuild()
+            return
+        for rowid, image_key, hash_hex in await self.store.items_since(self._last_rowid):
+            self.tree.add(int(hash_hex, 16), image_key)
+            self._last_rowid = rowid
+        if self.tree.size > self.max_entries:
+            await self._rebuild()
+
+    async def _rebuild(self) -> None:
+        """Replace the tree with the newest max_entries live hashes"""
+        rows = await self.store.items_since(0)
+        tree = BKTree()
+        for _, image_key, hash_hex in rows[max(len(rows) - self.max_entries, 0):]:
+            tree.add(int(hash_hex, 16), image_key)
+        self.tree = tree
+        if rows:
+            self._last_rowid = rows[-1][0]
+        self._built_at = time.monotonic()
+        self.rebuilds += 1
+
+    async def add(self, hash_value: int, image_key: str) -> None:
+        """Remember the perceptual hash of an analyzed image"""
+        await self.store.set(image_key, format(hash_value, "x"), self.ttl_seconds)
+        await self._sync()
+
+    async def find(self, hash_value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        Earlier images within max_distance, closest first.
+
+        Returns:
+            (distance, image_key) pairs
+        """
+        await self._sync()
+        self.lookups += 1
+        return self.tree.search(hash_value, max_distance)
+
+    def record_hit(self, distance: int) -> None:
+        self.hits += 1
+        self.distances[distance] = self.distances.get(distance, 0) + 1
+
+    def stats(self) -> Dict:
+        return {
+            "indexed_images": self.tree.size,
+            "index_rebuilds": self.rebuilds,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_ratio": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "hit_distances": dict(sorted(self.distances.items())),
+        }
@@ -0,0 +1,182 @@
+"""
+Image Preprocessing
+Shrinks phone photos before they are sent to Vision or stored: applies the
+EXIF orientation, drops metadata, downscales and recompresses as JPEG, in a
+process pool so the CPU work stays off the event loop
+"""
+
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+
+# Created by startup() from the app lifespan; without it (tests, scripts)
+# images are processed in a thread instead
+_executor: Optional[ProcessPoolExecutor] = None
+
+_stats = {
+    "images": 0,
+    "skipped": 0,
+    "pool_restarts": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "total_seconds": 0.0,
+}
+
+
+def preprocess(image_bytes: bytes, max_side: int, quality: int) -> bytes:
+    """
+    Normalize an uploaded photo for Vision.
+
+    The image is rotated upright from its EXIF orientation, scaled so its
+    longest side is at most max_side and re-encoded as a baseline JPEG with
+    no EXIF, GPS or ICC data. Runs in a worker process.
+
+    Args:
+        image_bytes: Encoded image (JPEG, PNG, WebP...)
+        max_side: Longest side of the output in pixels
+        quality: JPEG quality (1-95)
+
+    Returns:
+        JPEG bytes
+
+    Raises:
+        OSError: The bytes are not a decodable image
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let the JPEG decoder downscale by 2/4/8 while decoding; a full
+        # decode of a 12 MP photo is most of the cost otherwise
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        # No exif/icc_profile arguments: the metadata is not carried over
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
+def _warm_up() -> None:
+    """No-op run in each worker at startup so the first request does not pay for it"""
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    # fork (where available) reuses the already imported modules
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    return ProcessPoolExecutor(max_workers=settings.IMAGE_PREP_WORKERS, mp_context=context)
+
+
+async def startup() -> None:
+    """Start the worker processes (called from app lifespan)"""
+    global _executor
+    if not settings.IMAGE_PREP_ENABLED or settings.IMAGE_PREP_WORKERS <= 0 or _executor is not None:
+        return
+    # The workers are started here, before the app has other threads running
+    _executor = _new_executor()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(_executor, _warm_up) for _ in range(settings.IMAGE_PREP_WORKERS)
+    ))
+
+
+async def shutdown() -> None:
+    """Stop the worker processes (called from app lifespan)"""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor) -> None:
+    """
+    Swap a pool whose worker died (OOM kill, segfault in a decoder) for a
+    fresh one; a broken pool fails every later submit otherwise. Requests
+    that saw the same failure only replace it once.
+    """
+    global _executor
+    if _executor is not broken:
+        return
+    _stats["pool_restarts"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+    try:
+        _executor = _new_executor()
+    except OSError as e:
+        # Cannot start processes any more: fall back to the thread
+        print(f"Image preprocessing pool not restarted: {str(e)}")
+        _executor = None
+
+
+async def prepare_image(image_bytes: bytes) -> bytes:
+    """
+    Preprocess an uploaded image off the event loop.
+
+    Bytes that cannot be decoded are returned unchanged (Vision reports the
+    error as before), as is everything when IMAGE_PREP_ENABLED is off.
+
+    Args:
+        image_bytes: Image as uploaded
+
+    Returns:
+        Upright, metadata-free JPEG of at most IMAGE_MAX_SIDE pixels
+    """
+    if not settings.IMAGE_PREP_ENABLED:
+        return image_bytes
+
+    started = time.monotonic()
+    args = (image_bytes, settings.IMAGE_MAX_SIDE, settings.IMAGE_JPEG_QUALITY)
+    executor = _executor
+    try:
+        if executor is not None:
+            prepared = await asyncio.get_running_loop().run_in_executor(executor, preprocess, *args)
+        else:
+            prepared = await asyncio.to_thread(preprocess, *args)
+    except BrokenProcessPool as e:
+        # Not retried in a thread: a decoder crash there would take the
+        # server down with it
+        print(f"Image preprocessing pool broken, restarting it: {str(e)}")
+        _replace_broken_pool(executor)
+        _stats["skipped"] += 1
+        return image_bytes
+    except Exception as e:
+        print(f"Image preprocessing skipped: {str(e)}")
+        _stats["skipped"] += 1
+        return image_bytes
+
+    _stats["images"] += 1
+    _stats["bytes_in"] += len(image_bytes)
+    _stats["bytes_out"] += len(prepared)
+    _stats["total_seconds"] += time.monotonic() - started
+    return prepared
+
+
+def prep_stats() -> Dict:
+    """Preprocessing counters for the metrics endpoint"""
+    images = _stats["images"]
+    return {
+        "images": images,
+        "skipped": _stats["skipped"],
+        "pool_restarts": _stats["pool_restarts"],
+        "bytes_in": _stats["bytes_in"],
+        "bytes_out": _stats["bytes_out"],
+        "size_ratio": round(_stats["bytes_out"] / _stats["bytes_in"], 3) if _stats["bytes_in"] else None,
+        "avg_ms": round(_stats["total_seconds"] / images * 1000, 1) if images else 0.0,
+        "workers": settings.IMAGE_PREP_WORKERS if _executor is not None else 0,
+        "max_side": settings.IMAGE_MAX_SIDE,
+        "enabled": settings.IMAGE_PREP_ENABLED,
+    }
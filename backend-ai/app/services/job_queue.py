@@ -0,0 +1,576 @@
+"""
+Diagnosis Job Queue
+Persistent job queue with an in-process worker pool: clients on slow links
+submit a photo, get a job id at once and poll (or receive a callback)
+instead of holding a connection open for the whole pipeline
+"""
+
+import asyncio
+import contextvars
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import settings
+from app.services.cache import StorePath, cache_file, resolve_path
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Handler for one kind of job: (params, payload, progress) -> result
+# progress(stage, fraction) records how far the job has got
+Progress = Callable[[str, float], None]
+Handler = Callable[[Dict, bytes, Progress], Awaitable[Dict]]
+
+
+class JobStore:
+    """
+    Jobs table in a local SQLite file.
+
+    Shared by all gunicorn workers (WAL mode, like the cache tier) and kept
+    across restarts. A running job holds a lease that its worker renews
+    (heartbeat) while the job runs; a job whose lease has run out (its worker
+    died or was restarted) is claimed again by the next free worker.
+
+    Methods block on SQLite (up to its 5 s busy timeout); the worker loop
+    calls the frequent ones through asyncio.to_thread.
+    """
+
+    COLUMNS = (
+        "id", "kind", "status", "stage", "progress", "params", "result", "error",
+        "callback_url", "callback_status", "attempts", "worker",
+        "created_at", "started_at", "updated_at", "finished_at",
+    )
+
+    def __init__(self, path: StorePath):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open (or reopen after a fork) the connection for this process"""
+        if self._conn is None or self._pid != os.getpid():
+            path = resolve_path(self._path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "stage TEXT, progress REAL NOT NULL DEFAULT 0, params TEXT NOT NULL, "
+                "payload BLOB, result TEXT, error TEXT, callback_url TEXT, callback_status TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, created_at REAL NOT NULL, "
+                "started_at REAL, updated_at REAL NOT NULL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _row(self, row: Optional[tuple]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, kind: str, params: Dict, payload: bytes, callback_url: Optional[str] = None) -> Dict:
+        """Queue a new job and return it"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO jobs (id, kind, status, params, payload, callback_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), payload, callback_url, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """A job without its payload, or None"""
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def claim(self, worker: str, lease_seconds: float, max_attempts: int) -> Tuple[Optional[Dict], int]:
+        """
+        Take the oldest runnable job: queued, or running with an expired lease.
+
+        Expired jobs that have used up their attempts are failed instead.
+
+        Returns:
+            (job with its payload under "payload" or None, number of expired
+            jobs taken over or failed)
+        """
+        now = time.time()
+        expired_before = now - lease_seconds
+        with self._lock:
+            conn = self._connection()
+            # Idle workers poll every few seconds: only take the write lock
+            # when there is something to claim or fail
+            runnable = conn.execute(
+                "SELECT 1 FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) LIMIT 1",
+                (QUEUED, RUNNING, expired_before),
+            ).fetchone()
+            if runnable is None:
+                return None, 0
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned = conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, worker = NULL, finished_at = ?, updated_at = ? "
+                    "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                    (FAILED, "Worker lost the job too many times", now, now, RUNNING, expired_before, max_attempts),
+                ).rowcount
+                row = conn.execute(
+                    f"SELECT {', '.join(self.COLUMNS)}, payload FROM jobs "
+                    "WHERE status = ? OR (status = ? AND updated_at < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, expired_before),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                        "started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                        (RUNNING, worker, now, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None, abandoned
+        job = self._row(row[:-1])
+        taken_over = abandoned + (job["status"] == RUNNING)
+        job.update(status=RUNNING, worker=worker, attempts=job["attempts"] + 1, payload=row[-1])
+        return job, taken_over
+
+    def progress(self, job_id: str, worker: str, stage: str, fraction: float) -> None:
+        """Record a job's current stage (and renew its lease)"""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (stage, round(fraction, 3), time.time(), job_id, worker, RUNNING),
+            )
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """
+        Renew a running job's lease.
+
+        Returns:
+            False if the job is no longer this worker's
+        """
+        with self._lock:
+            updated = self._connection().execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time(), job_id, worker, RUNNING),
+            ).rowcount
+        return updated == 1
+
+    def finish(self, job_id: str, worker: str, status: str, result: Optional[Dict] = None,
+               error: Optional[str] = None) -> bool:
+        """
+        Store a job's outcome.
+
+        Returns:
+            False if the job is no longer this worker's (its lease ran out
+            and another worker took it over)
+        """
+        now = time.time()
+        with self._lock:
+            updated = self._connection().execute(
+                "UPDATE jobs SET status = ?, stage = COALESCE(?, stage), progress = COALESCE(?, progress), "
+                "result = ?, error = ?, payload = NULL, finished_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (status, DONE if status == DONE else None, 1.0 if status == DONE else None,
+                 json.dumps(result) if result is not None else None, error, now, now, job_id, worker, RUNNING),
+            ).rowcount
+        return updated == 1
+
+    def requeue(self, job_id: str, worker: str, error: Optional[str] = None, refund_attempt: bool = False) -> None:
+        """Put a running job back in the queue (to retry, or because the worker is stopping)"""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = ?, worker = NULL, error = ?, updated_at = ?, "
+                "attempts = attempts - ? WHERE id = ? AND worker = ? AND status = ?",
+                (QUEUED, error, time.time(), int(refund_attempt), job_id, worker, RUNNING),
+            )
+
+    def set_callback_status(self, job_id: str, callback_status: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id)
+            )
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs that finished before a given time"""
+        with self._lock:
+            return self._connection().execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, older_than)
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)} | dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_store = JobStore(cache_file("jobs.sqlite3"))
+
+_handlers: Dict[str, Handler] = {}
+
+# Worker tasks of this process, callback deliveries still in flight, and
+# the event submit() sets to wake an idle worker at once
+_workers: List[asyncio.Task] = []
+_callbacks: Set[asyncio.Task] = set()
+_wakeup: Optional[asyncio.Event] = None
+
+# Finished jobs are purged at most this often
+PURGE_INTERVAL_SECONDS = 600
+_last_purge = 0.0
+
+_stats = {
+    "submitted": 0,
+    "started": 0,
+    "done": 0,
+    "failed": 0,
+    "retried": 0,
+    "taken_over": 0,
+    "leases_lost": 0,
+    "callbacks_delivered": 0,
+    "callbacks_failed": 0,
+    "queue_seconds": 0.0,
+    "run_seconds": 0.0,
+}
+
+
+def register(kind: str, handler: Handler) -> None:
+    """Register the coroutine function that runs jobs of one kind"""
+    _handlers[kind] = handler
+
+
+def job_url(job_id: str) -> str:
+    """Relative URL clients poll for a job"""
+    return f"/api/jobs/{job_id}"
+
+
+def public(job: Dict) -> Dict:
+    """A job as returned to clients (no payload or worker details)"""
+    return {
+        "job_id": job["id"],
+        "job_url": job_url(job["id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        "error": job["error"],
+        "callback_status": job["callback_status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+def _public_address(address: str) -> bool:
+    """Whether an IP address is on the public internet (not private, loopback, link-local...)"""
+    try:
+        return ipaddress.ip_address(address.split("%", 1)[0]).is_global
+    except ValueError:
+        return False
+
+
+def callback_allowed(url: str) -> bool:
+    """
+    Whether completion callbacks may be sent to a URL.
+
+    It must be http(s) on a host in JOB_CALLBACK_ALLOWED_HOSTS (callbacks are
+    off while that is empty) and not a private or loopback IP address; host
+    names are checked again against their resolved addresses on delivery.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    allowed = [host.strip().lower() for host in settings.JOB_CALLBACK_ALLOWED_HOSTS.split(",") if host.strip()]
+    if parts.hostname.lower() not in allowed:
+        return False
+    try:
+        ipaddress.ip_address(parts.hostname)
+    except ValueError:
+        return True
+    return _public_address(parts.hostname)
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    """IP addresses a host name resolves to"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def _callback_client() -> httpx.AsyncClient:
+    """
+    Client for one callback delivery.
+
+    Callback hosts are client-supplied, so they get a short-lived client
+    rather than a pooled per-origin one (those are kept for Azure), and
+    redirects are not followed.
+    """
+    return httpx.AsyncClient(timeout=settings.JOB_CALLBACK_TIMEOUT_SECONDS, follow_redirects=False)
+
+
+def submit(kind: str, params: Dict, payload: bytes, callback_url: Optional[str] = None) -> Dict:
+    """
+    Queue a job for the worker pool.
+
+    Args:
+        kind: Registered job kind (e.g. "diagnose")
+        params: JSON-serializable handler parameters
+        payload: Binary input (e.g. the prepared image)
+        callback_url: URL POSTed the finished job, if any
+
+    Returns:
+        The queued job (public fields)
+
+    Raises:
+        ValueError: Unknown kind, or a callback URL that is not allowed
+            (or callbacks are disabled)
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if callback_url and not settings.JOB_CALLBACK_ALLOWED_HOSTS.strip():
+        raise ValueError("Callbacks are disabled on this server")
+    if callback_url and not callback_allowed(callback_url):
+        raise ValueError("Callback URL must be http(s) on an allowed, public host")
+    job = _store.create(kind, params, payload, callback_url or None)
+    _stats["submitted"] += 1
+    if _wakeup is not None:
+        _wakeup.set()
+    return public(job)
+
+
+def get(job_id: str) -> Optional[Dict]:
+    """A job's public fields, from any worker, or None for an unknown id"""
+    job = _store.get(job_id)
+    return public(job) if job is not None else None
+
+
+async def run_next(worker: str) -> bool:
+    """
+    Claim and run one job.
+
+    Returns:
+        False if no job was waiting
+    """
+    job, taken_over = await asyncio.to_thread(
+        _store.claim, worker, settings.JOB_LEASE_SECONDS, settings.JOB_MAX_ATTEMPTS
+    )
+    _stats["taken_over"] += taken_over
+    if job is None:
+        return False
+    await _run(worker, job)
+    return True
+
+
+async def _run(worker: str, job: Dict) -> None:
+    job_id = job["id"]
+    if job["attempts"] == 1:
+        _stats["started"] += 1
+        _stats["queue_seconds"] += time.time() - job["created_at"]
+    started = time.monotonic()
+
+    def progress(stage: str, fraction: float) -> None:
+        try:
+            _store.progress(job_id, worker, stage, fraction)
+        except Exception as e:
+            print(f"Job {job_id[:8]} progress not saved: {str(e)}")
+
+    lease_lost = False
+
+    async def heartbeat(running: asyncio.Task) -> None:
+        # Keep the lease while the handler runs, however long a stage takes;
+        # if another worker has taken the job over, stop running it here
+        nonlocal lease_lost
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 4)
+            try:
+                renewed = await asyncio.to_thread(_store.renew, job_id, worker)
+            except Exception as e:
+                print(f"Job {job_id[:8]} lease not renewed: {str(e)}")
+                continue
+            if not renewed:
+                lease_lost = True
+                running.cancel()
+                return
+
+    try:
+        handler = _handlers.get(job["kind"])
+        if handler is None:
+            raise RuntimeError(f"No handler for {job['kind']} jobs")
+        running = asyncio.get_running_loop().create_task(handler(job["params"], job["payload"], progress))
+        beat = asyncio.get_running_loop().create_task(heartbeat(running))
+        try:
+            result = await running
+        finally:
+            beat.cancel()
+    except asyncio.CancelledError:
+        if lease_lost and not asyncio.current_task().cancelling():
+            # The job is another worker's now; its outcome is theirs to store
+            print(f"Job {job_id[:8]} lease lost, attempt {job['attempts']} abandoned")
+            _stats["leases_lost"] += 1
+            return
+        # Worker stopping: leave the job for the next worker to start
+        _store.requeue(job_id, worker, refund_attempt=True)
+        raise
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        print(f"Job {job_id[:8]} attempt {job['attempts']} failed: {error}")
+        if job["attempts"] < settings.JOB_MAX_ATTEMPTS:
+            _stats["retried"] += 1
+            _store.requeue(job_id, worker, error)
+            return
+        finished = await asyncio.to_thread(_store.finish, job_id, worker, FAILED, error=error)
+        _stats["failed"] += finished
+    else:
+        finished = await asyncio.to_thread(_store.finish, job_id, worker, DONE, result=result)
+        _stats["done"] += finished
+    finally:
+        _stats["run_seconds"] += time.monotonic() - started
+
+    if finished and job["callback_url"]:
+        task = asyncio.get_running_loop().create_task(
+            _deliver_callback(job_id, job["callback_url"]), context=contextvars.Context()
+        )
+        _callbacks.add(task)
+        task.add_done_callback(_callbacks.discard)
+
+
+async def _deliver_callback(job_id: str, url: str) -> None:
+    """
+    POST the finished job to its callback URL, retrying with backoff.
+
+    The request goes to the address that was just checked rather than
+    letting the client resolve the host again (a DNS answer that changes
+    in between could point it at an internal address); the Host header and
+    TLS server name stay those of the URL.
+    """
+    body = await asyncio.to_thread(get, job_id)
+    outcome = "failed"
+    parts = urlsplit(url)
+    target = httpx.URL(url)
+    async with _callback_client() as client:
+        for attempt in range(settings.JOB_CALLBACK_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                # Checked on every attempt: the allow list or DNS may have changed
+                addresses = await _resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+                if not addresses or not callback_allowed(url) or not all(
+                    _public_address(address) for address in addresses
+                ):
+                    outcome = "failed: callback host not allowed"
+                    break
+                response = await client.post(
+                    target.copy_with(host=addresses[0].split("%", 1)[0]),
+                    json=body,
+                    headers={"Host": target.netloc.decode("ascii")},
+                    extensions={"sni_hostname": target.host},
+                )
+                if response.status_code < 400:
+                    outcome = "delivered"
+                    break
+                outcome = f"failed: HTTP {response.status_code}"
+            except Exception as e:
+                outcome = f"failed: {str(e) or type(e).__name__}"
+    _stats["callbacks_delivered" if outcome == "delivered" else "callbacks_failed"] += 1
+    try:
+        await asyncio.to_thread(_store.set_callback_status, job_id, outcome)
+    except Exception as e:
+        print(f"Job {job_id[:8]} callback status not saved: {str(e)}")
+
+
+async def _work(worker: str) -> None:
+    """Worker loop: run jobs until cancelled, idling until woken or the next poll"""
+    global _last_purge
+    while True:
+        _wakeup.clear()
+        try:
+            ran = await run_next(worker)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker {worker} error: {str(e)}")
+            ran = False
+        if ran:
+            continue
+        if time.time() - _last_purge > PURGE_INTERVAL_SECONDS:
+            _last_purge = time.time()
+            try:
+                _store.purge(time.time() - settings.JOB_TTL_SECONDS)
+            except Exception as e:
+                print(f"Job purge failed: {str(e)}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), settings.JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def startup() -> None:
+    """Start this process's worker pool (called from app lifespan)"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    for number in range(settings.JOB_WORKERS):
+        _workers.append(asyncio.create_task(_work(f"{prefix}-{number}"), context=contextvars.Context()))
+
+
+async def shutdown() -> None:
+    """Stop the workers; their running jobs go back to the queue for the next start"""
+    global _wakeup
+    tasks = _workers + list(_callbacks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _wakeup = None
+
+
+def queue_stats() -> Dict:
+    """Queue depth and job outcomes for the metrics endpoint"""
+    try:
+        counts = _store.counts()
+    except Exception as e:
+        print(f"Job store read failed: {str(e)}")
+        counts = {}
+    runs = _stats["done"] + _stats["failed"] + _stats["retried"]
+    started = _stats["started"]
+    return {
+        "workers": len(_workers),
+        "jobs": counts,
+        **{key: _stats[key] for key in (
+            "submitted", "done", "failed", "retried", "taken_over", "leases_lost", "callbacks_delivered", "callbacks_failed"
+        )},
+        "avg_queue_seconds": round(_stats["queue_seconds"] / started, 3) if started else 0.0,
+        "avg_run_seconds": round(_stats["run_seconds"] / runs, 3) if runs else 0.0,
+    }
@@ -0,0 +1,269 @@
+"""
+Crop Knowledge Index
+Inverted index over the crop knowledge base (app/crop_knowledge.json):
+symptom and name tokens -> weighted candidate diseases and pests, per crop
+and season, so likely problems are ranked from Vision tags in microseconds
+"""
+
+import math
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.models import CROP_KNOWLEDGE, CropType, Season
+
+# A matched symptom says more than a word that merely appears in a name;
+# problems known to peak in the current season get a boost
+SYMPTOM_WEIGHT = 2.0
+NAME_WEIGHT = 1.0
+SEASON_BOOST = 1.5
+
+# Candidates scoring below this share of the best one are dropped
+RELATIVE_CUTOFF = 0.25
+
+STOP_WORDS = {
+    "a", "an", "and", "the", "of", "on", "in", "to", "from", "with", "at", "or", "no",
+    "my", "is", "are", "it", "its", "what", "why", "how", "this", "these", "plant", "crop",
+}
+
+# Words of problem names too common in tags to identify the problem
+GENERIC_NAME_WORDS = {
+    "leaf", "common", "northern", "southern", "african", "early", "late", "lethal",
+    "gray", "black", "brown", "yellow", "disease", "virus",
+} | {crop.value for crop in CropType}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word stems, without stop words"""
+    tokens = []
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in STOP_WORDS or len(word) < 3:
+            continue
+        tokens.append(_stem(word))
+    return tokens
+
+
+def _stem(word: str) -> str:
+    """Crude stemming so 'wilting', 'wilted' and 'wilts' all match 'wilt'"""
+    if word == "leaves":
+        return "leaf"
+    for suffix, replacement in (
+        ("ies", "y"), ("oes", "o"), ("ches", "ch"), ("shes", "sh"), ("ing", ""), ("ed", ""), ("s", "")
+    ):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+@dataclass(frozen=True)
+class Problem:
+    """A disease or pest of one crop"""
+    crop: CropType
+    name: str
+    kind: str  # "disease" or "pest"
+    category: str  # "fungal", "viral", "bacterial" or "pest"
+    symptoms: Tuple[str, ...]
+    seasons: Tuple[Season, ...]
+    name_tokens: FrozenSet[str]
+
+
+@dataclass
+class Match:
+    """A ranked candidate with the query tokens that point at it"""
+    problem: Problem
+    score: float
+    matched: List[str]
+
+    @property
+    def names_problem(self) -> bool:
+        """A distinctive word of the problem's own name was matched"""
+        return bool(self.problem.name_tokens.intersection(self.matched))
+
+    def describe(self) -> str:
+        """One prompt line: name, crop, kind and the symptoms to look for"""
+        problem = self.problem
+        return f"{problem.name} ({problem.crop.value} {problem.kind}): {'; '.join(problem.symptoms)}"
+
+
+# Postings: token -> [(problem number, weight)]
+Postings = Dict[str, List[Tuple[int, float]]]
+
+
+class KnowledgeIndex:
+    """
+    Symptom index over the knowledge base.
+
+    One postings table is precomputed per (crop, season) pair, including
+    "any crop" and "any season", with the crop filter and season boost
+    already applied, so ranking is a dictionary lookup per query token.
+    Token weights are scaled by inverse document frequency: "leaf" appears
+    in half the entries and says little, "whorl" points at one pest.
+    """
+
+    def __init__(self, knowledge: Dict[CropType, dict]):
+        self.problems: List[Problem] = []
+        self.aliases: Dict[str, CropType] = {}
+        for crop, info in knowledge.items():
+            self.aliases[crop.value] = crop
+            for alias in info.get("aliases", []):
+                self.aliases[_stem(alias.lower())] = crop
+            for entry in info["problems"]:
+                self.problems.append(Problem(
+                    crop=crop,
+                    name=entry["name"],
+                    kind=entry["kind"],
+                    category=entry["category"],
+                    symptoms=tuple(entry["symptoms"]),
+                    seasons=tuple(Season(season) for season in entry.get("seasons", [])),
+                    name_tokens=frozenset(tokenize(entry["name"])) - GENERIC_NAME_WORDS - set(self.aliases),
+                ))
+
+        base = self._base_postings()
+        self._postings: Dict[Tuple[Optional[CropType], Optional[Season]], Postings] = {}
+        for crop in [None] + list(knowledge):
+            for season in [None] + list(Season):
+                self._postings[(crop, season)] = self._filtered(base, crop, season)
+
+    def _base_postings(self) -> Postings:
+        """token -> [(problem number, IDF-scaled weight)] over every problem"""
+        weights: List[Dict[str, float]] = []
+        for problem in self.problems:
+            token_weights = {token: NAME_WEIGHT for token in problem.name_tokens}
+            for symptom in problem.symptoms:
+                for token in tokenize(symptom):
+                    token_weights[token] = max(token_weights.get(token, 0.0), SYMPTOM_WEIGHT)
+            weights.append(token_weights)
+
+        document_frequency: Dict[str, int] = defaultdict(int)
+        for token_weights in weights:
+            for token in token_weights:
+                document_frequency[token] += 1
+
+        total = len(self.problems)
+        postings: Postings = defaultdict(list)
+        for number, token_weights in enumerate(weights):
+            for token, weight in token_weights.items():
+                idf = 1 + math.log(total / document_frequency[token])
+                postings[token].append((number, weight * idf))
+        return dict(postings)
+
+    def _filtered(self, base: Postings, crop: Optional[CropType], season: Optional[Season]) -> Postings:
+        """Base postings restricted to one crop and boosted for one season"""
+        postings: Postings = {}
+        for token, entries in base.items():
+            kept = []
+            for number, weight in entries:
+                problem = self.problems[number]
+                if crop is not None and problem.crop != crop:
+                    continue
+                if season is not None and season in problem.seasons:
+                    weight *= SEASON_BOOST
+                kept.append((number, round(weight, 4)))
+            if kept:
+                postings[token] = kept
+        return postings
+
+    def detect_crop(self, tokens: Iterable[str]) -> Optional[CropType]:
+        """Crop named (or aliased) in the tokens, if any"""
+        for token in tokens:
+            if token in self.aliases:
+                return self.aliases[token]
+        return None
+
+    def rank(
+        self,
+        tags: List[str],
+        query: str = "",
+        crop: Optional[CropType] = None,
+        season: Optional[Season] = None,
+        limit: int = 5
+    ) -> List[Match]:
+        """
+        Rank candidate problems for the detected tags and the question.
+
+        Args:
+            tags: Detected image tags
+            query: Farmer's question
+            crop: Crop, if known (otherwise taken from the tags/question)
+            season: Current season, if known
+            limit: Number of candidates to return
+
+        Returns:
+            Best matches first (those far behind the best are dropped);
+            ties go to the problem listed first for its crop
+        """
+        tokens = [token for text in list(tags) + [query] for token in tokenize(text)]
+        crop = crop or self.detect_crop(tokens)
+        postings = self._postings.get((crop, season)) or self._postings[(None, season)]
+
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, List[str]] = defaultdict(list)
+        for token in dict.fromkeys(tokens):
+            for number, weight in postings.get(token, ()):
+                scores[number] += weight
+                matched[number].append(token)
+
+        best = sorted(scores, key=lambda number: (-scores[number], number))[:limit]
+        if best:
+            cutoff = scores[best[0]] * RELATIVE_CUTOFF
+            best = [number for number in best if scores[number] >= cutoff]
+        return [Match(self.problems[number], round(scores[number], 2), matched[number]) for number in best]
+
+    def snapshot(self) -> Dict:
+        """Index size for the metrics endpoint"""
+        return {
+            "crops": len({problem.crop for problem in self.problems}),
+            "problems": len(self.problems),
+            "tokens": len(self._postings[(None, None)]),
+            "tables": len(self._postings),
+        }
+
+
+# Built by startup() from the app lifespan, or on first use without it
+_index: Optional[KnowledgeIndex] = None
+
+_stats = {
+    "rankings": 0,
+    "total_seconds": 0.0,
+}
+
+
+def startup() -> None:
+    """Build the index once (called from app lifespan)"""
+    get_index()
+
+
+def get_index() -> KnowledgeIndex:
+    """The knowledge index, building it on first use"""
+    global _index
+    if _index is None:
+        _index = KnowledgeIndex(CROP_KNOWLEDGE)
+    return _index
+
+
+def rank(
+    tags: List[str],
+    query: str = "",
+    crop: Optional[CropType] = None,
+    season: Optional[Season] = None,
+    limit: int = 5
+) -> List[Match]:
+    """Rank likely problems with the shared index (see KnowledgeIndex.rank)"""
+    index = get_index()
+    started = time.perf_counter()
+    matches = index.rank(tags, query, crop, season, limit)
+    _stats["rankings"] += 1
+    _stats["total_seconds"] += time.perf_counter() - started
+    return matches
+
+
+def index_stats() -> Dict:
+    """Index size and ranking latency for the metrics endpoint"""
+    rankings = _stats["rankings"]
+    return {
+        **get_index().snapshot(),
+        "rankings": rankings,
+        "avg_us": round(_stats["total_seconds"] / rankings * 1e6, 1) if rankings else 0.0,
+    }
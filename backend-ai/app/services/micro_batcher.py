@@ -0,0 +1,185 @@
+"""
+Micro-Batching
+Coalesces small concurrent calls (e.g. Translator requests for the same
+target language from different diagnoses) into one batched upstream call
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.deadline import SharedDeadline
+
+# Every named batcher, for the metrics endpoint
+_registry: Dict[str, "MicroBatcher"] = {}
+
+# Upper bounds of the batch-size histogram buckets (requests per batch)
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+SendFn = Callable[[List[str], str], Awaitable[List[str]]]
+
+
+class _Batch:
+    """Requests waiting to be sent together for one key"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.chars = 0
+        self.futures: List[asyncio.Future] = []
+        self.offsets: List[int] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.deadline = SharedDeadline()
+
+
+class MicroBatcher:
+    """
+    Collects submissions per key for up to `window_seconds`, or until a batch
+    reaches `max_items` texts or `max_chars` characters, then sends each key's
+    texts in one call and hands every caller its own slice of the results.
+
+    The shared call runs in its own task, so a caller that is cancelled (or
+    cut by its deadline) stops waiting without cancelling the batch for the
+    other callers; a failed call raises in every caller of that batch. The
+    call is bounded by the latest stage deadline among the batch's callers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        send: SendFn,
+        window_seconds: float,
+        max_items: int,
+        max_chars: int
+    ):
+        self.name = name
+        self.send = send
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self._pending: Dict[str, _Batch] = {}
+        self._tasks: set = set()
+        self.batches = 0
+        self.requests = 0
+        self.texts_sent = 0
+        self.flush_reasons = {"window": 0, "max_items": 0, "max_chars": 0}
+        self.histogram = {bucket: 0 for bucket in HISTOGRAM_BUCKETS}
+        self.histogram_overflow = 0
+        _registry[name] = self
+
+    async def submit(self, texts: List[str], key: str) -> List[str]:
+        """
+        Queue texts for the next batch of a key.
+
+        Args:
+            texts: Inputs for this caller
+            key: Batch key (texts are only sent together with the same key)
+
+        Returns:
+            Results for this caller's texts, in order
+        """
+        if not texts:
+            return []
+        if self.window_seconds <= 0:
+            self._record(requests=1, texts=len(texts), reason="window")
+            return await self.send(texts, key)
+
+        batch = self._pending.get(key)
+        chars = sum(len(text) for text in texts)
+        if batch is not None and batch.texts and (
+            len(batch.texts) + len(texts) > self.max_items or batch.chars + chars > self.max_chars
+        ):
+            reason = "max_items" if len(batch.texts) + len(texts) > self.max_items else "max_chars"
+            self._flush(key, reason)
+            batch = None
+
+        if batch is None:
+            batch = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window_seconds, self._flush, key, "window"
+            )
+            self._pending[key] = batch
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark errors as retrieved even if this caller stopped waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        batch.offsets.append(len(batch.texts))
+        batch.texts.extend(texts)
+        batch.chars += chars
+        batch.futures.append(future)
+        batch.deadline.join()
+
+        if len(batch.texts) >= self.max_items:
+            self._flush(key, "max_items")
+        elif batch.chars >= self.max_chars:
+            self._flush(key, "max_chars")
+
+        # shield: a cancelled caller must not cancel the shared result
+        return await asyncio.shield(future)
+
+    def _flush(self, key: str, reason: str) -> None:
+        """Send the pending batch for a key"""
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self._record(requests=len(batch.futures), texts=len(batch.texts), reason=reason)
+
+        # Run outside any caller's context so one caller's deadline does not
+        # cap the call made on behalf of all of them; the latest one does
+        task = asyncio.get_running_loop().create_task(
+            self._send(batch, key), context=batch.deadline.context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: _Batch, key: str) -> None:
+        # Identical texts from different callers are sent once
+        unique = list(dict.fromkeys(batch.texts))
+        try:
+            results = await self.send(unique, key)
+        except BaseException as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+
+        by_text = dict(zip(unique, results))
+        ordered = [by_text[text] for text in batch.texts]
+        ends = batch.offsets[1:] + [len(ordered)]
+        for future, start, end in zip(batch.futures, batch.offsets, ends):
+            if not future.done():
+                future.set_result(ordered[start:end])
+
+    def _record(self, requests: int, texts: int, reason: str) -> None:
+        self.batches += 1
+        self.requests += requests
+        self.texts_sent += texts
+        self.flush_reasons[reason] += 1
+        for bucket in HISTOGRAM_BUCKETS:
+            if requests <= bucket:
+                self.histogram[bucket] += 1
+                break
+        else:
+            self.histogram_overflow += 1
+
+    def stats(self) -> Dict:
+        histogram = {f"le_{bucket}": count for bucket, count in self.histogram.items()}
+        histogram[f"gt_{HISTOGRAM_BUCKETS[-1]}"] = self.histogram_overflow
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts_sent,
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "flush_reasons": dict(self.flush_reasons),
+            "batch_size_histogram": histogram,
+            "window_ms": self.window_seconds * 1000,
+            "max_items": self.max_items,
+            "max_chars": self.max_chars,
+        }
+
+
+def batcher_stats() -> Dict[str, Dict]:
+    """Stats for every named batcher"""
+    return {name: batcher.stats() for name, batcher in _registry.items()}
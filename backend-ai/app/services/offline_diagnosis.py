@@ -0,0 +1,187 @@
+"""
+Offline Rule-Based Diagnosis
+Degraded-mode advice from the crop knowledge index, used when GPT-4 is
+down or misses its time budget
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from app.models import SEVERITY_INDICATORS, CropType, Season, SeverityLevel, get_seasonal_guidance
+from app.services import knowledge_base
+
+# Symptom words that point at a category when no disease name matches
+SYMPTOM_CATEGORIES: Dict[str, str] = {
+    "hole": "pest", "chew": "pest", "insect": "pest", "caterpillar": "pest", "worm": "pest", "larva": "pest",
+    "spot": "fungal", "mold": "fungal", "mould": "fungal", "powder": "fungal", "lesion": "fungal", "rot": "fungal",
+    "mosaic": "viral", "curl": "viral", "mottle": "viral",
+    "dry": "water_stress", "wilt": "water_stress", "scorch": "water_stress",
+}
+
+# Approved organic remedies (same list as the GPT-4 system prompt)
+REMEDIES: Dict[str, Dict[str, List[str]]] = {
+    "fungal": {
+        "today": [
+            "Pick off the spotted leaves and burn or bury them away from the field",
+            "Dust wood ash or lime on the affected plants in the morning",
+        ],
+        "prevention": ["Water at the roots, not the leaves", "Widen plant spacing for airflow", "Rotate crops next season"],
+    },
+    "viral": {
+        "today": [
+            "Pull out and destroy the worst affected plants so the virus does not spread",
+            "Spray neem oil (2 tablespoons per litre of water) to control the insects that carry it",
+        ],
+        "prevention": ["Plant clean seed from healthy plants", "Keep weeds down around the field"],
+    },
+    "bacterial": {
+        "today": [
+            "Remove wilted plants with their roots and burn them",
+            "Do not move soil or water from affected rows to healthy ones",
+        ],
+        "prevention": ["Rotate with a different crop family for two seasons", "Add compost to build healthy soil"],
+    },
+    "pest": {
+        "today": [
+            "Hand-pick the larger pests in the early morning",
+            "Spray neem oil (2 tablespoons per litre of water with a little soap) every 5 days",
+        ],
+        "prevention": ["Use companion planting such as onion or marigold borders", "Check under the leaves twice a week"],
+    },
+    "water_stress": {
+        "today": [
+            "Water deeply in the early morning or evening",
+            "Cover the soil with mulch to keep moisture in",
+        ],
+        "prevention": ["Add compost or manure so the soil holds water", "Plant at the start of the rains"],
+    },
+    "general": {
+        "today": [
+            "Remove the damaged leaves and keep them away from the field",
+            "Spray neem oil (2 tablespoons per litre of water) on the affected plants",
+        ],
+        "prevention": ["Rotate crops each season", "Feed the soil with compost"],
+    },
+}
+
+# One seasonal precaution per SEASONAL_CONTEXT flag
+SEASONAL_TIPS: Dict[str, str] = {
+    "drainage_important": "keep drainage channels open",
+    "irrigation_important": "water regularly",
+    "seed_treatment_important": "treat seed before sowing",
+}
+
+SEVERE_WORDS = set(knowledge_base.tokenize("dead dying rot collapse severe destroyed"))
+MILD_WORDS = set(knowledge_base.tokenize("few small early slight"))
+
+
+def estimate_severity(tokens: Iterable[str], matched_symptoms: int) -> SeverityLevel:
+    """Rough severity from alarming words and how many symptoms match"""
+    tokens = set(tokens)
+    if tokens & SEVERE_WORDS or matched_symptoms >= 4:
+        return SeverityLevel.SEVERE
+    if tokens & MILD_WORDS and matched_symptoms <= 1:
+        return SeverityLevel.MILD
+    return SeverityLevel.MODERATE
+
+
+@dataclass
+class OfflineDiagnosis:
+    """Result of the rule-based engine"""
+    text: str
+    problem: Optional[str]
+    category: str
+    crop: Optional[CropType]
+    severity: SeverityLevel
+    matched_symptoms: List[str]
+    confidence: float
+
+
+def diagnose(
+    tags: List[str],
+    query: str = "",
+    crop: Optional[CropType] = None,
+    season: Optional[Season] = None
+) -> OfflineDiagnosis:
+    """
+    Diagnose from Vision tags and the farmer's question without any model.
+
+    The best candidate from the knowledge index picks the templated
+    organic remedies. It is only named when the match is specific: a word
+    of its own name, or several symptoms of the known crop.
+
+    Args:
+        tags: Detected image tags
+        query: Farmer's question
+        crop: Crop, if known (otherwise taken from the tags/question)
+        season: Current season, if known
+
+    Returns:
+        OfflineDiagnosis with advice text under 100 words
+    """
+    tokens = [token for text in list(tags) + [query] for token in knowledge_base.tokenize(text)]
+    crop = crop or knowledge_base.get_index().detect_crop(tokens)
+    matches = knowledge_base.rank(tags, query, crop, season, limit=1)
+    best = matches[0] if matches else None
+
+    if best is not None and (best.names_problem or (crop is not None and len(best.matched) >= 2)):
+        problem, category = best.problem.name, best.problem.category
+        matched_symptoms = sorted(best.matched)
+        confidence = round(min(0.3 + 0.1 * len(matched_symptoms), 0.6), 2)
+    else:
+        problem = None
+        category = next((SYMPTOM_CATEGORIES[t] for t in tokens if t in SYMPTOM_CATEGORIES), "general")
+        matched_symptoms = sorted({t for t in tokens if t in SYMPTOM_CATEGORIES})
+        confidence = 0.2 if matched_symptoms else 0.1
+
+    severity = estimate_severity(tokens, len(matched_symptoms))
+    text = render_advice(problem, category, crop, severity, matched_symptoms, season)
+    return OfflineDiagnosis(text, problem, category, crop, severity, matched_symptoms, confidence)
+
+
+def render_advice(
+    problem: Optional[str],
+    category: str,
+    crop: Optional[CropType],
+    severity: SeverityLevel,
+    matched_symptoms: List[str],
+    season: Optional[Season] = None
+) -> str:
+    """Templated organic-remedy advice (kept under 100 words)"""
+    remedies = REMEDIES[category]
+    severity_info = SEVERITY_INDICATORS[severity]
+    crop_name = crop.value if crop else "crop"
+
+    if problem:
+        opening = f"Your {crop_name} may have {problem} ({severity.value})."
+    else:
+        opening = f"Your {crop_name} shows signs of a {category.replace('_', ' ')} problem ({severity.value})."
+    if matched_symptoms:
+        opening += f" Signs seen: {', '.join(matched_symptoms[:3])}."
+
+    steps = " ".join(f"{i}. {step}." for i, step in enumerate(remedies["today"], 1))
+    return (
+        f"{opening} {severity_info['action_urgency']}: {steps} "
+        f"Prevention: {remedies['prevention'][0]}. "
+        f"{seasonal_note(season)}"
+        f"Expect improvement in {severity_info['recovery_timeline']}. "
+        "This is a quick offline check; ask again later for a full diagnosis."
+    )
+
+
+def seasonal_note(season: Optional[Season]) -> str:
+    """
+    The season's main risks and precaution, from the SEASONAL_CONTEXT the
+    GPT-4 prompt uses ("" without a season)
+    """
+    season_info = get_seasonal_guidance(season) if season else {}
+    if not season_info:
+        return ""
+    note = f"{Season(season).value.replace('_', ' ').capitalize()}: watch for {' and '.join(season_info['main_risks'][:2])}"
+    tip = next((tip for flag, tip in SEASONAL_TIPS.items() if season_info.get(flag)), None)
+    return f"{note}; {tip}. " if tip else f"{note}. "
+
+
+def advise(tags: List[str], query: str = "", **context) -> str:
+    """Advice text only (drop-in for gpt4.get_agronomist_advice)"""
+    return diagnose(tags, query, **context).text
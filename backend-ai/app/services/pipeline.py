@@ -0,0 +1,293 @@
+"""
+Staged Pipeline Executor
+Runs a pipeline declared as a DAG of stages: each stage names the stages
+whose results it needs, independent stages run concurrently, and each
+stage's time budget, retries, fallback and progress event are declared
+with it instead of being hand-coded in every router
+"""
+
+import asyncio
+import inspect
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.deadline import Deadline
+
+
+class PipelineRun:
+    """
+    State of one pipeline run, handed to every stage.
+
+    Attributes:
+        inputs: Request inputs (image, question, language...)
+        deadline: Time budget shared by the timed stages
+        results: Result of each finished stage, by stage name
+        fallback_stages: Stages that were served by their fallback, in order
+        state: Per-run objects stages share (e.g. a speech pipeline)
+    """
+
+    def __init__(self, inputs: Dict[str, Any], deadline: Deadline, events: Optional[asyncio.Queue] = None):
+        self.inputs = inputs
+        self.deadline = deadline
+        self.events = events
+        self.results: Dict[str, Any] = {}
+        self.fallback_stages: List[str] = []
+        self.state: Dict[str, Any] = {}
+
+    def __getitem__(self, stage: str) -> Any:
+        return self.results[stage]
+
+    @property
+    def cut_stages(self) -> List[str]:
+        """Stages cut off by the deadline"""
+        return self.deadline.cut_stages
+
+    def emit(self, event: str, data: Any) -> None:
+        """Put a progress event on the run's queue, if it has one"""
+        if self.events is not None:
+            self.events.put_nowait((event, data))
+
+
+StageFunc = Callable[[PipelineRun], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One step of a pipeline.
+
+    Attributes:
+        name: Unique name; timed stages also use it as their Deadline share
+        run: Coroutine function (run) -> result
+        after: Stages whose results this one needs
+        timed: Run within the stage's share of the deadline (off for
+            bookkeeping steps such as logging)
+        optional: Give `default` instead of failing when cut off by the deadline
+        default: Result of an optional stage that was cut off
+        retries: Extra attempts after an error, within the same time budget
+            (never when the dependency's breaker is open)
+        fallback: (run, error) -> result used when the stage fails with one
+            of `fallback_on`; the stage is then listed in run.fallback_stages
+        fallback_on: Errors the fallback covers
+        when: (run) -> bool, decided from run.inputs before any stage starts;
+            when False the stage does not run, its deadline share goes to
+            the others from the start and its result is `otherwise(run)`
+        otherwise: (run) -> result (or awaitable) of a stage that did not
+            run, called once its dependencies have finished
+        event: Progress event sent with the stage's result
+        event_data: (run, result) -> event payload (default: the result)
+    """
+    name: str
+    run: StageFunc
+    after: Tuple[str, ...] = ()
+    timed: bool = True
+    optional: bool = False
+    default: Any = None
+    retries: int = 0
+    fallback: Optional[Callable[[PipelineRun, Exception], Any]] = None
+    fallback_on: Tuple[Type[BaseException], ...] = (Exception,)
+    when: Optional[Callable[[PipelineRun], bool]] = None
+    otherwise: Optional[Callable[[PipelineRun], Any]] = None
+    event: Optional[str] = None
+    event_data: Optional[Callable[[PipelineRun, Any], Any]] = None
+
+
+# Per-stage counters for the metrics endpoint, by pipeline and stage name
+_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {
+    "runs": 0, "skipped": 0, "retries": 0, "fallbacks": 0, "failures": 0, "total_seconds": 0.0,
+})
+
+
+class Pipeline:
+    """
+    A named DAG of stages.
+
+    The definition is checked when the pipeline is built (unknown
+    dependencies, duplicate names, cycles), so a broken pipeline fails at
+    import time rather than on a request.
+
+    Args:
+        name: Pipeline name (prefix of its stage metrics)
+        stages: The stages, in any order
+        cleanup: (run) -> None called when a run ends, whether it finished
+            or failed (e.g. to cancel background work stages left behind)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stages: Iterable[Stage],
+        cleanup: Optional[Callable[[PipelineRun], None]] = None
+    ):
+        self.name = name
+        self.cleanup = cleanup
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Pipeline {name}: duplicate stage {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            unknown = set(stage.after) - set(self.stages)
+            if unknown:
+                raise ValueError(f"Pipeline {name}: {stage.name} depends on unknown stage(s) {sorted(unknown)}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting: set = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline {self.name}: dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def with_stages(self, name: str, *stages: Stage, without: Iterable[str] = ()) -> "Pipeline":
+        """
+        A variant of this pipeline.
+
+        Args:
+            name: Name of the new pipeline
+            *stages: Stages to add; a stage with an existing name replaces it
+            without: Names of stages to leave out
+        """
+        merged = {stage.name: stage for stage in self.stages.values() if stage.name not in set(without)}
+        merged.update({stage.name: stage for stage in stages})
+        return Pipeline(name, merged.values(), self.cleanup)
+
+    async def run(
+        self,
+        inputs: Dict[str, Any],
+        deadline: Optional[Deadline] = None,
+        events: Optional[asyncio.Queue] = None
+    ) -> PipelineRun:
+        """
+        Run every stage, each as soon as the stages it needs have finished.
+
+        Args:
+            inputs: Request inputs, available to stages as run.inputs
+            deadline: Time budget (a fresh default Deadline if not given)
+            events: Queue for the stages' progress events
+
+        Returns:
+            The finished run (results, fallback and cut stages)
+
+        Raises:
+            The error of the first stage that failed without a fallback;
+            stages still running are cancelled
+        """
+        run = PipelineRun(inputs, deadline or Deadline(), events)
+        # Stages that will not run give up their deadline share up front
+        skipped = {name for name, stage in self.stages.items() if stage.when is not None and not stage.when(run)}
+        for name in skipped:
+            if self.stages[name].timed:
+                run.deadline.skip(name)
+
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            for name in self.order:
+                stage = self.stages[name]
+                tasks[name] = asyncio.create_task(self._run_stage(
+                    stage, run, [tasks[dependency] for dependency in stage.after], name in skipped
+                ))
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            # Retrieve every outcome so failed stages are not reported twice
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            if self.cleanup is not None:
+                self.cleanup(run)
+        return run
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        run: PipelineRun,
+        dependencies: List[asyncio.Task],
+        skipped: bool
+    ) -> None:
+        if dependencies:
+            # wait() rather than awaiting the tasks: a cancelled stage must
+            # not cancel the stages it depends on
+            await asyncio.wait(dependencies)
+            for dependency in dependencies:
+                dependency.result()
+
+        stats = _stats[f"{self.name}.{stage.name}"]
+        if skipped:
+            stats["skipped"] += 1
+            result = stage.otherwise(run) if stage.otherwise is not None else stage.default
+            if inspect.isawaitable(result):
+                result = await result
+        else:
+            stats["runs"] += 1
+            started = time.monotonic()
+            try:
+                if stage.timed:
+                    result = await run.deadline.run(
+                        stage.name, self._attempts, stage, run, stats,
+                        optional=stage.optional, default=stage.default
+                    )
+                else:
+                    result = await self._attempts(stage, run, stats)
+            except stage.fallback_on as e:
+                if stage.fallback is None:
+                    stats["failures"] += 1
+                    raise
+                print(f"Pipeline {self.name}: {stage.name} stage fell back: {str(e) or type(e).__name__}")
+                stats["fallbacks"] += 1
+                result = stage.fallback(run, e)
+                if inspect.isawaitable(result):
+                    result = await result
+                run.fallback_stages.append(stage.name)
+            except Exception:
+                stats["failures"] += 1
+                raise
+            finally:
+                stats["total_seconds"] += time.monotonic() - started
+
+        run.results[stage.name] = result
+        if stage.event is not None:
+            run.emit(stage.event, stage.event_data(run, result) if stage.event_data is not None else result)
+
+    @staticmethod
+    async def _attempts(stage: Stage, run: PipelineRun, stats: Dict[str, float]) -> Any:
+        for attempt in range(stage.retries + 1):
+            try:
+                return await stage.run(run)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if attempt == stage.retries:
+                    raise
+                stats["retries"] += 1
+                print(f"Pipeline: {stage.name} attempt {attempt + 1} failed, retrying: {str(e)}")
+
+
+def pipeline_stats() -> Dict[str, Dict]:
+    """Runs, skips, retries, fallbacks, failures and time per pipeline stage"""
+    return {
+        key: {
+            "runs": int(stats["runs"]),
+            "skipped": int(stats["skipped"]),
+            "retries": int(stats["retries"]),
+            "fallbacks": int(stats["fallbacks"]),
+            "failures": int(stats["failures"]),
+            "avg_seconds": round(stats["total_seconds"] / stats["runs"], 3) if stats["runs"] else 0.0,
+        }
+        for key, stats in sorted(_stats.items())
+    }
@@ -0,0 +1,224 @@
+"""
+Single-Flight Call Coalescing
+Concurrent identical calls (double-tapped submit, bot retries) share one
+in-flight Azure request instead of each paying for their own
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.services.deadline import SharedDeadline
+
+# Every named group, for the metrics endpoint
+_registry: Dict[str, Any] = {}
+
+
+class _Flight:
+    """One in-flight call and the number of callers waiting on it"""
+
+    def __init__(self, deadline: SharedDeadline):
+        self.deadline = deadline
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving while it is in
+    flight await the same result (or exception).
+
+    The call runs in its own task, so a caller that is cancelled or cut by
+    its deadline only stops waiting; the call itself is cancelled once no
+    caller is left waiting for it, and is bounded by the latest stage
+    deadline among the callers that joined it. Results are not kept after
+    the call finishes (caching is the caller's job).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        _registry[name] = self
+
+    async def do(self, key: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Call func(*args, **kwargs), or join the identical call already running.
+
+        Args:
+            key: Canonical inputs of the call (same key = same result)
+            func: Coroutine function doing the work
+
+        Returns:
+            The (shared) result of func
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(SharedDeadline())
+            flight.deadline.join()
+            # Run outside the first caller's context so its deadline does not
+            # cap the call made on behalf of later callers
+            flight.task = asyncio.get_running_loop().create_task(
+                func(*args, **kwargs), context=flight.deadline.context()
+            )
+            flight.task.add_done_callback(lambda done, key=key, flight=flight: self._finished(key, flight))
+            self.executions += 1
+        else:
+            flight.deadline.join()
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting any more; don't let new callers join a
+                # call that is being cancelled
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for key is running now"""
+        return key in self._flights
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finished(self, key: str, flight: _Flight) -> None:
+        self._forget(key, flight)
+        # Mark the exception as retrieved even if every caller stopped waiting
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._flights),
+        }
+
+
+class _StreamFlight:
+    """One in-flight stream: the pieces produced so far and its readers"""
+
+    def __init__(self):
+        self.parts: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self.deadline = SharedDeadline()
+        self.task: Optional[asyncio.Task] = None
+        # Set (and replaced) whenever a piece arrives or the stream ends
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlightStream:
+    """
+    SingleFlight for streamed calls: at most one upstream stream per key.
+
+    Callers arriving while it runs get every piece from the start (replayed
+    from a buffer) and then the rest as it arrives, so a follower sees the
+    same token stream as the caller that started it. As with SingleFlight,
+    the stream runs in its own task under the readers' latest deadline and
+    is cancelled once nobody is reading.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _StreamFlight] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        _registry[name] = self
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a stream for key is running now"""
+        return key in self._flights
+
+    async def stream(self, key: str, func: Callable[..., AsyncIterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Iterate func(*args, **kwargs), or join the identical stream already running.
+
+        Args:
+            key: Canonical inputs of the call (same key = same stream)
+            func: Async generator function producing the pieces
+
+        Yields:
+            Every piece of the (shared) stream, in order
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _StreamFlight()
+            flight.deadline.join()
+            # Outside the first caller's context, as in SingleFlight.do
+            flight.task = asyncio.get_running_loop().create_task(
+                self._pump(key, flight, func, args, kwargs), context=flight.deadline.context()
+            )
+            self.executions += 1
+        else:
+            flight.deadline.join()
+            self.coalesced += 1
+
+        flight.readers += 1
+        index = 0
+        try:
+            while True:
+                changed = flight.changed
+                while index < len(flight.parts):
+                    index += 1
+                    yield flight.parts[index - 1]
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+
+    async def _pump(self, key: str, flight: _StreamFlight, func, args, kwargs) -> None:
+        try:
+            async for piece in func(*args, **kwargs):
+                flight.parts.append(piece)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            flight.notify()
+
+    def _forget(self, key: str, flight: _StreamFlight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._flights),
+        }
+
+
+def single_flight_stats() -> Dict[str, Dict]:
+    """Stats for every single-flight group"""
+    return {name: group.stats() for name, group in _registry.items()}
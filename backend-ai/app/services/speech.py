@@ -3,16 +3,48 @@ Azure Speech Services and Translator Integration
 Handles text translation and text-to-speech for farmers
 """
 
-import requests
+import asyncio
+import httpx
 import base64
-from typing import Tuple
+from typing import AsyncIterator, Dict, List, Sequence, Tuple, Union
+from xml.sax.saxutils import escape
 from app.config import settings
+from app.services import audio_store, http_client
+from app.services.micro_batcher import MicroBatcher
+from app.services.throttle import Throttle
+from app.services.translation_memory import translation_memory
+
+# Map language codes to voice names
+VOICE_MAP = {
+    "en": "en-US-AvaNeural",
+    "sw": "sw-KE-ZuriNeural",  # Swahili Kenya
+    "ar": "ar-SA-FatimahNeural",  # Arabic Saudi Arabia
+    "fr": "fr-FR-DeniseNeural",  # French
+    "es": "es-ES-AlvaroNeural",  # Spanish
+    "pt": "pt-BR-FranciscaNeural",  # Portuguese Brazil
+}
+DEFAULT_VOICE = VOICE_MAP["en"]
+
+# Translator v3 per-request limits (characters are counted once per target language)
+TRANSLATOR_MAX_ELEMENTS = 1000
+TRANSLATOR_MAX_CHARS = 50000
+
+# Client-side quotas: Translator bills characters, Speech counts requests
+_translator_throttle = Throttle(
+    "translator",
+    requests_per_minute=settings.TRANSLATOR_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.TRANSLATOR_CHARS_PER_MINUTE,
+)
+_speech_throttle = Throttle("speech", requests_per_minute=settings.SPEECH_REQUESTS_PER_MINUTE)
 
 
 async def translate_text(text: str, target_lang: str) -> str:
     """
     Translate text using Azure Translator.
     
+    The text is split into sentences; sentences already in the translation
+    memory are served locally and only the rest are sent to Translator.
+    
     Args:
         text: Text to translate
         target_lang: Target language code (e.g., 'sw', 'ar', 'en')
@@ -20,6 +52,108 @@ async def translate_text(text: str, target_lang: str) -> str:
     Returns:
         Translated text
     """
+    if not text.strip():
+        return text
+    return (await translate_texts([text], target_lang))[0]
+
+
+async def translate_texts(texts: List[str], target_lang: str) -> List[str]:
+    """
+    Translate several texts (e.g. a diagnosis and its action items) at once.
+    
+    Sentences missing from the translation memory are sent to Translator
+    in one batched request.
+    
+    Args:
+        texts: Texts to translate
+        target_lang: Target language code
+    
+    Returns:
+        Translations in the same order as texts
+    """
+    return await translation_memory.translate_many(texts, target_lang, _translate_segments)
+
+
+async def translate_batch(texts: List[str], target_langs: Union[str, Sequence[str]]) -> Dict[str, List[str]]:
+    """
+    Translate many strings into one or more languages with the Translator JSON API.
+    
+    All strings go in a single request body ([{"Text": ...}, ...] with one
+    `to` parameter per language); inputs over Translator's per-request
+    limits are split into as few requests as possible, sent concurrently.
+    
+    Args:
+        texts: Strings to translate
+        target_langs: Target language code, or several
+    
+    Returns:
+        {language: translations in the same order as texts}
+    """
+    langs = [target_langs] if isinstance(target_langs, str) else list(target_langs)
+    results = {lang: list(texts) for lang in langs}
+    
+    # Blank strings are returned as-is rather than spent on the request
+    indexes = [i for i, text in enumerate(texts) if text.strip()]
+    if not indexes or not langs:
+        return results
+    
+    chunks = _batch_chunks([texts[i] for i in indexes], len(langs))
+    responses = await asyncio.gather(*(_translate_request(chunk, langs) for chunk in chunks))
+    
+    translated = [item for response in responses for item in response]
+    for i, item in zip(indexes, translated):
+        for lang in langs:
+            results[lang][i] = item[lang]
+    return results
+
+
+def _batch_chunks(texts: List[str], lang_count: int) -> List[List[str]]:
+    """Split texts so each request stays within Translator's element and character limits"""
+    max_chars = TRANSLATOR_MAX_CHARS // lang_count
+    chunks: List[List[str]] = []
+    chunk: List[str] = []
+    chunk_chars = 0
+    for text in texts:
+        if chunk and (len(chunk) >= TRANSLATOR_MAX_ELEMENTS or chunk_chars + len(text) > max_chars):
+            chunks.append(chunk)
+            chunk, chunk_chars = [], 0
+        chunk.append(text)
+        chunk_chars += len(text)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def _translate_segments(segments: List[str], target_lang: str) -> List[str]:
+    """
+    Translate sentences missing from the translation memory.
+    
+    Concurrent requests for the same language are micro-batched into one
+    Translator call.
+    """
+    return await translation_batcher.submit(segments, target_lang)
+
+
+async def _send_translation_batch(segments: List[str], target_lang: str) -> List[str]:
+    return (await translate_batch(segments, target_lang))[target_lang]
+
+
+translation_batcher = MicroBatcher(
+    "translator",
+    _send_translation_batch,
+    window_seconds=settings.TRANSLATION_BATCH_WINDOW_MS / 1000,
+    max_items=settings.TRANSLATION_BATCH_MAX_ITEMS,
+    max_chars=settings.TRANSLATION_BATCH_MAX_CHARS,
+)
+
+
+async def _translate_request(texts: List[str], target_langs: List[str]) -> List[Dict[str, str]]:
+    """
+    One Translator JSON call.
+    
+    Returns:
+        Per input text, {language: translation}
+    """
     if not settings.AZURE_TRANSLATOR_KEY or not settings.AZURE_TRANSLATOR_ENDPOINT:
         raise ValueError("Azure Translator credentials not configured")
     
@@ -28,35 +162,73 @@ async def translate_text(text: str, target_lang: str) -> str:
     headers = {
         "Ocp-Apim-Subscription-Key": settings.AZURE_TRANSLATOR_KEY,
         "Ocp-Apim-Subscription-Region": settings.AZURE_TRANSLATOR_REGION,
-        "Content-Type": "application/xml"
+        "Content-Type": "application/json"
     }
     
-    params = {
-        "api-version": "3.0",
-        "to": target_lang
-    }
+    params = [("api-version", "3.0")] + [("to", lang) for lang in target_langs]
     
-    body = f'<string xmlns="http://schemas.microsoft.com/2003/10/Serialization/">{text}</string>'
+    body = [{"Text": text} for text in texts]
     
     try:
-        response = requests.post(url, headers=headers, params=params, data=body)
+        response = await _translator_throttle.call(
+            lambda: http_client.post(url, dependency="translator", headers=headers, params=params, json=body),
+            tokens=sum(len(text) for text in texts) * len(target_langs)
+        )
         response.raise_for_status()
         
-        # Parse XML response
-        import xml.etree.ElementTree as ET
-        root = ET.fromstring(response.text)
-        
-        # Extract translated text from XML
-        namespace = {'': 'http://schemas.microsoft.com/2003/10/Serialization/'}
-        translated_text = root.text
+        # [{"translations": [{"text": "...", "to": "sw"}, ...]}, ...] in input
+        # order, with translations in the order of the `to` parameters
+        return [
+            {lang: translation["text"] for lang, translation in zip(target_langs, item["translations"])}
+            for item in response.json()
+        ]
         
-        return translated_text
-        
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error calling Azure Translator API: {str(e)}")
         raise Exception(f"Translation failed: {str(e)}")
 
 
+async def synthesize_audio(text: str, language: str) -> str:
+    """
+    Synthesize speech into the audio store, reusing earlier audio.
+    
+    Identical text in the same voice is only synthesized once; later calls
+    return the stored file's id.
+    
+    Args:
+        text: Text to convert to speech
+        language: Language code (e.g., 'en', 'sw', 'ar')
+    
+    Returns:
+        Audio id (serve with audio_store.audio_url)
+    """
+    voice = voice_for(language)
+    audio_id = audio_store.audio_id(text, voice)
+    if audio_store.exists(audio_id):
+        return audio_id
+    
+    audio_bytes = await _synthesize(text, language, voice)
+    await audio_store.save(audio_id, audio_bytes)
+    return audio_id
+
+
+async def synthesize_bytes(text: str, language: str) -> bytes:
+    """
+    Synthesize speech without storing it.
+    
+    For audio that is only a part of a stored file, such as one sentence
+    of a joined answer.
+    
+    Args:
+        text: Text to convert to speech
+        language: Language code (e.g., 'en', 'sw', 'ar')
+    
+    Returns:
+        MP3 bytes
+    """
+    return await _synthesize(text, language, voice_for(language))
+
+
 async def generate_audio(text: str, language: str) -> str:
     """
     Generate speech audio using Azure Text-to-Speech.
@@ -68,47 +240,113 @@ async def generate_audio(text: str, language: str) -> str:
     Returns:
         Base64 encoded audio string
     """
-    if not settings.AZURE_SPEECH_KEY or not settings.AZURE_SPEECH_REGION:
+    audio_id = await synthesize_audio(text, language)
+    audio_bytes = await audio_store.read(audio_id)
+    return base64.b64encode(audio_bytes).decode('utf-8')
+
+
+def voice_for(language: str) -> str:
+    """Neural voice used for a language code"""
+    return VOICE_MAP.get(language, DEFAULT_VOICE)
+
+
+async def stream_audio(text: str, language: str) -> AsyncIterator[bytes]:
+    """
+    Stream speech audio from Azure Text-to-Speech as it is generated.
+    
+    The MP3 chunks are teed into the audio store, so the finished file is
+    served from disk next time; a stream that does not complete leaves
+    nothing stored. Audio already in the store is read from disk.
+    
+    Args:
+        text: Text to convert to speech
+        language: Language code (e.g., 'en', 'sw', 'ar')
+    
+    Yields:
+        MP3 chunks
+    """
+    voice = voice_for(language)
+    audio_id = audio_store.audio_id(text, voice)
+    if audio_store.exists(audio_id):
+        yield await audio_store.read(audio_id)
+        return
+    
+    url, headers, body = _tts_request(text, language, voice)
+    writer = None
+    try:
+        async with _speech_throttle.stream(
+            lambda: http_client.stream("POST", url, dependency="speech", headers=headers, content=body)
+        ) as response:
+            response.raise_for_status()
+            writer = audio_store.AudioWriter(audio_id)
+            async for chunk in response.aiter_bytes():
+                writer.write(chunk)
+                yield chunk
+        writer.commit()
+        
+    except httpx.HTTPError as e:
+        print(f"Error streaming from Azure Speech API: {str(e)}")
+        raise Exception(f"Audio generation failed: {str(e)}")
+    finally:
+        if writer is not None:
+            writer.discard()
+
+
+async def _synthesize(text: str, language: str, voice: str) -> bytes:
+    """Call Azure Text-to-Speech and return the MP3 bytes"""
+    url, headers, body = _tts_request(text, language, voice)
+    
+    try:
+        response = await _speech_throttle.call(
+            lambda: http_client.post(url, dependency="speech", headers=headers, content=body)
+        )
+        response.raise_for_status()
+        return response.content
+        
+    except httpx.HTTPError as e:
+        print(f"Error calling Azure Speech API: {str(e)}")
+        raise Exception(f"Audio generation failed: {str(e)}")
+
+
+def speech_base_url(service: str) -> str:
+    """
+    Base URL of the Speech REST API.
+    
+    AZURE_SPEECH_ENDPOINT when set (a custom domain or a local stand-in),
+    otherwise the regional host for the service.
+    
+    Args:
+        service: "tts" or "stt"
+    """
+    if not settings.AZURE_SPEECH_KEY or not (settings.AZURE_SPEECH_ENDPOINT or settings.AZURE_SPEECH_REGION):
         raise ValueError("Azure Speech credentials not configured")
+    if settings.AZURE_SPEECH_ENDPOINT:
+        return settings.AZURE_SPEECH_ENDPOINT.rstrip("/")
+    return f"https://{settings.AZURE_SPEECH_REGION}.{service}.speech.microsoft.com"
+
+
+def _tts_request(text: str, language: str, voice: str) -> Tuple[str, Dict[str, str], bytes]:
+    """
+    Build the Text-to-Speech call.
     
-    url = f"https://{settings.AZURE_SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+    Returns:
+        (url, headers, SSML body)
+    """
+    url = f"{speech_base_url('tts')}/cognitiveservices/v1"
     
     headers = {
         "Ocp-Apim-Subscription-Key": settings.AZURE_SPEECH_KEY,
         "Content-Type": "application/ssml+xml",
-        "X-Microsoft-OutputFormat": "audio-16khz-32kbitrate-mono-mp3"
-    }
-    
-    # Map language codes to voice names
-    voice_map = {
-        "en": "en-US-AvaNeural",
-        "sw": "sw-KE-ZuriNeural",  # Swahili Kenya
-        "ar": "ar-SA-FatimahNeural",  # Arabic Saudi Arabia
-        "fr": "fr-FR-DeniseNeural",  # French
-        "es": "es-ES-AlvaroNeural",  # Spanish
-        "pt": "pt-BR-FranciscaNeural",  # Portuguese Brazil
+        "X-Microsoft-OutputFormat": audio_store.OUTPUT_FORMAT
     }
     
-    voice = voice_map.get(language, "en-US-AvaNeural")
-    
     ssml = f"""<speak version='1.0' xml:lang='{language}'>
         <voice name='{voice}'>
-            {text}
+            {escape(text)}
         </voice>
     </speak>"""
     
-    try:
-        response = requests.post(url, headers=headers, data=ssml.encode('utf-8'))
-        response.raise_for_status()
-        
-        # Encode audio to base64
-        audio_base64 = base64.b64encode(response.content).decode('utf-8')
-        
-        return audio_base64
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Azure Speech API: {str(e)}")
-        raise Exception(f"Audio generation failed: {str(e)}")
+    return url, headers, ssml.encode('utf-8')
 
 
 async def speech_to_text(audio_bytes: bytes, language: str = "en") -> str:
@@ -122,10 +360,7 @@ async def speech_to_text(audio_bytes: bytes, language: str = "en") -> str:
     Returns:
         Transcribed text
     """
-    if not settings.AZURE_SPEECH_KEY or not settings.AZURE_SPEECH_REGION:
-        raise ValueError("Azure Speech credentials not configured")
-    
-    url = f"https://{settings.AZURE_SPEECH_REGION}.stt.speech.microsoft.com/speech/recognition/conversation/cognitiveservices/v1"
+    url = f"{speech_base_url('stt')}/speech/recognition/conversation/cognitiveservices/v1"
     
     headers = {
         "Ocp-Apim-Subscription-Key": settings.AZURE_SPEECH_KEY,
@@ -138,7 +373,9 @@ async def speech_to_text(audio_bytes: bytes, language: str = "en") -> str:
     }
     
     try:
-        response = requests.post(url, headers=headers, params=params, data=audio_bytes)
+        response = await _speech_throttle.call(
+            lambda: http_client.post(url, dependency="speech", headers=headers, params=params, content=audio_bytes)
+        )
         response.raise_for_status()
         
         data = response.json()
@@ -149,6 +386,6 @@ async def speech_to_text(audio_bytes: bytes, language: str = "en") -> str:
             error_msg = data.get("DisplayText", "Speech recognition failed")
             raise Exception(f"Speech recognition error: {error_msg}")
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error calling Azure Speech-to-Text API: {str(e)}")
         raise Exception(f"Speech-to-text failed: {str(e)}")
@@ -0,0 +1,146 @@
+"""
+Sentence-Pipelined Translate and Speak
+Translates and voices GPT-4 advice sentence by sentence while later
+sentences are still being generated, then joins the audio in order
+"""
+
+import asyncio
+import contextvars
+from typing import List, Optional, Union
+
+from app.config import settings
+from app.services import audio_store, speech
+from app.services.translation_memory import split_segments
+
+
+class _Sentence:
+    """One sentence and its translate -> speak tasks"""
+
+    def __init__(self, leading: str, text: str, trailing: str):
+        self.leading = leading
+        self.text = text
+        self.trailing = trailing
+        self.translation: Optional[asyncio.Task] = None
+        self.audio: Optional[asyncio.Task] = None
+
+
+class SpeechPipeline:
+    """
+    Feed advice text as it streams in; every completed sentence is
+    translated and then synthesized in the background, with at most
+    `translate_concurrency` Translator and `speech_concurrency` TTS calls
+    at a time.
+
+    Usage:
+        pipeline = SpeechPipeline("sw")
+        async for token in ...:
+            pipeline.feed(token)
+        pipeline.close()
+        translated_text = await pipeline.translation()
+        audio_id = await pipeline.audio()
+    """
+
+    def __init__(
+        self,
+        language: str,
+        translate_concurrency: Optional[int] = None,
+        speech_concurrency: Optional[int] = None,
+    ):
+        self.language = language
+        self.voice = speech.voice_for(language)
+        # Separate limits: a burst of translations must not hold every slot
+        # while finished sentences wait to be voiced (and the other way round)
+        self._translate_slots = asyncio.Semaphore(
+            translate_concurrency or settings.SPEECH_PIPELINE_TRANSLATE_CONCURRENCY
+        )
+        self._speech_slots = asyncio.Semaphore(speech_concurrency or settings.SPEECH_PIPELINE_TTS_CONCURRENCY)
+        # Literal whitespace/separators and sentences, in text order
+        self._parts: List[Union[str, _Sentence]] = []
+        self._buffer = ""
+        self._closed = False
+
+    @property
+    def sentences(self) -> List[_Sentence]:
+        return [part for part in self._parts if isinstance(part, _Sentence)]
+
+    def feed(self, text: str) -> None:
+        """Add generated text; sentences completed by it start processing"""
+        self._buffer += text
+        # [sentence, separator, ..., sentence]: everything before the last
+        # piece is complete, the last may still be growing
+        pieces = split_segments(self._buffer)
+        self._buffer = pieces.pop()
+        for i, piece in enumerate(pieces):
+            self._add(piece, separator=bool(i % 2))
+
+    def close(self) -> None:
+        """Mark the text complete, processing the last sentence"""
+        if not self._closed:
+            self._closed = True
+            self._add(self._buffer, separator=False)
+            self._buffer = ""
+
+    def _add(self, piece: str, separator: bool) -> None:
+        text = piece.strip()
+        if separator or not text:
+            self._parts.append(piece)
+            return
+        start = piece.index(text)
+        sentence = _Sentence(piece[:start], text, piece[start + len(text):])
+        # Own context: the generating stage's deadline must not cap this work
+        sentence.translation = self._spawn(self._translate(sentence.text))
+        sentence.audio = self._spawn(self._speak(sentence.translation))
+        self._parts.append(sentence)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+        # Mark failures as retrieved when the pipeline is abandoned
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    async def _translate(self, text: str) -> str:
+        if self.language == "en":
+            return text
+        async with self._translate_slots:
+            return await speech.translate_text(text, self.language)
+
+    async def _speak(self, translation: asyncio.Task) -> bytes:
+        text = await translation
+        # Kept in memory: only the joined answer is stored
+        async with self._speech_slots:
+            return await speech.synthesize_bytes(text, self.language)
+
+    async def translation(self) -> str:
+        """Translated text, with the original spacing and line breaks"""
+        self.close()
+        await asyncio.gather(*(sentence.translation for sentence in self.sentences))
+        return "".join(
+            part.leading + part.translation.result() + part.trailing if isinstance(part, _Sentence) else part
+            for part in self._parts
+        )
+
+    async def audio(self) -> Optional[str]:
+        """
+        Join the sentence audio (in order) into one stored MP3.
+
+        Returns:
+            Audio id of the full translated text, or None if there is no text
+        """
+        translated_text = await self.translation()
+        if not translated_text.strip():
+            return None
+        audio_id = audio_store.audio_id(translated_text, self.voice)
+        if audio_store.exists(audio_id):
+            # Whole answer voiced before; the sentence audio is not needed
+            self.cancel()
+            return audio_id
+        segments = await asyncio.gather(*(sentence.audio for sentence in self.sentences))
+        await audio_store.save(audio_id, audio_store.concat_mp3(segments))
+        return audio_id
+
+    def cancel(self) -> None:
+        """Stop all outstanding sentence work"""
+        for sentence in self.sentences:
+            for task in (sentence.translation, sentence.audio):
+                if task is not None and not task.done():
+                    task.cancel()
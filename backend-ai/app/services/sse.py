@@ -0,0 +1,56 @@
+"""
+Server-Sent Events Helpers
+Formatting and relaying of pipeline progress for the streaming endpoints
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator
+
+# Keep proxies (nginx, Heroku router) from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Encode one SSE message.
+
+    Args:
+        event: Event name (the client's addEventListener type)
+        data: JSON-serializable payload
+
+    Returns:
+        "event: ...\\ndata: {...}\\n\\n"
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def relay(task: asyncio.Task, queue: asyncio.Queue) -> AsyncIterator[Any]:
+    """
+    Yield items a task puts on a queue while it runs.
+
+    Stops once the task has finished and the queue is drained, re-raising
+    the task's exception. If the consumer stops early (client disconnected)
+    the task is cancelled.
+
+    Args:
+        task: Producer task
+        queue: Queue the producer puts items on
+    """
+    try:
+        while True:
+            if task.done() and queue.empty():
+                task.result()
+                return
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,297 @@
+"""
+Client-Side Quota Throttling
+Token buckets that keep each Azure deployment under its requests-per-minute
+and tokens-per-minute quota, and pause callers for Retry-After after a 429
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.deadline import stage_time_left
+
+# Every named throttle, for the metrics endpoint
+_registry: Dict[str, "Throttle"] = {}
+
+# Back-off after a 429 that carries no Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+
+class ThrottledError(CircuitOpenError):
+    """
+    Raised when a call would have to wait longer for quota than it may.
+
+    Subclasses CircuitOpenError so routers fall back exactly as they do for
+    an open breaker.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        Exception.__init__(self, f"{name} quota exhausted (retry in {retry_after:.1f}s)")
+        self.dependency = name
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills at `rate_per_second` up to `capacity`.
+
+    Reservations may drive the level below zero; the caller then waits until
+    the refill has paid the debt back, so callers are spaced out in arrival
+    order instead of all retrying at once.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount now; returns the seconds to wait before using it"""
+        self._refill()
+        self.level -= amount
+        return max(-self.level / self.rate_per_second, 0.0)
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, with a negative amount, take more of) a reservation"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def available(self) -> float:
+        self._refill()
+        return self.level
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """
+    Back-off requested by a throttled Azure response.
+
+    Reads `retry-after-ms` (Azure OpenAI) first, then `Retry-After` as
+    seconds or an HTTP date.
+
+    Returns:
+        Seconds to wait, or None if the response gives no hint
+    """
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Throttle:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one deployment.
+
+    Buckets hold `burst_seconds` worth of quota (Azure evaluates per-minute
+    limits over short windows), so a burst is smoothed over the following
+    seconds instead of being sent at once and rejected. A limit of 0
+    disables that bucket. A call needing more tokens than the bucket holds
+    reserves a full bucket (it waits for the bucket to refill, then takes
+    all of it) rather than being refused outright.
+
+    Usage:
+        response = await throttle.call(lambda: http_client.post(...), tokens=estimate)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float = 0,
+        burst_seconds: Optional[float] = None,
+        max_wait_seconds: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        burst_seconds = settings.THROTTLE_BURST_SECONDS if burst_seconds is None else burst_seconds
+        self.max_wait_seconds = settings.THROTTLE_MAX_WAIT_SECONDS if max_wait_seconds is None else max_wait_seconds
+        self.max_retries = settings.THROTTLE_MAX_RETRIES if max_retries is None else max_retries
+        self._requests = self._bucket(requests_per_minute, burst_seconds)
+        self._tokens = self._bucket(tokens_per_minute, burst_seconds)
+        self.blocked_until = 0.0
+
+        self.calls = 0
+        self.delayed_calls = 0
+        self.rejected_calls = 0
+        self.rate_limited_responses = 0
+        self.retries = 0
+        self.total_wait_seconds = 0.0
+        self.tokens_reserved = 0
+        _registry[name] = self
+
+    @staticmethod
+    def _bucket(per_minute: float, burst_seconds: float) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(rate * burst_seconds, 1.0))
+
+    def _reservation(self, tokens: int) -> int:
+        """Tokens a call reserves: its estimate, capped at a full bucket"""
+        if self._tokens is None:
+            return 0
+        return min(tokens, int(self._tokens.capacity))
+
+    async def acquire(self, tokens: int = 0, retry: bool = False) -> None:
+        """
+        Wait until one request and `tokens` tokens fit in the quota.
+
+        Args:
+            tokens: Estimated tokens the request will use
+            retry: The call is being retried after a 429 and still holds
+                the reservation of its first attempt; only the back-off is
+                waited out
+
+        Raises:
+            ThrottledError: The wait would exceed max_wait_seconds or the
+                time the current pipeline stage has left
+        """
+        tokens = self._reservation(tokens)
+        delay = max(self.blocked_until - time.monotonic(), 0.0)
+        if not retry:
+            self.calls += 1
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1))
+            if tokens:
+                delay = max(delay, self._tokens.reserve(tokens))
+
+        max_wait = self.max_wait_seconds
+        time_left = stage_time_left()
+        if time_left is not None:
+            max_wait = min(max_wait, time_left)
+        if delay > max_wait:
+            self._refund(tokens, counted=retry)
+            self.rejected_calls += 1
+            raise ThrottledError(self.name, delay)
+
+        if delay > 0:
+            self.delayed_calls += 1
+            self.total_wait_seconds += delay
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._refund(tokens, counted=retry)
+                raise
+        if not retry:
+            self.tokens_reserved += tokens
+
+    def _refund(self, tokens: int, counted: bool = False) -> None:
+        """Give back a call's reservation (counted: already in tokens_reserved)"""
+        if self._requests is not None:
+            self._requests.refund(1)
+        if self._tokens is not None and tokens:
+            self._tokens.refund(tokens)
+        if counted:
+            self.tokens_reserved -= tokens
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct a token reservation once the actual usage is known"""
+        if self._tokens is not None and used >= 0:
+            reserved = self._reservation(reserved)
+            self._tokens.refund(reserved - used)
+            self.tokens_reserved += used - reserved
+
+    def back_off(self, seconds: Optional[float]) -> None:
+        """Hold every caller of this deployment until a 429's Retry-After has passed"""
+        self.rate_limited_responses += 1
+        if seconds is None:
+            seconds = DEFAULT_RETRY_AFTER_SECONDS
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        print(f"Throttle '{self.name}': rate limited, backing off {seconds:.1f}s")
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        tokens: int = 0
+    ) -> httpx.Response:
+        """
+        Send a request within quota, retrying after Retry-After on a 429.
+
+        A throttled attempt was not counted by Azure, so retries reuse the
+        first attempt's reservation instead of reserving again.
+
+        Args:
+            send: Makes the request (called once per attempt)
+            tokens: Estimated tokens the request will use
+
+        Returns:
+            The last response (a 429 once retries are used up)
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, retry=attempt > 0)
+            response = await send()
+            if response.status_code != 429:
+                return response
+            self.back_off(retry_after_seconds(response))
+            if attempt < self.max_retries:
+                self.retries += 1
+        # Azure did not count the throttled calls: give the reservation back
+        self._refund(tokens, counted=True)
+        return response
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        open_stream: Callable[[], AsyncContextManager[httpx.Response]],
+        tokens: int = 0
+    ) -> AsyncIterator[httpx.Response]:
+        """Streaming form of call(); a 429 is retried before any body is read"""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, retry=attempt > 0)
+            async with open_stream() as response:
+                if response.status_code == 429:
+                    self.back_off(retry_after_seconds(response))
+                    if attempt < self.max_retries:
+                        self.retries += 1
+                        continue
+                    self._refund(tokens, counted=True)
+                yield response
+                return
+
+    def snapshot(self) -> Dict:
+        """Quota usage and counters for the metrics endpoint"""
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "requests_available": round(self._requests.available(), 1) if self._requests else None,
+            "tokens_available": round(self._tokens.available()) if self._tokens else None,
+            "blocked_for_seconds": round(max(self.blocked_until - time.monotonic(), 0.0), 1),
+            "calls": self.calls,
+            "delayed_calls": self.delayed_calls,
+            "rejected_calls": self.rejected_calls,
+            "rate_limited_responses": self.rate_limited_responses,
+            "retries": self.retries,
+            "avg_wait_ms": round(self.total_wait_seconds / self.delayed_calls * 1000, 1) if self.delayed_calls else 0.0,
+            "tokens_reserved": self.tokens_reserved,
+        }
+
+
+def throttle_stats() -> Dict[str, Dict]:
+    """Stats for every throttle"""
+    return {name: throttle.snapshot() for name, throttle in _registry.items()}
@@ -0,0 +1,135 @@
+"""
+Translation Memory
+Sentence-level store of earlier Azure Translator results, so repeated
+agronomy advice is only sent (and billed) for sentences not seen before
+"""
+
+import hashlib
+import re
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from app.config import settings
+from app.services.cache import TieredCache, cache_file
+
+# Split after sentence punctuation (but not "1." list numbers) or at newlines;
+# the separators are captured so the text can be put back together exactly
+_SEGMENT_SPLIT = re.compile(r"((?<=[^\d\s][.!?])\s+|\n+)")
+
+TranslateFn = Callable[[List[str], str], Awaitable[List[str]]]
+
+
+def split_segments(text: str) -> List[str]:
+    """
+    Split text into sentence segments and the whitespace between them.
+
+    Returns:
+        Alternating [segment, separator, segment, ...]; "".join() gives back the text
+    """
+    return _SEGMENT_SPLIT.split(text)
+
+
+def _strip(segment: str) -> Tuple[str, str, str]:
+    """(leading whitespace, sentence, trailing whitespace)"""
+    core = segment.strip()
+    if not core:
+        return segment, "", ""
+    start = segment.index(core)
+    return segment[:start], core, segment[start + len(core):]
+
+
+class TranslationMemory:
+    """(source sentence, target language) -> translation, in memory and SQLite"""
+
+    def __init__(self, cache: TieredCache):
+        self.cache = cache
+        self.chars_requested = 0
+        self.chars_translated = 0
+
+    @staticmethod
+    def _key(sentence: str, target_lang: str) -> str:
+        digest = hashlib.sha256(sentence.encode("utf-8")).hexdigest()
+        return f"{target_lang.lower()}:{digest}"
+
+    async def translate(self, text: str, target_lang: str, translate_missing: TranslateFn) -> str:
+        """
+        Translate text, serving known sentences from memory.
+
+        Args:
+            text: Source text (any number of sentences/lines)
+            target_lang: Target language code
+            translate_missing: Sends the unknown sentences to the translator,
+                returning translations in the same order
+
+        Returns:
+            Translated text with the original spacing and line breaks
+        """
+        return (await self.translate_many([text], target_lang, translate_missing))[0]
+
+    async def translate_many(
+        self,
+        texts: List[str],
+        target_lang: str,
+        translate_missing: TranslateFn
+    ) -> List[str]:
+        """
+        Translate several texts, sending all their unknown sentences together.
+
+        Returns:
+            Translations in the same order as texts
+        """
+        pieces_per_text = [split_segments(text) for text in texts]
+        sentences_per_text = [
+            [_strip(piece)[1] if i % 2 == 0 else "" for i, piece in enumerate(pieces)]
+            for pieces in pieces_per_text
+        ]
+
+        known: Dict[str, str] = {}
+        missing: List[str] = []
+        for sentences in sentences_per_text:
+            for sentence in sentences:
+                if not sentence or sentence in known or sentence in missing:
+                    continue
+                cached = await self.cache.get(self._key(sentence, target_lang))
+                if cached is None:
+                    missing.append(sentence)
+                else:
+                    known[sentence] = cached
+            self.chars_requested += sum(len(s) for s in sentences)
+
+        if missing:
+            translations = await translate_missing(missing, target_lang)
+            for sentence, translated in zip(missing, translations):
+                known[sentence] = translated
+                await self.cache.set(self._key(sentence, target_lang), translated)
+            self.chars_translated += sum(len(s) for s in missing)
+
+        results = []
+        for pieces, sentences in zip(pieces_per_text, sentences_per_text):
+            result = []
+            for i, piece in enumerate(pieces):
+                if i % 2 or not sentences[i]:
+                    result.append(piece)
+                    continue
+                leading, sentence, trailing = _strip(piece)
+                result.append(leading + known[sentence] + trailing)
+            results.append("".join(result))
+        return results
+
+    def stats(self) -> Dict:
+        saved = self.chars_requested - self.chars_translated
+        return {
+            **self.cache.stats(),
+            "chars_requested": self.chars_requested,
+            "chars_sent_to_translator": self.chars_translated,
+            "chars_saved": saved,
+        }
+
+
+translation_memory = TranslationMemory(
+    TieredCache(
+        "translation_memory",
+        max_entries=settings.TRANSLATION_MEMORY_MAX_ENTRIES,
+        ttl_seconds=settings.TRANSLATION_MEMORY_TTL_SECONDS,
+        disk_path=cache_file("translation_memory.sqlite3"),
+    )
+)
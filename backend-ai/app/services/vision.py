@@ -3,21 +3,113 @@ Azure Computer Vision Service Integration
 Analyzes crop images to extract tags and descriptions
 """
 
-import requests
-from typing import List
+import asyncio
+import hashlib
+import httpx
+from typing import List, Optional
 from app.config import settings
+from app.services import http_client
+from app.services.cache import SQLiteStore, TieredCache, cache_file
+from app.services.image_hash import NearDuplicateIndex, dhash
+from app.services.single_flight import SingleFlight
+
+# Tag lists keyed by SHA-256 of the image bytes. The disk tier is shared by
+# all workers, so a re-sent photo skips the Vision round trip on any of them.
+_image_cache = TieredCache(
+    "vision",
+    max_entries=settings.VISION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.VISION_CACHE_TTL_SECONDS,
+    disk_path=cache_file("vision.sqlite3"),
+)
+
+# Perceptual hashes of analyzed images, to reuse tags for near-duplicates
+# (the same leaf recompressed or slightly re-cropped)
+_near_duplicates = NearDuplicateIndex(
+    SQLiteStore(cache_file("vision.sqlite3"), "vision_phash"),
+    ttl_seconds=settings.VISION_CACHE_TTL_SECONDS,
+)
+
+
+# Identical images being analyzed right now
+_in_flight = SingleFlight("vision")
+
+
+def image_key(image_bytes: bytes) -> str:
+    """Content address of an image"""
+    return hashlib.sha256(image_bytes).hexdigest()
 
 
 async def analyze_image(image_bytes: bytes) -> List[str]:
     """
     Analyze an image using Azure Computer Vision.
     
+    Results are cached by image content, so identical bytes are only sent
+    to Vision once per cache TTL. Images whose perceptual hash is within
+    VISION_PHASH_MAX_DISTANCE bits of an earlier one reuse its tags.
+    
     Args:
         image_bytes: Raw image bytes to analyze
     
     Returns:
         List of detected tags/features from the image
     """
+    key = image_key(image_bytes)
+    cached = await _image_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    
+    # The same image submitted twice at once is analyzed once
+    return list(await _in_flight.do(key, _analyze_uncached, image_bytes, key))
+
+
+async def _analyze_uncached(image_bytes: bytes, key: str) -> List[str]:
+    """Near-duplicate lookup, then Vision; stores the result under key"""
+    perceptual_hash = await _perceptual_hash(image_bytes)
+    if perceptual_hash is not None:
+        tags = await _find_near_duplicate(perceptual_hash)
+        if tags is not None:
+            await _image_cache.set(key, tags)
+            return tags
+    
+    tags = await _analyze_with_azure(image_bytes)
+    await _image_cache.set(key, tags)
+    if perceptual_hash is not None:
+        await _near_duplicates.add(perceptual_hash, key)
+    return tags
+
+
+async def _perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """dHash of the image, computed off the event loop (None if disabled or undecodable)"""
+    if not settings.VISION_PHASH_ENABLED:
+        return None
+    try:
+        return await asyncio.to_thread(dhash, image_bytes)
+    except Exception as e:
+        print(f"Perceptual hash skipped: {str(e)}")
+        return None
+
+
+async def _find_near_duplicate(perceptual_hash: int) -> Optional[List[str]]:
+    """Tags of the closest earlier image within the configured distance"""
+    for distance, match_key in await _near_duplicates.find(perceptual_hash, settings.VISION_PHASH_MAX_DISTANCE):
+        tags = await _image_cache.get(match_key)
+        if tags is not None:
+            _near_duplicates.record_hit(distance)
+            return list(tags)
+    return None
+
+
+def near_duplicate_stats() -> dict:
+    """Near-duplicate lookup counters for the metrics endpoint"""
+    return {
+        **_near_duplicates.stats(),
+        "max_distance": settings.VISION_PHASH_MAX_DISTANCE,
+        "enabled": settings.VISION_PHASH_ENABLED,
+    }
+
+
+async def _analyze_with_azure(image_bytes: bytes) -> List[str]:
+    """Call the Azure Vision analyze endpoint"""
     if not settings.AZURE_VISION_KEY or not settings.AZURE_VISION_ENDPOINT:
         raise ValueError("Azure Vision credentials not configured")
     
@@ -35,7 +127,7 @@ async def analyze_image(image_bytes: bytes) -> List[str]:
     }
     
     try:
-        response = requests.post(url, headers=headers, params=params, data=image_bytes)
+        response = await http_client.post(url, dependency="vision", headers=headers, params=params, content=image_bytes)
         response.raise_for_status()
         
         data = response.json()
@@ -56,6 +148,6 @@ async def analyze_image(image_bytes: bytes) -> List[str]:
         
         return list(set(tags))  # Remove duplicates
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error calling Azure Vision API: {str(e)}")
         raise Exception(f"Vision analysis failed: {str(e)}")
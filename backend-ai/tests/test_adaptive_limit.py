@@ -0,0 +1,110 @@
+"""Tests for adaptive (AIMD) concurrency limits."""
+import asyncio
+
+from app.services.adaptive_limit import AIMDLimit
+from app.services.bulkhead import Bulkhead
+
+
+def _limit(start=4, **overrides):
+    options = dict(target_latency_seconds=1.0, min_limit=1, max_limit=8, decrease_factor=0.5, spike_factor=2.0)
+    options.update(overrides)
+    return AIMDLimit(Bulkhead('openai', max_concurrent=start, max_queue=10, max_wait_seconds=5), **options)
+
+
+class TestAIMDLimit:
+    """Test suite for additive increase and multiplicative decrease."""
+
+    def test_increases_by_about_one_per_round(self):
+        """Test that a round of fast calls raises the limit by one."""
+        limiter = _limit(start=4)
+        for _ in range(4):
+            limiter.record(0.2)
+        assert limiter.bulkhead.max_concurrent == 4
+
+        limiter.record(0.2)
+        assert limiter.bulkhead.max_concurrent == 5
+
+    def test_halves_on_throttling(self):
+        """Test that a 429 cuts the limit multiplicatively."""
+        limiter = _limit(start=8)
+        limiter.record(0.2, throttled=True)
+
+        assert limiter.bulkhead.max_concurrent == 4
+        assert limiter.snapshot()['last_decrease_reason'] == 'throttled'
+
+    def test_one_decrease_per_target_interval(self):
+        """Test that calls failing together only cut the limit once."""
+        limiter = _limit(start=8)
+        limiter.record(0.2, timed_out=True)
+        limiter.record(0.2, timed_out=True)
+
+        assert limiter.bulkhead.max_concurrent == 4
+        assert limiter.decreases == 1
+
+    def test_latency_spike_decreases(self):
+        """Test that a call far over target counts as overload."""
+        limiter = _limit(start=8)
+        limiter.record(2.5)
+
+        assert limiter.snapshot()['limit'] == 4
+
+    def test_limit_bounded(self):
+        """Test that the limit stays between min_limit and max_limit."""
+        limiter = _limit(start=8, target_latency_seconds=0.0)
+        for _ in range(50):
+            limiter.record(0.0)
+        assert limiter.bulkhead.max_concurrent == 8
+
+        for _ in range(5):
+            limiter.record(0.0, throttled=True)
+        assert limiter.bulkhead.max_concurrent == 1
+
+    def test_cancelled_call_does_not_increase(self):
+        """Test that a call cut off by its deadline is not a healthy sample."""
+        limiter = _limit(start=1)
+        limiter.record(0.1, cancelled=True)
+
+        assert limiter.bulkhead.max_concurrent == 1
+
+
+class TestBulkheadLimitChanges:
+    """Test suite for resizing a bulkhead while calls are queued."""
+
+    async def test_raising_limit_admits_waiters(self):
+        """Test that a higher limit lets queued calls start straight away."""
+        bulkhead = Bulkhead('speech', max_concurrent=1, max_queue=5, max_wait_seconds=5)
+        await bulkhead.acquire()
+        waiting = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+
+        bulkhead.set_limit(2)
+        await asyncio.wait_for(waiting, 1)
+        assert bulkhead.active == 2
+
+    async def test_lowering_limit_drains_running_calls(self):
+        """Test that slots above a lowered limit are not handed on."""
+        bulkhead = Bulkhead('speech', max_concurrent=2, max_queue=5, max_wait_seconds=5)
+        await bulkhead.acquire()
+        await bulkhead.acquire()
+        waiting = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+
+        bulkhead.set_limit(1)
+        bulkhead.release()
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        bulkhead.release()
+        await asyncio.wait_for(waiting, 1)
+        assert bulkhead.active == 1
+
+
+class TestConcurrencyMetrics:
+    """Test suite for the adaptive limit metrics endpoint."""
+
+    def test_metrics_reports_limit(self, client):
+        """Test that the current limit is reported per dependency."""
+        response = client.get('/api/metrics/concurrency')
+
+        assert response.status_code == 200
+        assert 'limit' in response.json()['data']['openai']
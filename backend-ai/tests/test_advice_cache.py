@@ -0,0 +1,76 @@
+"""Tests for the GPT-4 advice cache."""
+import pytest
+
+from app.services import gpt4
+from app.services.cache import TieredCache
+
+
+class TestAdviceCacheKey:
+    """Test suite for canonical advice cache keys."""
+
+    def test_tag_order_case_and_duplicates_ignored(self):
+        """Test that equivalent tag lists share a key."""
+        first = gpt4.advice_cache_key(['Leaf', 'rust', 'leaf'], 'Why?', 'en')
+        second = gpt4.advice_cache_key(['rust', 'leaf'], 'Why?', 'en')
+
+        assert first == second
+
+    def test_question_normalized(self):
+        """Test that case, spacing and trailing punctuation are ignored."""
+        first = gpt4.advice_cache_key(['leaf'], '  What is   wrong with my maize?? ', 'en')
+        second = gpt4.advice_cache_key(['leaf'], 'what is wrong with my maize', 'en')
+
+        assert first == second
+
+    def test_language_and_context_change_key(self):
+        """Test that language and v2 context are part of the key."""
+        base = gpt4.advice_cache_key(['leaf'], 'why', 'en', {'crop': 'maize', 'season': None})
+
+        assert base == gpt4.advice_cache_key(['leaf'], 'why', 'en', {'crop': 'maize'})
+        assert base != gpt4.advice_cache_key(['leaf'], 'why', 'sw', {'crop': 'maize'})
+        assert base != gpt4.advice_cache_key(['leaf'], 'why', 'en', {'crop': 'bean'})
+        assert base != gpt4.advice_cache_key(['leaf'], 'why', 'en', {'crop': 'maize', 'experience': 'beginner'})
+
+
+class TestAdviceCache:
+    """Test suite for cached GPT-4 advice."""
+
+    @pytest.fixture(autouse=True)
+    def _fake_model(self, monkeypatch, tmp_path):
+        self.cache = TieredCache('advice-test', 8, 60, tmp_path / 'advice.sqlite3')
+        monkeypatch.setattr(gpt4, '_advice_cache', self.cache)
+        self.calls = []
+
+        async def fake_request(tags, user_query, language, system_prompt=None):
+            self.calls.append(user_query)
+            return f'Advice #{len(self.calls)}'
+
+        monkeypatch.setattr(gpt4, '_request_advice', fake_request)
+
+    async def test_repeat_request_served_from_cache(self):
+        """Test that an equivalent request does not call the model again."""
+        first = await gpt4.get_agronomist_advice(['leaf', 'rust'], 'Why brown?', 'en')
+        second = await gpt4.get_agronomist_advice(['rust', 'leaf'], 'why brown', 'en')
+
+        assert first == second == 'Advice #1'
+        assert len(self.calls) == 1
+        assert self.cache.stats()['hit_ratio'] == 0.5
+
+    async def test_bypass_refreshes_cached_answer(self):
+        """Test that bypass_cache calls the model and updates the cache."""
+        await gpt4.get_agronomist_advice(['leaf'], 'why', 'en')
+        fresh = await gpt4.get_agronomist_advice(['leaf'], 'why', 'en', bypass_cache=True)
+        cached = await gpt4.get_agronomist_advice(['leaf'], 'why', 'en')
+
+        assert fresh == cached == 'Advice #2'
+        assert len(self.calls) == 2
+
+    async def test_saved_latency_reported(self):
+        """Test that hits add the original call latency to saved_seconds."""
+        await gpt4.get_agronomist_advice(['leaf'], 'why', 'en')
+        key = gpt4.advice_cache_key(['leaf'], 'why', 'en')
+        await self.cache.set(key, {'advice': 'Advice #1', 'latency': 2.5})
+
+        await gpt4.get_agronomist_advice(['leaf'], 'why', 'en')
+
+        assert self.cache.stats()['saved_seconds'] == 2.5
@@ -0,0 +1,212 @@
+"""Tests for deferred audio jobs and their long-poll endpoint."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.main import app
+from app.routers import diagnosis as diagnosis_router
+from app.routers import history as history_router
+from app.services import audio_jobs, audio_store, gpt4, speech, vision
+from app.services.cache import SQLiteStore, TTLCache
+
+
+@pytest.fixture(autouse=True)
+def _job_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+    monkeypatch.setattr(audio_jobs, '_store', SQLiteStore(tmp_path / 'jobs.sqlite3', 'audio_jobs'))
+    monkeypatch.setattr(audio_jobs, '_local', TTLCache(audio_jobs.LOCAL_JOBS_MAX, 60))
+
+
+def slow_synthesis(release):
+    """Fake TTS that stores the audio once `release` is set"""
+    async def synthesize_audio(text, language):
+        await release.wait()
+        audio_id = audio_store.audio_id(text, speech.voice_for(language))
+        await audio_store.save(audio_id, b'mp3:' + text.encode())
+        return audio_id
+    return synthesize_audio
+
+
+class TestAudioJobs:
+    """Test suite for submitting and waiting on audio jobs."""
+
+    async def test_waiter_woken_when_audio_lands(self, monkeypatch):
+        """Test that a pending job turns done with its URL and notifies the callback."""
+        release = asyncio.Event()
+        monkeypatch.setattr(speech, 'synthesize_audio', slow_synthesis(release))
+        finished = []
+
+        job = await audio_jobs.submit('Spray neem oil.', 'en', on_done=finished.append)
+        assert job['status'] == audio_jobs.PENDING
+        assert (await audio_jobs.status(job['job_id']))['status'] == audio_jobs.PENDING
+
+        waiter = asyncio.create_task(audio_jobs.wait(job['job_id'], 5))
+        release.set()
+        done = await waiter
+
+        assert done['status'] == audio_jobs.DONE
+        assert done['url'] == audio_store.audio_url(job['job_id'])
+        assert [record['status'] for record in finished] == [audio_jobs.DONE]
+
+    async def test_failure_recorded(self, monkeypatch):
+        """Test that a TTS error marks the job failed with the error."""
+        async def synthesize_audio(text, language):
+            raise RuntimeError('TTS quota exceeded')
+
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+
+        job = await audio_jobs.submit('Spray neem oil.', 'en')
+        failed = await audio_jobs.wait(job['job_id'], 5)
+
+        assert failed['status'] == audio_jobs.FAILED
+        assert failed['error'] == 'TTS quota exceeded'
+
+    async def test_same_text_shares_one_job(self, monkeypatch):
+        """Test that the same answer submitted twice runs one synthesis."""
+        release = asyncio.Event()
+        calls = []
+        synthesize = slow_synthesis(release)
+
+        async def synthesize_audio(text, language):
+            calls.append(text)
+            return await synthesize(text, language)
+
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+        cleaned = []
+
+        first = await audio_jobs.submit('Spray neem oil.', 'en')
+        second = await audio_jobs.submit('Spray neem oil.', 'en', cleanup=lambda: cleaned.append(True))
+        release.set()
+        await audio_jobs.wait(first['job_id'], 5)
+
+        assert second['job_id'] == first['job_id']
+        assert calls == ['Spray neem oil.']
+        assert cleaned == [True]
+
+    async def test_existing_audio_done_at_once(self):
+        """Test that audio already on disk gives a finished job without synthesis."""
+        audio_id = audio_store.audio_id('Spray neem oil.', speech.voice_for('en'))
+        await audio_store.save(audio_id, b'mp3')
+
+        job = await audio_jobs.submit('Spray neem oil.', 'en')
+
+        assert job['status'] == audio_jobs.DONE
+        assert job['audio_id'] == audio_id
+
+    async def test_job_of_stopped_worker_taken_over(self, monkeypatch):
+        """Test that a job left pending by a dead worker is restarted once it is overdue."""
+        monkeypatch.setattr(speech, 'synthesize_audio', slow_synthesis(asyncio.Event()))
+        job = await audio_jobs.submit('Spray neem oil.', 'en')
+        # The worker dies: its task is gone, the record stays pending
+        audio_jobs._tasks.pop(job['job_id']).cancel()
+        audio_jobs._finished.pop(job['job_id'])
+        audio_jobs._local.delete(job['job_id'])
+        await asyncio.sleep(0)
+        await audio_jobs._store.set(job['job_id'], {**job, 'started_at': job['started_at'] - 3600}, 60)
+
+        taken_over = audio_jobs.job_stats()['taken_over']
+        release = asyncio.Event()
+        monkeypatch.setattr(speech, 'synthesize_audio', slow_synthesis(release))
+        waiter = asyncio.create_task(audio_jobs.wait(job['job_id'], 5))
+        await asyncio.sleep(0.01)
+        release.set()
+        done = await waiter
+
+        assert done['status'] == audio_jobs.DONE
+        assert audio_jobs.job_stats()['taken_over'] == taken_over + 1
+
+    def test_history_record_updated_in_place(self, monkeypatch, tmp_path):
+        """Test that the audio fields of one saved diagnosis are rewritten."""
+        monkeypatch.setattr(history_router, 'HISTORY_DIR', tmp_path)
+        history_router.save_diagnosis_to_history('u1', {'id': 'a', 'audio_status': 'pending'})
+        history_router.save_diagnosis_to_history('u1', {'id': 'b', 'audio_status': 'pending'})
+
+        assert history_router.update_history_record('u1', 'b', {'audio_status': 'done', 'audio_url': '/x'})
+        assert not history_router.update_history_record('u1', 'missing', {'audio_status': 'done'})
+
+        lines = (tmp_path / 'u1.jsonl').read_text().splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {'id': 'a', 'audio_status': 'pending'},
+            {'id': 'b', 'audio_status': 'done', 'audio_url': '/x'},
+        ]
+
+    async def test_append_during_update_is_kept(self, monkeypatch, tmp_path):
+        """Test that a diagnosis saved while a record is rewritten is not lost."""
+        monkeypatch.setattr(history_router, 'HISTORY_DIR', tmp_path)
+        history_router.save_diagnosis_to_history('u1', {'id': 'a', 'audio_status': 'pending'})
+
+        with history_router.history_lock('u1'):
+            update = asyncio.create_task(asyncio.to_thread(
+                history_router.update_history_record, 'u1', 'a', {'audio_status': 'done'}
+            ))
+            append = asyncio.create_task(asyncio.to_thread(
+                history_router.save_diagnosis_to_history, 'u1', {'id': 'b'}
+            ))
+            await asyncio.sleep(0.05)
+        assert await update
+
+        await append
+        records = [json.loads(line) for line in (tmp_path / 'u1.jsonl').read_text().splitlines()]
+        assert sorted(record['id'] for record in records) == ['a', 'b']
+        assert records[[record['id'] for record in records].index('a')]['audio_status'] == 'done'
+        assert not list(tmp_path.glob('*.tmp'))
+
+
+class TestDeferredDiagnosis:
+    """Test suite for /api/diagnose with defer_audio and /api/audio/jobs."""
+
+    @pytest.fixture(autouse=True)
+    def _services(self, monkeypatch):
+        async def analyze_image(image_bytes):
+            return ['leaf', 'rust']
+
+        async def gpt_advice(*args, **kwargs):
+            return 'DISEASE: Leaf rust.'
+
+        async def no_log(data):
+            return None
+
+        self.release = asyncio.Event()
+        monkeypatch.setattr(settings, 'SPEECH_PIPELINE_ENABLED', False)
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_advice)
+        monkeypatch.setattr(speech, 'synthesize_audio', slow_synthesis(self.release))
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis_event', no_log)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis', no_log)
+
+    async def test_text_returned_before_audio(self):
+        """Test that the answer carries a pending job that long-polling resolves."""
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            response = await client.post(
+                '/api/diagnose',
+                files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+                data={'query': 'What is this?', 'language': 'en', 'defer_audio': 'true'},
+            )
+            audio = response.json()['data']['audio']
+            assert audio['status'] == 'pending' and audio['url'] is None
+
+            pending = await client.get(audio['job_url'])
+            unchanged = await client.get(audio['job_url'], headers={'If-None-Match': pending.headers['etag']})
+            assert unchanged.status_code == 304
+
+            poll = asyncio.create_task(client.get(
+                audio['job_url'], params={'wait': 5}, headers={'If-None-Match': pending.headers['etag']}
+            ))
+            self.release.set()
+            done = await poll
+
+        job = done.json()['data']
+        assert done.status_code == 200
+        assert done.headers['etag'] != pending.headers['etag']
+        assert job['status'] == 'done'
+        assert job['url'] == audio_store.audio_url(audio['job_id'])
+
+    async def test_unknown_job(self):
+        """Test that an unknown job id is a 404."""
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            response = await client.get(audio_jobs.job_url('0' * 64))
+
+        assert response.status_code == 404
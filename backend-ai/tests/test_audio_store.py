@@ -0,0 +1,204 @@
+"""Tests for the TTS audio store and the audio endpoints."""
+import base64
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.routers import copilot as copilot_router
+from app.services import audio_store, gpt4, http_client, speech, vision
+
+MP3 = b'ID3' + bytes(range(256)) * 4
+
+
+@pytest.fixture(autouse=True)
+def audio_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+    return tmp_path / 'audio'
+
+
+class TestAudioStore:
+    """Test suite for content-addressed audio storage."""
+
+    def test_id_depends_on_text_voice_and_format(self):
+        """Test that each synthesis input changes the audio id."""
+        base = audio_store.audio_id('Spray neem oil.', 'sw-KE-ZuriNeural')
+
+        assert base == audio_store.audio_id('Spray neem oil.', 'sw-KE-ZuriNeural')
+        assert base != audio_store.audio_id('Spray neem oil!', 'sw-KE-ZuriNeural')
+        assert base != audio_store.audio_id('Spray neem oil.', 'en-US-AvaNeural')
+        assert base != audio_store.audio_id('Spray neem oil.', 'sw-KE-ZuriNeural', 'riff-24khz-16bit-mono-pcm')
+
+    def test_rejects_path_like_ids(self):
+        """Test that only hash ids map to files."""
+        with pytest.raises(ValueError):
+            audio_store.path_for('../../etc/passwd')
+        assert not audio_store.exists('../secret')
+
+    async def test_save_and_read(self, audio_dir):
+        """Test that saved audio can be read back from disk."""
+        audio_id = audio_store.audio_id('Hello', 'en-US-AvaNeural')
+        await audio_store.save(audio_id, MP3)
+
+        assert audio_store.exists(audio_id)
+        assert await audio_store.read(audio_id) == MP3
+        assert audio_store.path_for(audio_id).parent.parent == audio_dir
+
+    async def test_synthesizes_identical_text_once(self, monkeypatch):
+        """Test that repeated text and voice reuse the stored MP3."""
+        calls = []
+
+        async def synthesize(text, language, voice):
+            calls.append((text, voice))
+            return MP3
+
+        monkeypatch.setattr(speech, '_synthesize', synthesize)
+
+        first = await speech.synthesize_audio('Remove infected leaves.', 'sw')
+        second = await speech.synthesize_audio('Remove infected leaves.', 'sw')
+
+        assert first == second
+        assert calls == [('Remove infected leaves.', 'sw-KE-ZuriNeural')]
+
+
+class TestAudioEndpoint:
+    """Test suite for GET /api/audio/{id}."""
+
+    @pytest.fixture
+    async def stored_id(self):
+        audio_id = audio_store.audio_id('Hello', 'en-US-AvaNeural')
+        await audio_store.save(audio_id, MP3)
+        return audio_id
+
+    def test_serves_mp3_with_cache_headers(self, client, stored_id):
+        """Test that audio is served with a strong ETag and immutable caching."""
+        response = client.get(f'/api/audio/{stored_id}')
+
+        assert response.status_code == 200
+        assert response.content == MP3
+        assert response.headers['content-type'] == 'audio/mpeg'
+        assert response.headers['etag'] == f'"{stored_id}"'
+        assert 'immutable' in response.headers['cache-control']
+
+    def test_if_none_match_returns_304(self, client, stored_id):
+        """Test that a cached copy is revalidated without a body."""
+        response = client.get(f'/api/audio/{stored_id}', headers={'If-None-Match': f'"{stored_id}"'})
+
+        assert response.status_code == 304
+        assert response.content == b''
+
+    def test_range_request_returns_partial_content(self, client, stored_id):
+        """Test that byte ranges are honoured for seeking."""
+        response = client.get(f'/api/audio/{stored_id}', headers={'Range': 'bytes=3-6'})
+
+        assert response.status_code == 206
+        assert response.content == MP3[3:7]
+        assert response.headers['content-range'] == f'bytes 3-6/{len(MP3)}'
+
+    def test_unknown_audio_is_404(self, client):
+        """Test that missing or malformed ids are not found."""
+        assert client.get(f'/api/audio/{"0" * 64}').status_code == 404
+        assert client.get('/api/audio/not-a-hash').status_code == 404
+
+
+class TestSpeakStream:
+    """Test suite for the chunked TTS proxy."""
+
+    @pytest.fixture(autouse=True)
+    def _tts(self, monkeypatch):
+        monkeypatch.setattr(settings, 'AZURE_SPEECH_KEY', 'key')
+        monkeypatch.setattr(settings, 'AZURE_SPEECH_REGION', 'eastus')
+        self.requests = []
+        self.status = 200
+
+        async def chunks():
+            for start in range(0, len(MP3), 256):
+                yield MP3[start:start + 256]
+
+        @asynccontextmanager
+        async def stream(method, url, dependency=None, **kwargs):
+            self.requests.append(kwargs['content'])
+            yield httpx.Response(self.status, content=chunks(), request=httpx.Request(method, url))
+
+        monkeypatch.setattr(http_client, 'stream', stream)
+
+    def test_streams_and_stores_audio(self, client):
+        """Test that audio is relayed as it arrives and kept for reuse."""
+        response = client.get('/api/audio/speak', params={'text': 'Spray neem & ash.', 'language': 'sw'})
+
+        audio_id = audio_store.audio_id('Spray neem & ash.', 'sw-KE-ZuriNeural')
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'audio/mpeg'
+        assert response.headers['x-audio-url'] == f'/api/audio/{audio_id}'
+        assert response.headers['cache-control'] == 'no-store'
+        assert 'etag' not in response.headers
+        assert response.content == MP3
+        assert b'Spray neem &amp; ash.' in self.requests[0]
+        assert audio_store.path_for(audio_id).read_bytes() == MP3
+
+    def test_repeat_served_from_disk(self, client):
+        """Test that a second request does not call TTS again."""
+        client.get('/api/audio/speak', params={'text': 'Water early.'})
+        response = client.get('/api/audio/speak', params={'text': 'Water early.'})
+
+        assert response.content == MP3
+        assert response.headers['cache-control'] == 'public, max-age=31536000, immutable'
+        assert 'etag' in response.headers
+        assert len(self.requests) == 1
+
+    def test_upstream_error_is_502_and_not_stored(self, client, audio_dir):
+        """Test that a failed synthesis returns an error and stores nothing."""
+        self.status = 500
+
+        response = client.get('/api/audio/speak', params={'text': 'Water early.'})
+
+        assert response.status_code == 502
+        assert not any(path.is_file() for path in audio_dir.rglob('*'))
+
+
+class TestCopilotAudio:
+    """Test suite for the deprecated inline audio in Copilot responses."""
+
+    @pytest.fixture(autouse=True)
+    def _services(self, monkeypatch):
+        async def analyze_image(image_bytes):
+            return ['maize', 'leaf', 'rust']
+
+        async def gpt_advice(*args, **kwargs):
+            return 'DISEASE: Leaf rust.'
+
+        async def synthesize_audio(text, language):
+            audio_id = audio_store.audio_id(text, speech.voice_for(language))
+            await audio_store.save(audio_id, MP3)
+            return audio_id
+
+        async def no_log(data):
+            return None
+
+        monkeypatch.setattr(settings, 'SPEECH_PIPELINE_ENABLED', False)
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_advice)
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+        monkeypatch.setattr(copilot_router, 'log_diagnosis_event', no_log)
+
+    def diagnose(self, client):
+        return client.post('/api/copilot/diagnose-crop', json={
+            'image_base64': base64.b64encode(b'image-bytes').decode(), 'question': 'Why?', 'language': 'en',
+        }).json()
+
+    def test_audio_inlined_by_default(self, client):
+        """Test that Copilot still gets audio_base64 next to audio_url."""
+        data = self.diagnose(client)
+
+        assert data['audio_url'].startswith('/api/audio/')
+        assert base64.b64decode(data['audio_base64']) == MP3
+
+    def test_inline_audio_can_be_turned_off(self, client, monkeypatch):
+        """Test that COPILOT_AUDIO_BASE64=False leaves only the URL."""
+        monkeypatch.setattr(settings, 'COPILOT_AUDIO_BASE64', False)
+
+        data = self.diagnose(client)
+
+        assert data['audio_url'].startswith('/api/audio/')
+        assert data['audio_base64'] is None
@@ -0,0 +1,109 @@
+"""Tests for per-dependency bulkheads."""
+import asyncio
+
+import pytest
+
+from app.services.bulkhead import Bulkhead, BulkheadFullError
+from app.services.circuit_breaker import CircuitOpenError
+
+
+class TestBulkhead:
+    """Test suite for concurrency limits and the wait queue."""
+
+    async def test_limits_concurrency(self):
+        """Test that no more than max_concurrent calls run at once."""
+        bulkhead = Bulkhead('openai', max_concurrent=2, max_queue=10, max_wait_seconds=5)
+        running = []
+        peak = []
+
+        async def call():
+            await bulkhead.acquire()
+            try:
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+            finally:
+                bulkhead.release()
+
+        await asyncio.gather(*(call() for _ in range(6)))
+
+        assert max(peak) == 2
+        stats = bulkhead.snapshot()
+        assert stats['admitted'] == 6
+        assert stats['queued_calls'] == 4
+        assert stats['active'] == 0
+
+    async def test_rejects_when_queue_full(self):
+        """Test that calls beyond the queue bound fail fast."""
+        bulkhead = Bulkhead('speech', max_concurrent=1, max_queue=1, max_wait_seconds=5)
+        await bulkhead.acquire()
+        waiting = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(BulkheadFullError):
+            await bulkhead.acquire()
+        assert bulkhead.snapshot()['queue_length'] == 1
+
+        bulkhead.release()
+        await waiting
+        assert bulkhead.snapshot()['rejected_queue_full'] == 1
+
+    async def test_rejects_after_max_wait(self):
+        """Test that a queued call gives up after max_wait_seconds."""
+        bulkhead = Bulkhead('vision', max_concurrent=1, max_queue=5, max_wait_seconds=0.01)
+        await bulkhead.acquire()
+
+        with pytest.raises(BulkheadFullError):
+            await bulkhead.acquire()
+
+        stats = bulkhead.snapshot()
+        assert stats['rejected_wait_timeout'] == 1
+        assert stats['queue_length'] == 0
+        assert stats['max_wait_ms'] >= 10
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Test that a cancelled waiter does not keep a slot."""
+        bulkhead = Bulkhead('translator', max_concurrent=1, max_queue=5, max_wait_seconds=5)
+        await bulkhead.acquire()
+        waiting = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        bulkhead.release()
+
+        assert bulkhead.snapshot()['active'] == 0
+        assert bulkhead.snapshot()['queue_length'] == 0
+
+    async def test_slot_handed_to_cancelled_waiter_is_passed_on(self):
+        """Test that a slot released to a waiter that was just cancelled is not lost."""
+        bulkhead = Bulkhead('translator', max_concurrent=1, max_queue=5, max_wait_seconds=5)
+        await bulkhead.acquire()
+        first = asyncio.ensure_future(bulkhead.acquire())
+        second = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        bulkhead.release()
+
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await second
+        assert bulkhead.snapshot()['active'] == 1
+
+    def test_rejection_is_a_circuit_open_error(self):
+        """Test that routers fall back on a full bulkhead as on an open breaker."""
+        assert issubclass(BulkheadFullError, CircuitOpenError)
+
+
+class TestBulkheadMetrics:
+    """Test suite for the bulkhead metrics endpoint."""
+
+    def test_metrics_lists_dependencies(self, client):
+        """Test that every Azure dependency reports its bulkhead."""
+        response = client.get('/api/metrics/bulkheads')
+
+        assert response.status_code == 200
+        data = response.json()['data']
+        assert {'vision', 'openai', 'translator', 'speech'} <= set(data)
+        assert 'queue_length' in data['openai']
@@ -0,0 +1,112 @@
+"""Tests for the tiered result caches and the Vision image cache."""
+import time
+import pytest
+
+from app.services import vision
+from app.config import settings
+from app.services.cache import SQLiteStore, TieredCache, TTLCache, cache_file
+
+
+class TestTTLCache:
+    """Test suite for the in-memory LRU tier."""
+
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest untouched entry is evicted first."""
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.evictions == 1
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after their TTL."""
+        cache = TTLCache(max_entries=2, ttl_seconds=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+
+        assert cache.get('a') is None
+
+
+class TestTieredCache:
+    """Test suite for the memory + SQLite cache."""
+
+    async def test_disk_tier_shared_between_workers(self, tmp_path):
+        """Test that a value written by one worker is read by another."""
+        path = tmp_path / 'shared.sqlite3'
+        worker_a = TieredCache('shared', 8, 60, path)
+        worker_b = TieredCache('shared', 8, 60, path)
+
+        await worker_a.set('key', ['leaf', 'spots'])
+
+        assert await worker_b.get('key') == ['leaf', 'spots']
+        assert worker_b.disk_hits == 1
+        assert await worker_b.get('key') == ['leaf', 'spots']
+        assert worker_b.memory_hits == 1
+
+    async def test_memory_hit_does_not_read_disk(self, monkeypatch, tmp_path):
+        """Test that a value held in memory is returned without a disk query."""
+        cache = TieredCache('memory-first', 8, 60, tmp_path / 'memory.sqlite3')
+        await cache.set('key', 'value')
+
+        async def no_disk(key, default=None):
+            raise AssertionError('disk tier read')
+
+        monkeypatch.setattr(cache.disk, 'get', no_disk)
+
+        assert await cache.get('key') == 'value'
+
+    async def test_expired_disk_entry_is_a_miss(self, tmp_path):
+        """Test that expired rows are not served from disk."""
+        store = SQLiteStore(tmp_path / 'expiry.sqlite3', 'expiry')
+        await store.set('key', 'value', ttl_seconds=-1)
+
+        assert await store.get('key') is None
+
+    async def test_disk_file_created_on_first_use(self, monkeypatch, tmp_path):
+        """Test that a cache file in CACHE_DIR is only created when first used, under the CACHE_DIR then set."""
+        cache = TieredCache('lazy-test', 8, 60, disk_path=cache_file('lazy.sqlite3'))
+        monkeypatch.setattr(settings, 'CACHE_DIR', str(tmp_path / 'cache'))
+        assert not (tmp_path / 'cache').exists()
+
+        await cache.set('k', 'v')
+
+        assert (tmp_path / 'cache' / 'lazy.sqlite3').exists()
+        cache.disk.close()
+
+    async def test_stats_report_hit_ratio(self, tmp_path):
+        """Test that hits and misses are counted."""
+        cache = TieredCache('stats', 8, 60, tmp_path / 'stats.sqlite3')
+        await cache.get('missing')
+        await cache.set('present', 1)
+        await cache.get('present')
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+
+class TestVisionCache:
+    """Test suite for content-addressed Vision results."""
+
+    async def test_same_bytes_analyzed_once(self, monkeypatch, tmp_path):
+        """Test that re-sent image bytes are served from the cache."""
+        monkeypatch.setattr(vision, '_image_cache', TieredCache('vision-test', 8, 60, tmp_path / 'vision.sqlite3'))
+        calls = []
+
+        async def fake_azure(image_bytes):
+            calls.append(image_bytes)
+            return ['leaf', 'rust']
+
+        monkeypatch.setattr(vision, '_analyze_with_azure', fake_azure)
+
+        first = await vision.analyze_image(b'photo')
+        second = await vision.analyze_image(b'photo')
+        other = await vision.analyze_image(b'other photo')
+
+        assert first == second == other == ['leaf', 'rust']
+        assert calls == [b'photo', b'other photo']
@@ -0,0 +1,142 @@
+"""Tests for per-dependency circuit breakers and router fallbacks."""
+import pytest
+
+from app.routers import diagnosis as diagnosis_router
+from app.services import vision, gpt4, speech
+from app.services.circuit_breaker import (
+    BreakerState,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+def _breaker(**overrides):
+    options = dict(
+        slow_call_seconds=1.0,
+        failure_rate_threshold=0.5,
+        slow_call_rate_threshold=0.8,
+        window_size=4,
+        minimum_calls=4,
+        open_seconds=30,
+        half_open_max_calls=1,
+    )
+    options.update(overrides)
+    return CircuitBreaker('translator', **options)
+
+
+class TestCircuitBreaker:
+    """Test suite for breaker state transitions."""
+
+    def test_opens_on_failure_rate(self):
+        """Test that the breaker opens once failures cross the threshold."""
+        breaker = _breaker()
+        for failed in (False, True, False, True):
+            breaker.before_call()
+            breaker.record(failed=failed, duration=0.1)
+
+        assert breaker.state == BreakerState.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.rejected_calls == 1
+
+    def test_opens_on_slow_calls(self):
+        """Test that mostly slow calls open the breaker."""
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(failed=False, duration=2.0)
+
+        assert breaker.state == BreakerState.OPEN
+
+    def test_stays_closed_below_minimum_calls(self):
+        """Test that a few early failures do not open the breaker."""
+        breaker = _breaker()
+        for _ in range(3):
+            breaker.before_call()
+            breaker.record(failed=True, duration=0.1)
+
+        assert breaker.state == BreakerState.CLOSED
+
+    def test_half_open_probe_closes(self):
+        """Test that a successful probe after the open period closes the breaker."""
+        breaker = _breaker(open_seconds=0)
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(failed=True, duration=0.1)
+        assert breaker.state == BreakerState.OPEN
+
+        breaker.before_call()
+        assert breaker.state == BreakerState.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # only one probe allowed
+
+        breaker.record(failed=False, duration=0.1)
+        assert breaker.state == BreakerState.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """Test that a failed probe opens the breaker again."""
+        breaker = _breaker(open_seconds=0)
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(failed=True, duration=0.1)
+
+        breaker.before_call()
+        breaker.record(failed=True, duration=0.1)
+
+        assert breaker.state == BreakerState.OPEN
+        assert breaker.times_opened == 2
+
+
+class TestBreakerFallbacks:
+    """Test suite for router fallbacks when a dependency is down."""
+
+    @pytest.fixture(autouse=True)
+    def _pipeline(self, monkeypatch):
+        async def analyze_image(image_bytes):
+            return ['leaf', 'spots']
+
+        async def get_advice(tags, query, language, **kwargs):
+            return 'Spray neem oil.'
+
+        async def stream_advice(tags, query, language, **kwargs):
+            yield 'Spray neem oil.'
+
+        async def translator_down(text, target_lang):
+            raise CircuitOpenError('translator', 30)
+
+        async def tts_down(text, language):
+            raise CircuitOpenError('speech', 30)
+
+        async def no_log(data):
+            return None
+
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', get_advice)
+        monkeypatch.setattr(gpt4, 'stream_agronomist_advice', stream_advice)
+        monkeypatch.setattr(speech, 'translate_text', translator_down)
+        monkeypatch.setattr(speech, 'synthesize_audio', tts_down)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis_event', no_log)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis', no_log)
+
+    def test_diagnose_falls_back_to_english_without_audio(self, client):
+        """Test that open Translator/TTS breakers degrade instead of failing."""
+        response = client.post(
+            '/api/diagnose',
+            files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+            data={'query': 'What is wrong?', 'language': 'sw'},
+        )
+
+        data = response.json()
+        assert data['status'] == 'success'
+        assert data['data']['diagnosis']['translated_text'] == 'Spray neem oil.'
+        assert data['data']['audio']['url'] is None
+        assert data['data']['fallback_stages'] == ['translation', 'audio']
+
+    def test_breaker_endpoint_lists_dependencies(self, client):
+        """Test that breaker state is exposed on the metrics endpoint."""
+        response = client.get('/api/metrics/breakers')
+
+        assert response.status_code == 200
+        data = response.json()['data']
+        assert set(data) >= {'vision', 'openai', 'translator', 'speech'}
+        assert data['vision']['state'] == 'closed'
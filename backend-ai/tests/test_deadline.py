@@ -0,0 +1,109 @@
+"""Tests for request deadline propagation across pipeline stages."""
+import asyncio
+import pytest
+
+from app.services.deadline import Deadline, DeadlineExceeded, SharedDeadline, stage_time_left
+
+
+async def _sleep_and_return(seconds, value):
+    await asyncio.sleep(seconds)
+    return value
+
+
+class TestDeadline:
+    """Test suite for the shared request deadline."""
+
+    def test_stage_budget_is_weighted_share(self):
+        """Test that a stage gets its weight's share of the remaining time."""
+        deadline = Deadline(10, {'vision': 1, 'diagnosis': 3})
+
+        assert deadline.stage_budget('vision') == pytest.approx(2.5, abs=0.05)
+        deadline.skip('vision')
+        assert deadline.stage_budget('diagnosis') == pytest.approx(10, abs=0.05)
+
+    async def test_fast_stage_returns_result(self):
+        """Test that a stage finishing in time returns its value."""
+        deadline = Deadline(1, {'vision': 1})
+
+        result = await deadline.run('vision', _sleep_and_return, 0, ['leaf'])
+
+        assert result == ['leaf']
+        assert deadline.cut_stages == []
+
+    async def test_optional_stage_is_cut(self):
+        """Test that an optional stage past its budget returns the default."""
+        deadline = Deadline(0.2, {'audio': 1})
+
+        result = await deadline.run('audio', _sleep_and_return, 5, 'mp3', optional=True)
+
+        assert result is None
+        assert deadline.cut_stages == ['audio']
+
+    async def test_required_stage_raises(self):
+        """Test that a required stage past its budget raises DeadlineExceeded."""
+        deadline = Deadline(0.2, {'diagnosis': 1})
+
+        with pytest.raises(DeadlineExceeded) as exc_info:
+            await deadline.run('diagnosis', _sleep_and_return, 5, 'advice')
+
+        assert exc_info.value.stage == 'diagnosis'
+        assert deadline.cut_stages == ['diagnosis']
+
+    async def test_spent_budget_skips_stage_without_calling(self):
+        """Test that a stage is not started once the budget is gone."""
+        deadline = Deadline(0, {'audio': 1})
+        called = []
+
+        async def generate_audio():
+            called.append(True)
+
+        await deadline.run('audio', generate_audio, optional=True)
+
+        assert called == []
+        assert deadline.cut_stages == ['audio']
+
+    async def test_stage_time_left_visible_inside_stage(self):
+        """Test that services can read the running stage's remaining time."""
+        deadline = Deadline(2, {'vision': 1, 'diagnosis': 1})
+
+        async def read_budget():
+            return stage_time_left()
+
+        left = await deadline.run('vision', read_budget)
+
+        assert 0 < left <= 1.0
+        assert stage_time_left() is None
+
+
+class TestSharedDeadline:
+    """Test suite for the deadline of a call made for several callers."""
+
+    async def _join(self, shared, budget):
+        async def join():
+            shared.join()
+        if budget is None:
+            await join()
+        else:
+            await Deadline(budget, {'stage': 1}).run('stage', join)
+
+    async def _time_left(self, shared):
+        async def read_budget():
+            return stage_time_left()
+        return await asyncio.get_running_loop().create_task(read_budget(), context=shared.context())
+
+    async def test_latest_caller_deadline_wins(self):
+        """Test that the call may run until the last caller's deadline."""
+        shared = SharedDeadline()
+        await self._join(shared, 1)
+        await self._join(shared, 3)
+
+        assert 2 < await self._time_left(shared) <= 3
+
+    async def test_caller_without_deadline_lifts_it(self):
+        """Test that one caller without a deadline leaves the call unbounded."""
+        shared = SharedDeadline()
+        await self._join(shared, 1)
+        await self._join(shared, None)
+        await self._join(shared, 3)
+
+        assert await self._time_left(shared) is None
@@ -0,0 +1,69 @@
+"""Tests for running the Azure services against the local stand-in."""
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import gpt4, http_client, speech, vision
+from app.services.cache import TieredCache
+from app.services.throttle import Throttle
+from app.services.translation_memory import TranslationMemory
+from tools.fake_azure import create_app
+
+FAKE = 'http://fake-azure.test'
+
+
+class TestFakeAzure:
+    """Test suite for the service layer talking to tools/fake_azure.py."""
+
+    @pytest.fixture(autouse=True)
+    def _point_at_fake(self, monkeypatch, tmp_path):
+        self.app = create_app({
+            service: {'latency': {'distribution': 'fixed', 'ms': 0}, 'payload': {'token_interval_ms': 0, 'chunk_interval_ms': 0}}
+            for service in ('vision', 'openai', 'translator', 'tts', 'stt')
+        }, seed=1)
+        for name in ('VISION', 'OPENAI', 'SPEECH', 'TRANSLATOR'):
+            monkeypatch.setattr(settings, f'AZURE_{name}_KEY', 'fake-key')
+        monkeypatch.setattr(settings, 'AZURE_VISION_ENDPOINT', f'{FAKE}/vision/v3.2/')
+        monkeypatch.setattr(settings, 'AZURE_OPENAI_ENDPOINT', FAKE)
+        monkeypatch.setattr(settings, 'AZURE_TRANSLATOR_ENDPOINT', FAKE)
+        monkeypatch.setattr(settings, 'AZURE_SPEECH_ENDPOINT', FAKE)
+        monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+        monkeypatch.setattr(vision, '_image_cache', TieredCache('fake-vision', 16, 60, tmp_path / 'vision.sqlite3'))
+        monkeypatch.setattr(gpt4, '_advice_cache', TieredCache('fake-advice', 16, 60, tmp_path / 'advice.sqlite3'))
+        monkeypatch.setattr(speech, 'translation_memory', TranslationMemory(TieredCache('fake-tm', 16, 60, tmp_path / 'tm.sqlite3')))
+        monkeypatch.setitem(http_client._clients, FAKE, httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app)))
+
+    async def test_vision_tags(self):
+        """Test that the Vision analyze fake returns tags."""
+        tags = await vision.analyze_image(b'not really a jpeg')
+
+        assert 'leaf' in tags
+
+    async def test_streamed_advice(self):
+        """Test that chat completions stream as server-sent events."""
+        parts = [part async for part in gpt4.stream_agronomist_advice(['leaf'], 'What is wrong?', 'en')]
+
+        assert len(parts) > 10
+        assert ''.join(parts).startswith('Remove the infected leaves')
+
+    async def test_translate_and_speak(self):
+        """Test that Translator and TTS fakes answer the service calls."""
+        translated = await speech.translate_text('Spray neem oil.', 'sw')
+        audio_id = await speech.synthesize_audio(translated, 'sw')
+
+        assert translated.startswith('[sw] Spray neem oil.')
+        assert (await speech.audio_store.read(audio_id)).startswith(b'\xff\xfb')
+
+    async def test_throttle_burst_retried(self, monkeypatch):
+        """Test that a 429 burst is honoured through Retry-After and retried."""
+        self.app.state.fake.configure({'openai': {
+            'throttle_bursts': {'every_seconds': 3600, 'duration_seconds': 3600, 'rate': 1.0, 'retry_after_ms': 10}
+        }})
+        throttle = Throttle('fake-openai', requests_per_minute=0, max_wait_seconds=5, max_retries=1)
+        monkeypatch.setattr(gpt4, '_throttle', throttle)
+
+        with pytest.raises(Exception):
+            await gpt4.get_agronomist_advice(['leaf'], 'Any help?', 'en')
+
+        assert throttle.snapshot()['rate_limited_responses'] == 2
+        assert self.app.state.fake.stats['openai']['throttled'] == 2
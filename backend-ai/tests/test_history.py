@@ -3,6 +3,10 @@ import json
 import pytest
 from datetime import datetime
 
+from app.routers import history as history_router
+from app.services.deadline import Deadline
+from app.services.pipeline import PipelineRun
+
 
 class TestHistoryEndpoints:
     """Test suite for diagnosis history endpoints."""
@@ -280,3 +284,32 @@ class TestHistoryEndpoints:
         )
         data = response.json()
         assert len(data['data']) == 0
+
+
+class TestStoredImage:
+    """Test suite for the photo kept with a history record."""
+
+    async def _store(self, monkeypatch, tmp_path, prepared, **inputs):
+        monkeypatch.chdir(tmp_path)
+        image = b'\x89PNG-bytes'
+        run = PipelineRun({'image': image, 'user_id': 'u1', 'diagnosis_id': 'd1', **inputs}, Deadline())
+        run.results['prepare'] = b'jpeg-bytes' if prepared else image
+        filename = await history_router.store_image(run)
+        return filename, (tmp_path / 'data' / 'images' / filename).read_bytes()
+
+    async def test_prepared_photo_is_jpeg(self, monkeypatch, tmp_path):
+        """Test that a preprocessed photo is stored as .jpg."""
+        filename, data = await self._store(monkeypatch, tmp_path, True, content_type='image/png')
+
+        assert filename == 'u1/d1.jpg'
+        assert data == b'jpeg-bytes'
+
+    async def test_unprepared_photo_keeps_its_format(self, monkeypatch, tmp_path):
+        """Test that an upload stored as-is keeps the extension of its own format."""
+        filename, data = await self._store(monkeypatch, tmp_path, False, content_type='image/png')
+        by_name, _ = await self._store(monkeypatch, tmp_path, False, filename='leaf.WEBP',
+                                       content_type='application/octet-stream')
+
+        assert filename == 'u1/d1.png'
+        assert data == b'\x89PNG-bytes'
+        assert by_name == 'u1/d1.webp'
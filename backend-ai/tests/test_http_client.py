@@ -0,0 +1,66 @@
+"""Tests for the shared pooled HTTP client used by the Azure services."""
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import http_client, vision
+from app.services.cache import TieredCache
+
+
+class TestHttpClient:
+    """Test suite for the per-host connection pools."""
+
+    @pytest.fixture(autouse=True)
+    def _empty_vision_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(vision, '_image_cache', TieredCache('vision-test', 16, 60, tmp_path / 'vision.sqlite3'))
+
+    async def test_client_reused_per_host(self):
+        """Test that the same host shares one pooled client."""
+        first = http_client.get_client('https://vision.example.com/analyze')
+        second = http_client.get_client('https://vision.example.com/other?x=1')
+        other = http_client.get_client('https://openai.example.com/chat')
+
+        assert first is second
+        assert first is not other
+        await http_client.shutdown()
+
+    async def test_shutdown_closes_pools(self):
+        """Test that shutdown closes and forgets every client."""
+        client = http_client.get_client('https://vision.example.com/')
+        await http_client.shutdown()
+
+        assert client.is_closed
+        assert http_client.pool_stats()['pools'] == 0
+
+    async def test_vision_uses_shared_client(self, monkeypatch):
+        """Test that vision.analyze_image sends through the shared pool."""
+        monkeypatch.setattr(settings, 'AZURE_VISION_KEY', 'key')
+        monkeypatch.setattr(settings, 'AZURE_VISION_ENDPOINT', 'https://vision.example.com/vision/v3.2/')
+        calls = []
+
+        async def fake_post(url, **kwargs):
+            calls.append((url, kwargs))
+            return httpx.Response(
+                200,
+                json={'tags': [{'name': 'leaf'}], 'description': {'captions': [{'text': 'a green leaf'}]}},
+                request=httpx.Request('POST', url),
+            )
+
+        monkeypatch.setattr(http_client, 'post', fake_post)
+        tags = await vision.analyze_image(b'image-bytes')
+
+        assert set(tags) == {'leaf', 'green'}
+        assert calls[0][0] == 'https://vision.example.com/vision/v3.2/analyze'
+        assert calls[0][1]['content'] == b'image-bytes'
+
+    async def test_http_errors_are_wrapped(self, monkeypatch):
+        """Test that transport errors surface as service errors."""
+        monkeypatch.setattr(settings, 'AZURE_VISION_KEY', 'key')
+        monkeypatch.setattr(settings, 'AZURE_VISION_ENDPOINT', 'https://vision.example.com/')
+
+        async def failing_post(url, **kwargs):
+            raise httpx.ConnectError('connection refused')
+
+        monkeypatch.setattr(http_client, 'post', failing_post)
+        with pytest.raises(Exception, match='Vision analysis failed'):
+            await vision.analyze_image(b'image-bytes')
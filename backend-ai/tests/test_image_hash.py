@@ -0,0 +1,149 @@
+"""Tests for perceptual hashing and near-duplicate Vision reuse."""
+import io
+import random
+import pytest
+from PIL import Image, ImageDraw
+
+from app.config import settings
+from app.services import vision
+from app.services.cache import SQLiteStore, TieredCache
+from app.services.image_hash import BKTree, NearDuplicateIndex, dhash, hamming
+
+
+def _leaf_image():
+    """Synthetic textured 'leaf' with a brown lesion."""
+    img = Image.linear_gradient('L').resize((640, 480)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    rnd = random.Random(1)
+    for _ in range(12):
+        x, y = rnd.randint(0, 540), rnd.randint(0, 380)
+        draw.ellipse((x, y, x + rnd.randint(40, 160), y + rnd.randint(40, 160)),
+                     fill=(rnd.randint(0, 255), rnd.randint(0, 255), 40))
+    draw.ellipse((200, 150, 360, 270), fill=(120, 70, 20))
+    return img
+
+
+def _jpeg(img, size=None, quality=95, crop=0):
+    """Encode an image, optionally cropped, resized and recompressed."""
+    if crop:
+        img = img.crop((crop, crop, img.width - crop, img.height - crop))
+    if size:
+        img = img.resize(size)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _original():
+    return _jpeg(_leaf_image())
+
+
+def _whatsapp_copy():
+    """Downscaled, slightly cropped, heavily recompressed copy."""
+    return _jpeg(_leaf_image(), size=(320, 240), quality=40, crop=6)
+
+
+def _other_photo():
+    return _jpeg(_leaf_image().transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+
+
+class TestPerceptualHash:
+    """Test suite for dHash and the BK-tree."""
+
+    def test_recompressed_photo_is_close(self):
+        """Test that recompression, resizing and cropping barely change the hash."""
+        original = dhash(_original())
+        recompressed = dhash(_whatsapp_copy())
+
+        assert hamming(original, recompressed) <= 6
+
+    def test_different_photo_is_far(self):
+        """Test that a different image is outside the match distance."""
+        original = dhash(_original())
+        different = dhash(_other_photo())
+
+        assert hamming(original, different) > 6
+
+    def test_bk_tree_search_within_radius(self):
+        """Test that the BK-tree returns only hashes within the radius."""
+        tree = BKTree()
+        tree.add(0b0000, 'zero')
+        tree.add(0b0001, 'one-bit')
+        tree.add(0b0111, 'three-bits')
+        tree.add(0b1111, 'four-bits')
+
+        assert tree.search(0b0000, 1) == [(0, 'zero'), (1, 'one-bit')]
+        assert [value for _, value in tree.search(0b0000, 4)] == ['zero', 'one-bit', 'three-bits', 'four-bits']
+
+    def test_bk_tree_skips_repeated_value(self):
+        """Test that re-adding a value under the same hash stores it once."""
+        tree = BKTree()
+
+        assert tree.add(0b0101, 'leaf')
+        assert not tree.add(0b0101, 'leaf')
+        assert tree.add(0b0101, 'other-leaf')
+        assert tree.size == 2
+
+    async def test_index_rebuilt_when_full(self, tmp_path):
+        """Test that the index keeps only the newest hashes once it outgrows its limit."""
+        index = NearDuplicateIndex(SQLiteStore(tmp_path / 'phash.sqlite3', 'vision_phash'), 60, max_entries=3)
+        for value in range(5):
+            await index.add(value << 8, f'image-{value}')
+
+        assert index.tree.size <= 3
+        assert await index.find(4 << 8, 0) == [(0, 'image-4')]
+        assert await index.find(0, 0) == []
+        assert index.stats()['index_rebuilds'] >= 1
+
+    async def test_index_rebuild_drops_expired_hashes(self, tmp_path):
+        """Test that an old index is rebuilt from the unexpired rows only."""
+        store = SQLiteStore(tmp_path / 'phash.sqlite3', 'vision_phash')
+        index = NearDuplicateIndex(store, 60, rebuild_seconds=0)
+        await index.add(0b1010, 'fresh')
+        await index.add(0b1011, 'stale')
+        await store.set('stale', format(0b1011, 'x'), -1)  # expired since it was indexed
+
+        assert [key for _, key in await index.find(0b1010, 1)] == ['fresh']
+
+
+class TestNearDuplicateReuse:
+    """Test suite for reusing Vision results for near-duplicate images."""
+
+    @pytest.fixture(autouse=True)
+    def _isolated_vision(self, monkeypatch, tmp_path):
+        path = tmp_path / 'vision.sqlite3'
+        monkeypatch.setattr(vision, '_image_cache', TieredCache('vision-test', 8, 60, path))
+        monkeypatch.setattr(vision, '_near_duplicates', NearDuplicateIndex(SQLiteStore(path, 'vision_phash'), 60))
+        monkeypatch.setattr(settings, 'VISION_PHASH_ENABLED', True)
+        monkeypatch.setattr(settings, 'VISION_PHASH_MAX_DISTANCE', 6)
+        self.calls = []
+
+        async def fake_azure(image_bytes):
+            self.calls.append(image_bytes)
+            return ['leaf', 'blight']
+
+        monkeypatch.setattr(vision, '_analyze_with_azure', fake_azure)
+
+    async def test_recompressed_photo_reuses_tags(self):
+        """Test that a WhatsApp-style recompressed photo skips Vision."""
+        await vision.analyze_image(_original())
+        tags = await vision.analyze_image(_whatsapp_copy())
+
+        assert tags == ['leaf', 'blight']
+        assert len(self.calls) == 1
+        assert vision.near_duplicate_stats()['hits'] == 1
+
+    async def test_distinct_photo_calls_vision(self):
+        """Test that a different photo is still analyzed."""
+        await vision.analyze_image(_original())
+        await vision.analyze_image(_other_photo())
+
+        assert len(self.calls) == 2
+
+    async def test_matching_disabled_by_setting(self, monkeypatch):
+        """Test that near-duplicate matching can be turned off."""
+        monkeypatch.setattr(settings, 'VISION_PHASH_ENABLED', False)
+        await vision.analyze_image(_original())
+        await vision.analyze_image(_whatsapp_copy())
+
+        assert len(self.calls) == 2
@@ -0,0 +1,105 @@
+"""Tests for preprocessing uploaded photos before Vision."""
+import io
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.services import image_prep
+
+
+def _jpeg(size=(400, 200), orientation=None):
+    img = Image.new('RGB', size, (120, 180, 60))
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    img.save(output, format='JPEG', exif=exif.tobytes(), quality=95)
+    return output.getvalue()
+
+
+def _open(data):
+    return Image.open(io.BytesIO(data))
+
+
+class TestPreprocess:
+    """Test suite for the Pillow preprocessing step."""
+
+    def test_downscales_longest_side(self):
+        """Test that the longest side is capped and the aspect ratio kept."""
+        img = _open(image_prep.preprocess(_jpeg((2000, 1000)), max_side=500, quality=85))
+
+        assert img.size == (500, 250)
+        assert img.format == 'JPEG'
+
+    def test_applies_exif_orientation(self):
+        """Test that a photo taken in portrait comes out upright."""
+        img = _open(image_prep.preprocess(_jpeg((400, 200), orientation=6), max_side=1024, quality=85))
+
+        assert img.size == (200, 400)
+
+    def test_strips_metadata(self):
+        """Test that EXIF data (camera, GPS...) is not carried over."""
+        img = _open(image_prep.preprocess(_jpeg(), max_side=1024, quality=85))
+
+        assert len(img.getexif()) == 0
+
+    def test_flattens_transparency(self):
+        """Test that a transparent PNG is converted to an RGB JPEG."""
+        output = io.BytesIO()
+        Image.new('RGBA', (50, 50), (0, 0, 0, 0)).save(output, format='PNG')
+
+        img = _open(image_prep.preprocess(output.getvalue(), max_side=1024, quality=85))
+
+        assert img.mode == 'RGB'
+
+
+class TestPrepareImage:
+    """Test suite for running preprocessing off the event loop."""
+
+    async def test_undecodable_bytes_passed_through(self):
+        """Test that bytes Pillow cannot read are sent on unchanged."""
+        assert await image_prep.prepare_image(b'not an image') == b'not an image'
+
+    async def test_disabled_returns_original(self, monkeypatch):
+        """Test that IMAGE_PREP_ENABLED=False leaves uploads untouched."""
+        monkeypatch.setattr(settings, 'IMAGE_PREP_ENABLED', False)
+        original = _jpeg()
+
+        assert await image_prep.prepare_image(original) == original
+
+    async def test_broken_pool_is_replaced(self, monkeypatch):
+        """Test that a pool whose worker died is swapped for a new one."""
+        class BrokenPool:
+            def submit(self, *args, **kwargs):
+                raise BrokenProcessPool('worker died')
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                self.stopped = True
+
+        broken, fresh = BrokenPool(), object()
+        monkeypatch.setattr(image_prep, '_executor', broken)
+        monkeypatch.setattr(image_prep, '_new_executor', lambda: fresh)
+        restarts = image_prep.prep_stats()['pool_restarts']
+        original = _jpeg()
+
+        assert await image_prep.prepare_image(original) == original
+        assert broken.stopped
+        assert image_prep._executor is fresh
+        assert image_prep.prep_stats()['pool_restarts'] == restarts + 1
+
+    @pytest.mark.slow
+    async def test_runs_in_process_pool(self, monkeypatch):
+        """Test that the lifespan-managed worker processes do the work."""
+        monkeypatch.setattr(settings, 'IMAGE_PREP_WORKERS', 1)
+        monkeypatch.setattr(settings, 'IMAGE_MAX_SIDE', 100)
+        await image_prep.startup()
+        try:
+            prepared = await image_prep.prepare_image(_jpeg((800, 400)))
+            assert image_prep.prep_stats()['workers'] == 1
+        finally:
+            await image_prep.shutdown()
+
+        assert _open(prepared).size == (100, 50)
@@ -0,0 +1,259 @@
+"""Tests for the persistent diagnosis job queue and its worker pool."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.main import app
+from app.routers import diagnosis as diagnosis_router
+from app.services import audio_store, gpt4, job_queue, speech, vision
+from app.services.job_queue import JobStore
+from tools.fake_azure import create_app
+
+HOOKS = 'http://hooks.test'
+
+
+@pytest.fixture(autouse=True)
+def _services(monkeypatch, tmp_path):
+    async def analyze_image(image_bytes):
+        return ['maize', 'leaf', 'rust']
+
+    async def stream_advice(tags, query, language, **kwargs):
+        for token in ('DISEASE: Leaf rust.\n', 'Remove leaves.'):
+            yield token
+
+    async def synthesize_audio(text, language):
+        audio_id = audio_store.audio_id(text, speech.voice_for(language))
+        await audio_store.save(audio_id, b'mp3')
+        return audio_id
+
+    async def no_log(data):
+        return None
+
+    monkeypatch.setattr(job_queue, '_store', JobStore(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+    monkeypatch.setattr(settings, 'SPEECH_PIPELINE_ENABLED', False)
+    monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+    monkeypatch.setattr(gpt4, 'stream_agronomist_advice', stream_advice)
+    monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+    monkeypatch.setattr(diagnosis_router, 'log_diagnosis_event', no_log)
+    monkeypatch.setattr(diagnosis_router, 'log_diagnosis', no_log)
+
+
+def api_client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test')
+
+
+async def submit(client, **data):
+    return await client.post(
+        '/api/jobs/diagnose',
+        files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+        data={'query': 'What is this?', 'language': 'en', **data},
+    )
+
+
+class TestJobQueue:
+    """Test suite for submitting, running and recovering jobs."""
+
+    async def test_job_runs_to_done(self):
+        """Test that a submitted job is queued at once and finishes with the diagnosis."""
+        async with api_client() as client:
+            response = await submit(client)
+            queued = response.json()['data']
+            assert response.status_code == 202
+            assert queued['status'] == 'queued'
+
+            assert await job_queue.run_next('worker-1')
+            done = (await client.get(queued['job_url'])).json()['data']
+
+        assert done['status'] == 'done'
+        assert done['stage'] == 'done' and done['progress'] == 1.0
+        assert done['result']['diagnosis']['original_text'] == 'DISEASE: Leaf rust.\nRemove leaves.'
+        assert done['result']['audio']['url']
+        assert not await job_queue.run_next('worker-1')
+
+    async def test_job_survives_restart(self, tmp_path, monkeypatch):
+        """Test that a job whose worker died is taken over from the same file."""
+        job = job_queue.submit('diagnose', {'query': 'Why?', 'language': 'en'}, b'image-bytes')
+        claimed, _ = job_queue._store.claim('dead-worker', 60, 3)
+        assert claimed['id'] == job['job_id']
+
+        # New process: a fresh store on the same file, lease already expired
+        monkeypatch.setattr(job_queue, '_store', JobStore(tmp_path / 'jobs.sqlite3'))
+        monkeypatch.setattr(settings, 'JOB_LEASE_SECONDS', 0)
+        assert await job_queue.run_next('worker-2')
+
+        recovered = job_queue.get(job['job_id'])
+        assert recovered['status'] == 'done'
+        assert recovered['attempts'] == 2
+
+    async def test_failed_attempts_retried(self, monkeypatch):
+        """Test that a failing job is retried, then failed with the error."""
+        async def explode(params, payload, progress):
+            raise RuntimeError('Vision unavailable')
+
+        monkeypatch.setitem(job_queue._handlers, 'explode', explode)
+        monkeypatch.setattr(settings, 'JOB_MAX_ATTEMPTS', 2)
+        job = job_queue.submit('explode', {}, b'')
+
+        await job_queue.run_next('worker-1')
+        assert job_queue.get(job['job_id'])['status'] == 'queued'
+        await job_queue.run_next('worker-1')
+
+        failed = job_queue.get(job['job_id'])
+        assert failed['status'] == 'failed'
+        assert failed['attempts'] == 2
+        assert failed['error'] == 'Vision unavailable'
+
+    async def test_lease_renewed_while_running(self, monkeypatch):
+        """Test that a job running longer than its lease is not taken over."""
+        async def slow(params, payload, progress):
+            await asyncio.sleep(0.3)
+            return {'ok': True}
+
+        monkeypatch.setitem(job_queue._handlers, 'slow', slow)
+        monkeypatch.setattr(settings, 'JOB_LEASE_SECONDS', 0.1)
+        job = job_queue.submit('slow', {}, b'')
+
+        running = asyncio.create_task(job_queue.run_next('worker-1'))
+        await asyncio.sleep(0.2)
+        stolen, _ = job_queue._store.claim('worker-2', 0.1, 3)
+        await running
+
+        assert stolen is None
+        assert job_queue.get(job['job_id'])['status'] == 'done'
+
+    async def test_lease_lost_stops_the_run(self, monkeypatch):
+        """Test that a worker whose job was taken over stops running it and stores nothing."""
+        cancelled = []
+
+        async def slow(params, payload, progress):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        monkeypatch.setitem(job_queue._handlers, 'slow', slow)
+        monkeypatch.setattr(settings, 'JOB_LEASE_SECONDS', 0.1)
+        job = job_queue.submit('slow', {}, b'')
+
+        running = asyncio.create_task(job_queue.run_next('worker-1'))
+        await asyncio.sleep(0.01)
+        taken, taken_over = job_queue._store.claim('worker-2', 0, 3)
+        assert await asyncio.wait_for(running, 1)
+
+        assert taken['id'] == job['job_id'] and taken_over == 1
+        assert cancelled == [True]
+        assert job_queue._store.get(job['job_id'])['worker'] == 'worker-2'
+
+    async def test_worker_pool_picks_up_jobs(self, monkeypatch):
+        """Test that the started workers run a submitted job without polling delay."""
+        monkeypatch.setattr(settings, 'JOB_WORKERS', 1)
+        monkeypatch.setattr(settings, 'JOB_POLL_SECONDS', 30)
+        await job_queue.startup()
+        try:
+            job = job_queue.submit('diagnose', {'query': 'Why?', 'language': 'en'}, b'image-bytes')
+            for _ in range(100):
+                if job_queue.get(job['job_id'])['status'] == 'done':
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await job_queue.shutdown()
+
+        assert job_queue.get(job['job_id'])['status'] == 'done'
+
+
+class TestJobCallbacks:
+    """Test suite for completion callbacks, against the local stand-in server."""
+
+    @pytest.fixture(autouse=True)
+    def _hooks(self, monkeypatch):
+        self.addresses = ['93.184.216.34']
+
+        async def resolve(host, port):
+            return self.addresses
+
+        self.hooks = create_app()
+        monkeypatch.setattr(settings, 'JOB_CALLBACK_ALLOWED_HOSTS', 'hooks.test')
+        monkeypatch.setattr(job_queue, '_resolve', resolve)
+        monkeypatch.setattr(
+            job_queue, '_callback_client',
+            lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=self.hooks))
+        )
+
+    async def test_callback_posted_on_completion(self):
+        """Test that the finished job is POSTed to the callback URL."""
+        async with api_client() as client:
+            response = await submit(client, callback_url=f'{HOOKS}/_fake/callbacks')
+            job_id = response.json()['data']['job_id']
+            await job_queue.run_next('worker-1')
+            await asyncio.gather(*job_queue._callbacks)
+
+        received = self.hooks.state.fake.callbacks
+        assert [callback['job_id'] for callback in received] == [job_id]
+        assert received[0]['status'] == 'done'
+        assert job_queue.get(job_id)['callback_status'] == 'delivered'
+
+    async def test_callback_host_must_be_allowed(self, monkeypatch):
+        """Test that callbacks to hosts outside the allow list, or to private addresses, are refused."""
+        monkeypatch.setattr(settings, 'JOB_CALLBACK_ALLOWED_HOSTS', 'hooks.test,169.254.169.254,127.0.0.1')
+
+        async with api_client() as client:
+            allowed = await submit(client, callback_url=f'{HOOKS}/_fake/callbacks')
+            other = await submit(client, callback_url='http://elsewhere.test/hook')
+            metadata = await submit(client, callback_url='http://169.254.169.254/latest')
+            loopback = await submit(client, callback_url='http://127.0.0.1:8000/admin')
+            not_http = await submit(client, callback_url='file:///etc/passwd')
+
+        assert allowed.status_code == 202
+        assert other.status_code == 400
+        assert metadata.status_code == 400
+        assert loopback.status_code == 400
+        assert not_http.status_code == 400
+
+    async def test_callbacks_disabled_without_allow_list(self, monkeypatch):
+        """Test that an empty allow list turns callbacks off rather than allowing any host."""
+        monkeypatch.setattr(settings, 'JOB_CALLBACK_ALLOWED_HOSTS', '')
+
+        async with api_client() as client:
+            response = await submit(client, callback_url=f'{HOOKS}/_fake/callbacks')
+
+        assert response.status_code == 400
+
+    async def test_callback_not_sent_to_private_address(self):
+        """Test that an allowed host name resolving to a private address gets no callback."""
+        self.addresses = ['10.0.0.5']
+
+        async with api_client() as client:
+            response = await submit(client, callback_url=f'{HOOKS}/_fake/callbacks')
+            job_id = response.json()['data']['job_id']
+            await job_queue.run_next('worker-1')
+            await asyncio.gather(*job_queue._callbacks)
+
+        assert self.hooks.state.fake.callbacks == []
+        assert job_queue.get(job_id)['callback_status'] == 'failed: callback host not allowed'
+
+    async def test_callback_sent_to_checked_address(self, monkeypatch):
+        """Test that delivery connects to the vetted IP instead of resolving the host again."""
+        sent = []
+
+        def record(request):
+            sent.append(request)
+            return httpx.Response(200)
+
+        monkeypatch.setattr(
+            job_queue, '_callback_client',
+            lambda: httpx.AsyncClient(transport=httpx.MockTransport(record))
+        )
+
+        async with api_client() as client:
+            response = await submit(client, callback_url='https://hooks.test:8443/hook')
+            await job_queue.run_next('worker-1')
+            await asyncio.gather(*job_queue._callbacks)
+
+        assert [str(request.url) for request in sent] == ['https://93.184.216.34:8443/hook']
+        assert sent[0].headers['host'] == 'hooks.test:8443'
+        assert sent[0].extensions['sni_hostname'] == 'hooks.test'
+        assert job_queue.get(response.json()['data']['job_id'])['callback_status'] == 'delivered'
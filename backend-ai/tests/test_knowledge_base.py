@@ -0,0 +1,90 @@
+"""Tests for the crop knowledge index and the ranked v2 prompt."""
+from app.models import CROP_DISEASE_DATABASE, CropType, EnhancedDiagnoseRequest, Season
+from app.routers import enhanced as enhanced_router
+from app.services import gpt4, knowledge_base
+
+
+class TestKnowledgeIndex:
+    """Test suite for symptom-to-problem ranking."""
+
+    def test_every_crop_covered(self):
+        """Test that the knowledge base has diseases and pests for all crop types."""
+        assert set(CROP_DISEASE_DATABASE) == set(CropType)
+        for crop in CropType:
+            assert CROP_DISEASE_DATABASE[crop]['common_diseases']
+            assert CROP_DISEASE_DATABASE[crop]['common_pests']
+
+    def test_stemming(self):
+        """Test that word forms reduce to the same token."""
+        assert knowledge_base.tokenize('Wilting wilted wilts') == ['wilt', 'wilt', 'wilt']
+        assert knowledge_base.tokenize('leaves with holes and patches') == ['leaf', 'hole', 'patch']
+
+    def test_ranks_by_symptoms(self):
+        """Test that specific symptoms put the matching problem first."""
+        matches = knowledge_base.rank(['leaf', 'rust', 'orange'], 'orange powder on my maize leaves')
+
+        assert matches[0].problem.name == 'Corn Rust'
+        assert matches[0].problem.crop == CropType.MAIZE
+        assert matches[0].names_problem
+
+    def test_crop_filter(self):
+        """Test that a known crop only returns that crop's problems."""
+        matches = knowledge_base.rank(['leaf', 'spot', 'yellow'], crop=CropType.BEAN, limit=10)
+
+        assert matches
+        assert all(match.problem.crop == CropType.BEAN for match in matches)
+
+    def test_crop_detected_from_alias(self):
+        """Test that crop aliases in the tags select the crop."""
+        matches = knowledge_base.rank(['corn', 'caterpillar', 'whorl'])
+
+        assert matches[0].problem.name == 'Fall Armyworm'
+
+    def test_season_boost(self):
+        """Test that problems of the current season outrank equal matches."""
+        tags = ['cabbage', 'leaf', 'curled']
+        rainy = knowledge_base.rank(tags, 'gray mould and aphids', season=Season.RAINY_SEASON)
+        dry = knowledge_base.rank(tags, 'gray mould and aphids', season=Season.DRY_SEASON)
+
+        assert rainy[0].problem.name == 'Downy Mildew'
+        assert dry[0].problem.name == 'Cabbage Aphids'
+
+    def test_no_match(self):
+        """Test that unrelated tags give no candidates."""
+        assert knowledge_base.rank(['sky', 'outdoor']) == []
+
+
+class TestRankedPrompt:
+    """Test suite for the candidates sent to GPT-4 by /api/v2."""
+
+    def test_prompt_lists_ranked_candidates(self):
+        """Test that the v2 system prompt names the best matches with their symptoms."""
+        request = EnhancedDiagnoseRequest(
+            image_base64='', question='Caterpillars in the whorl', crop_type=CropType.MAIZE
+        )
+
+        inputs = enhanced_router.build_advice_inputs(request, ['leaf', 'holes'])
+
+        assert inputs['candidates'][0] == 'Fall Armyworm'
+        assert 'LIKELY PROBLEMS (MAIZE)' in inputs['system_prompt']
+        assert '- Fall Armyworm (maize pest): ragged holes in leaves' in inputs['system_prompt']
+
+    def test_prompt_falls_back_to_crop_lists(self):
+        """Test that the crop's common problems are used when no tag matches."""
+        request = EnhancedDiagnoseRequest(image_base64='', question='Help', crop_type=CropType.RICE)
+
+        inputs = enhanced_router.build_advice_inputs(request, ['outdoor'])
+
+        assert inputs['candidates'] == []
+        assert 'Common Diseases: Rice Blast' in inputs['system_prompt']
+
+    def test_system_prompt_sent_to_model(self, monkeypatch):
+        """Test that a given system prompt replaces the default one in the request."""
+        monkeypatch.setattr(gpt4.settings, 'AZURE_OPENAI_KEY', 'key')
+        monkeypatch.setattr(gpt4.settings, 'AZURE_OPENAI_ENDPOINT', 'https://openai.test')
+
+        _, _, _, payload = gpt4._chat_request(['leaf'], 'why', 'en', 'Custom prompt')
+        _, _, _, default = gpt4._chat_request(['leaf'], 'why', 'en')
+
+        assert payload['messages'][0] == {'role': 'system', 'content': 'Custom prompt'}
+        assert default['messages'][0]['content'].startswith('You are AgriVoice')
@@ -0,0 +1,126 @@
+"""Tests for cross-request micro-batching."""
+import asyncio
+
+import pytest
+
+from app.services.deadline import Deadline, stage_time_left
+from app.services.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    """Test suite for coalescing concurrent calls."""
+
+    @pytest.fixture(autouse=True)
+    def _upstream(self):
+        self.calls = []
+
+        async def send(texts, key):
+            self.calls.append((key, list(texts)))
+            await asyncio.sleep(0)
+            return [f'<{key}>{text}' for text in texts]
+
+        self.send = send
+
+    def _batcher(self, **overrides):
+        options = dict(window_seconds=0.01, max_items=100, max_chars=10000)
+        options.update(overrides)
+        return MicroBatcher('test', self.send, **options)
+
+    async def test_concurrent_requests_share_one_call(self):
+        """Test that requests within the window are sent together."""
+        batcher = self._batcher()
+
+        results = await asyncio.gather(
+            batcher.submit(['Spray neem.'], 'sw'),
+            batcher.submit(['Remove leaves.', 'Water early.'], 'sw'),
+        )
+
+        assert results == [['<sw>Spray neem.'], ['<sw>Remove leaves.', '<sw>Water early.']]
+        assert self.calls == [('sw', ['Spray neem.', 'Remove leaves.', 'Water early.'])]
+        assert batcher.stats()['batch_size_histogram']['le_2'] == 1
+
+    async def test_grouped_by_key(self):
+        """Test that different target languages are sent separately."""
+        batcher = self._batcher()
+
+        results = await asyncio.gather(
+            batcher.submit(['Spray neem.'], 'sw'),
+            batcher.submit(['Spray neem.'], 'fr'),
+        )
+
+        assert results == [['<sw>Spray neem.'], ['<fr>Spray neem.']]
+        assert sorted(key for key, _ in self.calls) == ['fr', 'sw']
+
+    async def test_duplicate_texts_sent_once(self):
+        """Test that the same text from two callers is translated once."""
+        batcher = self._batcher()
+
+        results = await asyncio.gather(
+            batcher.submit(['Spray neem.'], 'sw'),
+            batcher.submit(['Spray neem.'], 'sw'),
+        )
+
+        assert results == [['<sw>Spray neem.'], ['<sw>Spray neem.']]
+        assert self.calls == [('sw', ['Spray neem.'])]
+
+    async def test_size_cap_flushes_early(self):
+        """Test that a full batch is sent without waiting for the window."""
+        batcher = self._batcher(window_seconds=60, max_items=2)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit(['a'], 'sw'), batcher.submit(['b'], 'sw')),
+            timeout=1,
+        )
+
+        assert results == [['<sw>a'], ['<sw>b']]
+        assert batcher.stats()['flush_reasons']['max_items'] == 1
+
+    async def test_char_cap_starts_new_batch(self):
+        """Test that a request that would overflow the character cap goes in the next batch."""
+        batcher = self._batcher(max_chars=10)
+
+        await asyncio.gather(batcher.submit(['a' * 6], 'sw'), batcher.submit(['b' * 6], 'sw'))
+
+        assert self.calls == [('sw', ['a' * 6]), ('sw', ['b' * 6])]
+
+    async def test_errors_reach_every_caller(self):
+        """Test that a failed batch raises in all waiting callers."""
+        async def failing(texts, key):
+            raise RuntimeError('Translator down')
+
+        batcher = MicroBatcher('test', failing, window_seconds=0.01, max_items=100, max_chars=10000)
+
+        results = await asyncio.gather(
+            batcher.submit(['a'], 'sw'), batcher.submit(['b'], 'sw'), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def test_cancelled_caller_does_not_cancel_batch(self):
+        """Test that one caller giving up leaves the others their results."""
+        batcher = self._batcher()
+
+        impatient = asyncio.ensure_future(batcher.submit(['a'], 'sw'))
+        patient = asyncio.ensure_future(batcher.submit(['b'], 'sw'))
+        await asyncio.sleep(0)
+        impatient.cancel()
+
+        assert await patient == ['<sw>b']
+        assert self.calls == [('sw', ['a', 'b'])]
+
+    async def test_batch_runs_under_latest_caller_deadline(self):
+        """Test that the shared call is capped by the longest caller deadline, not the first."""
+        time_left = []
+
+        async def send(texts, key):
+            time_left.append(stage_time_left())
+            return texts
+
+        batcher = MicroBatcher('test', send, window_seconds=0.01, max_items=100, max_chars=10000)
+        await asyncio.gather(
+            Deadline(1, {'translation': 1}).run('translation', batcher.submit, ['a'], 'sw'),
+            Deadline(3, {'translation': 1}).run('translation', batcher.submit, ['b'], 'sw'),
+        )
+
+        assert len(time_left) == 1
+        assert 2 < time_left[0] <= 3
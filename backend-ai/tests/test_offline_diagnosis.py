@@ -0,0 +1,138 @@
+"""Tests for the offline rule-based diagnosis fallback."""
+import base64
+
+import pytest
+
+from app.config import settings
+from app.models import CropType, Season, SeverityLevel
+from app.routers import copilot as copilot_router
+from app.routers import diagnosis as diagnosis_router
+from app.routers import enhanced as enhanced_router
+from app.services import gpt4, offline_diagnosis, speech, vision
+from app.services.circuit_breaker import CircuitOpenError
+
+
+class TestOfflineDiagnosis:
+    """Test suite for the rule engine."""
+
+    def test_names_pest_from_question(self):
+        """Test that symptoms and the crop in the question pick the pest."""
+        result = offline_diagnosis.diagnose(['leaf', 'insect'], 'caterpillars eating holes in my maize')
+
+        assert result.crop == CropType.MAIZE
+        assert result.problem == 'Fall Armyworm'
+        assert result.category == 'pest'
+
+    def test_severity_from_words(self):
+        """Test that 'dying' marks the problem as severe."""
+        result = offline_diagnosis.diagnose(['tomato', 'wilting'], 'tomato plant wilting and dying')
+
+        assert result.problem == 'Fusarium Wilt'
+        assert result.severity == SeverityLevel.SEVERE
+
+    def test_generic_advice_without_match(self):
+        """Test that unknown symptoms give general advice without naming a disease."""
+        result = offline_diagnosis.diagnose(['plant', 'green'])
+
+        assert result.problem is None
+        assert result.category == 'general'
+        assert result.confidence == 0.1
+
+    def test_advice_is_short_and_marked_offline(self):
+        """Test that advice stays under 100 words and says it is a quick check."""
+        text = offline_diagnosis.advise(['leaf', 'rust', 'spots'], 'orange spots on my maize leaves')
+
+        assert len(text.split()) < 100
+        assert text.endswith('ask again later for a full diagnosis.')
+
+    def test_season_adds_seasonal_context(self):
+        """Test that the season's risks and precaution from SEASONAL_CONTEXT are in the advice."""
+        text = offline_diagnosis.advise(['leaf', 'spots'], 'orange spots on my maize leaves',
+                                        season=Season.RAINY_SEASON)
+
+        assert 'Rainy season: watch for fungal diseases and leaf diseases; keep drainage channels open.' in text
+        assert len(text.split()) < 100
+        assert 'season:' not in offline_diagnosis.advise(['leaf', 'spots'], 'orange spots on my maize leaves')
+
+
+class TestDiagnosisFallback:
+    """Test suite for the routers' fallback to offline rules."""
+
+    @pytest.fixture(autouse=True)
+    def _services(self, monkeypatch):
+        async def analyze_image(image_bytes):
+            return ['maize', 'leaf', 'insect']
+
+        async def synthesize_audio(text, language):
+            return None
+
+        async def no_log(data):
+            return None
+
+        monkeypatch.setattr(settings, 'SPEECH_PIPELINE_ENABLED', False)
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis_event', no_log)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis', no_log)
+        monkeypatch.setattr(enhanced_router, 'log_diagnosis_event', no_log)
+        monkeypatch.setattr(copilot_router, 'log_diagnosis_event', no_log)
+
+    def test_gpt_unavailable_uses_offline_rules(self, client, monkeypatch):
+        """Test that an open GPT-4 breaker returns rule-based advice marked as fallback."""
+        async def gpt_down(*args, **kwargs):
+            raise CircuitOpenError('openai', 30)
+
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_down)
+
+        response = client.post(
+            '/api/diagnose',
+            files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+            data={'query': 'caterpillars eating holes', 'language': 'en'},
+        )
+
+        data = response.json()['data']
+        assert data['diagnosis']['source'] == 'offline_rules'
+        assert 'Fall Armyworm' in data['diagnosis']['original_text']
+        assert data['fallback_stages'] == ['diagnosis']
+
+    def test_gpt_answer_is_marked_as_such(self, client, monkeypatch):
+        """Test that a normal answer reports gpt4 as its source."""
+        async def gpt_advice(*args, **kwargs):
+            return 'DISEASE: Fall armyworm.'
+
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_advice)
+
+        response = client.post(
+            '/api/diagnose',
+            files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+            data={'query': 'caterpillars eating holes', 'language': 'en'},
+        )
+
+        data = response.json()['data']
+        assert data['diagnosis'] == {
+            'original_text': 'DISEASE: Fall armyworm.',
+            'translated_text': 'DISEASE: Fall armyworm.',
+            'language': 'en',
+            'source': 'gpt4',
+        }
+        assert data['fallback_stages'] == []
+
+    def test_every_router_shares_the_fallback(self, client, monkeypatch):
+        """Test that the v2 and Copilot endpoints also answer from the rules when GPT-4 fails."""
+        async def gpt_down(*args, **kwargs):
+            raise RuntimeError('GPT-4 unavailable')
+
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_down)
+        image = base64.b64encode(b'image-bytes').decode()
+
+        enhanced = client.post('/api/v2/diagnose-enhanced', json={
+            'image_base64': image, 'question': 'caterpillars eating holes', 'language': 'en', 'crop_type': 'maize',
+        }).json()
+        copilot = client.post('/api/copilot/diagnose-crop', json={
+            'image_base64': image, 'question': 'caterpillars eating holes', 'language': 'en',
+        }).json()
+
+        assert enhanced['fallback_stages'] == ['diagnosis']
+        assert 'Fall Armyworm' in enhanced['diagnosis_original']
+        assert copilot['fallback_stages'] == ['diagnosis']
+        assert 'Fall Armyworm' in copilot['diagnosis']
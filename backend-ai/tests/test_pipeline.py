@@ -0,0 +1,176 @@
+"""Tests for the staged pipeline executor."""
+import asyncio
+
+import pytest
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.deadline import Deadline
+from app.services.pipeline import Pipeline, Stage
+
+
+def value(result):
+    async def run(run):
+        return result
+    return run
+
+
+class TestPipelineDefinition:
+    """Test suite for checking a pipeline when it is built."""
+
+    def test_unknown_dependency(self):
+        """Test that a stage needing a missing stage is refused."""
+        with pytest.raises(ValueError, match='unknown'):
+            Pipeline('broken', [Stage('diagnosis', value('x'), after=('vision',))])
+
+    def test_cycle(self):
+        """Test that a dependency cycle is refused."""
+        with pytest.raises(ValueError, match='cycle'):
+            Pipeline('broken', [
+                Stage('a', value(1), after=('b',)),
+                Stage('b', value(2), after=('a',)),
+            ])
+
+    def test_variant_replaces_and_drops_stages(self):
+        """Test that with_stages swaps stages by name and leaves others out."""
+        base = Pipeline('base', [Stage('a', value(1)), Stage('b', value(2), after=('a',))])
+
+        variant = base.with_stages('variant', Stage('a', value(10)), Stage('c', value(3)), without=('b',))
+
+        assert set(variant.stages) == {'a', 'c'}
+        assert set(base.stages) == {'a', 'b'}
+
+
+class TestPipelineRun:
+    """Test suite for running pipelines."""
+
+    async def test_independent_stages_run_concurrently(self):
+        """Test that stages with no dependency between them overlap."""
+        running = []
+
+        def slow(name):
+            async def run(run):
+                running.append(name)
+                await asyncio.sleep(0.05)
+                return len(running)
+            return run
+
+        pipeline = Pipeline('fan-out', [
+            Stage('audio', slow('audio'), timed=False),
+            Stage('log', slow('log'), timed=False),
+            Stage('done', value('ok'), after=('audio', 'log'), timed=False),
+        ])
+
+        run = await pipeline.run({})
+
+        # Each saw the other already started
+        assert run['audio'] == 2 and run['log'] == 2
+        assert run['done'] == 'ok'
+
+    async def test_stages_see_dependency_results(self):
+        """Test that a stage runs after, and reads, the stages it needs."""
+        async def advise(run):
+            return f"{run.inputs['question']}: {','.join(run['vision'])}"
+
+        pipeline = Pipeline('chain', [
+            Stage('diagnosis', advise, after=('vision',)),
+            Stage('vision', value(['leaf', 'rust'])),
+        ])
+
+        run = await pipeline.run({'question': 'Why?'}, Deadline(1))
+
+        assert run['diagnosis'] == 'Why?: leaf,rust'
+
+    async def test_retry_then_fallback(self):
+        """Test that a failing stage is retried, then served by its fallback."""
+        attempts = []
+
+        async def flaky(run):
+            attempts.append(1)
+            raise RuntimeError('GPT-4 unavailable')
+
+        pipeline = Pipeline('fallback', [
+            Stage('diagnosis', flaky, retries=2, fallback=lambda run, error: f'offline ({error})'),
+        ])
+
+        run = await pipeline.run({}, Deadline(1))
+
+        assert len(attempts) == 3
+        assert run['diagnosis'] == 'offline (GPT-4 unavailable)'
+        assert run.fallback_stages == ['diagnosis']
+
+    async def test_no_retry_when_breaker_open(self):
+        """Test that an open circuit breaker is not retried."""
+        attempts = []
+
+        async def breaker_open(run):
+            attempts.append(1)
+            raise CircuitOpenError('translator', 5)
+
+        pipeline = Pipeline('breaker', [
+            Stage('translation', breaker_open, retries=2, fallback=lambda run, error: 'English',
+                  fallback_on=(CircuitOpenError,)),
+        ])
+
+        run = await pipeline.run({}, Deadline(1))
+
+        assert attempts == [1]
+        assert run['translation'] == 'English'
+
+    async def test_failure_cancels_other_stages(self):
+        """Test that a stage failing without a fallback fails the run and stops the rest."""
+        cancelled = []
+
+        async def vision_down(run):
+            raise RuntimeError('Vision unavailable')
+
+        async def slow_log(run):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append('log')
+                raise
+
+        pipeline = Pipeline('failing', [
+            Stage('vision', vision_down),
+            Stage('log', slow_log, timed=False),
+            Stage('diagnosis', value('x'), after=('vision',)),
+        ])
+
+        with pytest.raises(RuntimeError, match='Vision unavailable'):
+            await pipeline.run({}, Deadline(1))
+        assert cancelled == ['log']
+
+    async def test_skipped_stage_gives_up_its_budget(self):
+        """Test that a stage turned off by `when` uses `otherwise` and frees its deadline share."""
+        budgets = {}
+
+        async def advise(run):
+            budgets['diagnosis'] = run.deadline.stage_budget('diagnosis')
+            return 'advice'
+
+        deadline = Deadline(10, {'diagnosis': 1, 'translation': 1})
+        pipeline = Pipeline('skip', [
+            Stage('diagnosis', advise),
+            Stage('translation', value('never'), after=('diagnosis',),
+                  when=lambda run: run.inputs['language'] != 'en',
+                  otherwise=lambda run: run['diagnosis']),
+        ])
+
+        run = await pipeline.run({'language': 'en'}, deadline)
+
+        assert run['translation'] == 'advice'
+        assert budgets['diagnosis'] == pytest.approx(10, abs=0.1)
+
+    async def test_events_and_cleanup(self):
+        """Test that stage events are queued and cleanup runs at the end."""
+        cleaned = []
+        events = asyncio.Queue()
+        pipeline = Pipeline('events', [
+            Stage('vision', value(['leaf']), event='tags',
+                  event_data=lambda run, tags: {'detected_tags': tags}),
+        ], cleanup=lambda run: cleaned.append(True))
+
+        await pipeline.run({}, Deadline(1), events)
+
+        assert events.get_nowait() == ('tags', {'detected_tags': ['leaf']})
+        assert cleaned == [True]
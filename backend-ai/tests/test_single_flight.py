@@ -0,0 +1,217 @@
+"""Tests for single-flight coalescing of identical calls."""
+import asyncio
+
+import pytest
+
+from app.services import gpt4, vision
+from app.services.cache import TieredCache
+from app.services.deadline import Deadline, stage_time_left
+from app.services.single_flight import SingleFlight, SingleFlightStream
+
+
+class TestSingleFlight:
+    """Test suite for sharing one in-flight call."""
+
+    @pytest.fixture(autouse=True)
+    def _upstream(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+        async def slow(value):
+            self.calls += 1
+            await self.release.wait()
+            return value * 2
+
+        self.slow = slow
+
+    async def test_identical_calls_share_one_execution(self):
+        """Test that concurrent callers with one key get one call's result."""
+        group = SingleFlight('test')
+        callers = [asyncio.ensure_future(group.do('k', self.slow, 21)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        assert await asyncio.gather(*callers) == [42, 42, 42]
+        assert self.calls == 1
+        assert group.stats()['coalesced'] == 2
+
+    async def test_different_keys_run_separately(self):
+        """Test that different inputs are not coalesced."""
+        group = SingleFlight('test')
+        self.release.set()
+
+        assert await asyncio.gather(group.do('a', self.slow, 1), group.do('b', self.slow, 2)) == [2, 4]
+        assert self.calls == 2
+
+    async def test_errors_propagate_to_all_callers(self):
+        """Test that a failed call raises in every waiting caller and is not kept."""
+        group = SingleFlight('test')
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise RuntimeError('Vision down')
+
+        results = await asyncio.gather(group.do('k', failing), group.do('k', failing), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert group.stats()['in_flight'] == 0
+
+    async def test_cancelled_caller_leaves_call_running(self):
+        """Test that one caller giving up does not cancel the others' call."""
+        group = SingleFlight('test')
+        first = asyncio.ensure_future(group.do('k', self.slow, 1))
+        second = asyncio.ensure_future(group.do('k', self.slow, 1))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+
+        assert await second == 2
+        assert first.cancelled()
+
+    async def test_call_cancelled_when_nobody_waits(self):
+        """Test that the shared call is cancelled once every caller is gone."""
+        group = SingleFlight('test')
+        caller = asyncio.ensure_future(group.do('k', self.slow, 1))
+        await asyncio.sleep(0)
+
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+
+        assert group.stats() == {'calls': 1, 'executions': 1, 'coalesced': 0, 'abandoned': 1, 'in_flight': 0}
+
+    async def test_call_runs_under_latest_caller_deadline(self):
+        """Test that a joined caller's longer deadline carries into the shared call."""
+        group = SingleFlight('test')
+
+        async def read_budget():
+            await self.release.wait()
+            return stage_time_left()
+
+        first = asyncio.ensure_future(Deadline(1, {'vision': 1}).run('vision', group.do, 'k', read_budget))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(Deadline(3, {'vision': 1}).run('vision', group.do, 'k', read_budget))
+        await asyncio.sleep(0.01)
+        self.release.set()
+
+        left = await second
+        assert await first == left
+        assert 2 < left <= 3
+
+
+class TestSingleFlightStream:
+    """Test suite for sharing one in-flight stream."""
+
+    @pytest.fixture(autouse=True)
+    def _upstream(self):
+        self.calls = 0
+        self.next_piece = asyncio.Event()
+
+        async def tokens(*pieces):
+            self.calls += 1
+            for piece in pieces:
+                await self.next_piece.wait()
+                self.next_piece.clear()
+                yield piece
+
+        self.tokens = tokens
+
+    async def _read(self, group, key, *pieces):
+        return [piece async for piece in group.stream(key, self.tokens, *pieces)]
+
+    async def test_follower_replays_pieces_already_streamed(self):
+        """Test that a caller joining mid-stream gets every piece from one upstream stream."""
+        group = SingleFlightStream('test-stream')
+        leader = asyncio.ensure_future(self._read(group, 'k', 'Spray', ' neem', ' oil.'))
+        await asyncio.sleep(0)
+        self.next_piece.set()
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self._read(group, 'k', 'Spray', ' neem', ' oil.'))
+        for _ in range(2):
+            await asyncio.sleep(0)
+            self.next_piece.set()
+            await asyncio.sleep(0)
+
+        assert await leader == ['Spray', ' neem', ' oil.']
+        assert await follower == ['Spray', ' neem', ' oil.']
+        assert self.calls == 1
+        assert group.stats()['coalesced'] == 1
+
+    async def test_stream_cancelled_when_nobody_reads(self):
+        """Test that the upstream stream stops once its last reader is cancelled."""
+        group = SingleFlightStream('test-stream')
+        reader = asyncio.ensure_future(self._read(group, 'k', 'Spray'))
+        await asyncio.sleep(0)
+
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert not group.in_flight('k')
+        assert group.stats()['abandoned'] == 1
+
+
+class TestServiceCoalescing:
+    """Test suite for single-flight in the Vision and GPT-4 services."""
+
+    async def test_double_submitted_image_analyzed_once(self, monkeypatch, tmp_path):
+        """Test that the same image sent twice at once reaches Vision once."""
+        monkeypatch.setattr(vision, '_image_cache', TieredCache('vision-sf-test', 16, 60))
+        monkeypatch.setattr(vision.settings, 'VISION_PHASH_ENABLED', False)
+        calls = []
+
+        async def azure(image_bytes):
+            calls.append(image_bytes)
+            await asyncio.sleep(0.01)
+            return ['leaf', 'rust']
+
+        monkeypatch.setattr(vision, '_analyze_with_azure', azure)
+
+        results = await asyncio.gather(vision.analyze_image(b'img'), vision.analyze_image(b'img'))
+
+        assert results == [['leaf', 'rust'], ['leaf', 'rust']]
+        assert len(calls) == 1
+
+    async def test_retried_question_asks_gpt_once(self, monkeypatch):
+        """Test that a retried identical question shares the in-flight GPT-4 call."""
+        monkeypatch.setattr(gpt4, '_advice_cache', TieredCache('advice-sf-test', 16, 60))
+        calls = []
+
+        async def request(tags, query, language, system_prompt=None):
+            calls.append(query)
+            await asyncio.sleep(0.01)
+            return 'Spray neem oil.'
+
+        monkeypatch.setattr(gpt4, '_request_advice', request)
+
+        results = await asyncio.gather(
+            gpt4.get_agronomist_advice(['leaf'], 'What is this?', 'en'),
+            gpt4.get_agronomist_advice(['leaf'], 'what is this', 'en'),
+        )
+
+        assert results == ['Spray neem oil.', 'Spray neem oil.']
+        assert calls == ['What is this?']
+
+    async def test_streamed_question_asks_gpt_once(self, monkeypatch):
+        """Test that identical questions share one GPT-4 stream, streamed or not."""
+        monkeypatch.setattr(gpt4, '_advice_cache', TieredCache('advice-sfs-test', 16, 60))
+        calls = []
+
+        async def stream(key, tags, query, language, system_prompt=None):
+            calls.append(query)
+            for token in ('Spray', ' neem oil.'):
+                await asyncio.sleep(0.01)
+                yield token
+
+        monkeypatch.setattr(gpt4, '_stream_and_cache', stream)
+
+        async def streamed():
+            return [piece async for piece in gpt4.stream_agronomist_advice(['leaf'], 'What is this?', 'en')]
+
+        first = asyncio.ensure_future(streamed())
+        await asyncio.sleep(0)
+        results = await asyncio.gather(first, streamed(), gpt4.get_agronomist_advice(['leaf'], 'what is this', 'en'))
+
+        assert results == [['Spray', ' neem oil.'], ['Spray', ' neem oil.'], 'Spray neem oil.']
+        assert calls == ['What is this?']
@@ -0,0 +1,98 @@
+"""Tests for the sentence-pipelined translate-and-speak stage."""
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services import audio_store, speech
+from app.services.speech_pipeline import SpeechPipeline
+
+
+class TestSpeechPipeline:
+    """Test suite for per-sentence translation and audio."""
+
+    @pytest.fixture(autouse=True)
+    def _services(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+        self.translated = []
+        self.active = 0
+        self.peak = 0
+
+        async def translate_text(text, target_lang):
+            self.translated.append(text)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            return f'<{target_lang}>{text}'
+
+        async def synthesize_bytes(text, language):
+            self.voiced.append(text)
+            return f'[{text}]'.encode()
+
+        self.voiced = []
+        monkeypatch.setattr(speech, 'translate_text', translate_text)
+        monkeypatch.setattr(speech, 'synthesize_bytes', synthesize_bytes)
+
+    async def test_sentences_start_before_text_is_complete(self):
+        """Test that a finished sentence is translated while generation continues."""
+        pipeline = SpeechPipeline('sw')
+        for token in ('Remove inf', 'ected leaves.', ' Spray'):
+            pipeline.feed(token)
+        await asyncio.sleep(0.02)
+
+        assert self.translated == ['Remove infected leaves.']
+
+        pipeline.feed(' neem oil.\n1. Mix ash')
+        assert await pipeline.translation() == '<sw>Remove infected leaves. <sw>Spray neem oil.\n<sw>1. Mix ash'
+
+    async def test_audio_joined_in_order(self):
+        """Test that sentence audio is concatenated in text order and stored."""
+        pipeline = SpeechPipeline('sw')
+        pipeline.feed('First. Second. Third.')
+
+        audio_id = await pipeline.audio()
+
+        assert audio_id == audio_store.audio_id('<sw>First. <sw>Second. <sw>Third.', 'sw-KE-ZuriNeural')
+        assert await audio_store.read(audio_id) == b'[<sw>First.][<sw>Second.][<sw>Third.]'
+
+    async def test_only_joined_audio_is_stored(self, tmp_path):
+        """Test that sentence audio is not persisted on its own."""
+        pipeline = SpeechPipeline('sw')
+        pipeline.feed('First. Second.')
+
+        audio_id = await pipeline.audio()
+
+        assert [path.stem for path in (tmp_path / 'audio').rglob('*.mp3')] == [audio_id]
+
+    async def test_concurrency_is_bounded(self):
+        """Test that no more than `translate_concurrency` Translator calls run at once."""
+        pipeline = SpeechPipeline('sw', translate_concurrency=2)
+        pipeline.feed('One. Two. Three. Four. Five. Six.')
+
+        await pipeline.translation()
+
+        assert self.peak == 2
+
+    async def test_english_skips_translation(self):
+        """Test that English advice goes straight to speech."""
+        pipeline = SpeechPipeline('en')
+        pipeline.feed('Water early.')
+
+        assert await pipeline.translation() == 'Water early.'
+        assert self.translated == []
+
+
+class TestConcatMp3:
+    """Test suite for joining MP3 segments."""
+
+    def test_strips_tags_between_segments(self):
+        """Test that only the first ID3v2 header survives and ID3v1 trailers are dropped."""
+        id3v2 = b'ID3\x04\x00\x00\x00\x00\x00\x02ab'
+        id3v1 = b'TAG' + b'\x00' * 125
+        first = id3v2 + b'\xff\xfbframe1' + id3v1
+        second = id3v2 + b'\xff\xfbframe2'
+
+        joined = audio_store.concat_mp3([first, second])
+
+        assert joined == id3v2 + b'\xff\xfbframe1\xff\xfbframe2'
@@ -0,0 +1,166 @@
+"""Tests for the SSE streaming diagnosis endpoints."""
+import base64
+import json
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.routers import diagnosis as diagnosis_router
+from app.routers import enhanced as enhanced_router
+from app.services import audio_store, gpt4, http_client, speech, vision
+from app.services.cache import TieredCache
+
+
+def parse_events(body):
+    """[(event, data)] from an SSE response body"""
+    events = []
+    for message in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in message.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class TestStreamAdvice:
+    """Test suite for streaming chat completions in gpt4."""
+
+    async def test_yields_deltas_and_caches_answer(self, monkeypatch):
+        """Test that content deltas are yielded in order and cached at the end."""
+        monkeypatch.setattr(gpt4, '_advice_cache', TieredCache('advice-stream-test', 16, 60))
+        monkeypatch.setattr(settings, 'AZURE_OPENAI_KEY', 'key')
+        monkeypatch.setattr(settings, 'AZURE_OPENAI_ENDPOINT', 'https://openai.test')
+        chunks = [{'choices': []}] + [
+            {'choices': [{'delta': {'content': text}}]} for text in ('Spray', ' neem', ' oil.')
+        ]
+        body = ''.join(f'data: {json.dumps(chunk)}\n\n' for chunk in chunks) + 'data: [DONE]\n\n'
+        requests = []
+
+        @asynccontextmanager
+        async def stream(method, url, dependency=None, **kwargs):
+            requests.append(kwargs['json'])
+            yield httpx.Response(200, content=body.encode(), request=httpx.Request(method, url))
+
+        monkeypatch.setattr(http_client, 'stream', stream)
+
+        first = [piece async for piece in gpt4.stream_agronomist_advice(['leaf'], 'What is this?', 'en')]
+        second = [piece async for piece in gpt4.stream_agronomist_advice(['leaf'], 'What is this?', 'en')]
+
+        assert first == ['Spray', ' neem', ' oil.']
+        assert second == ['Spray neem oil.']
+        assert len(requests) == 1 and requests[0]['stream'] is True
+
+    async def test_truncated_stream_not_cached(self, monkeypatch):
+        """Test that a stream ending without [DONE] is not cached."""
+        monkeypatch.setattr(gpt4, '_advice_cache', TieredCache('advice-truncated-test', 16, 60))
+        monkeypatch.setattr(settings, 'AZURE_OPENAI_KEY', 'key')
+        monkeypatch.setattr(settings, 'AZURE_OPENAI_ENDPOINT', 'https://openai.test')
+        body = f"data: {json.dumps({'choices': [{'delta': {'content': 'Spray'}}]})}\n\n"
+        requests = []
+
+        @asynccontextmanager
+        async def stream(method, url, dependency=None, **kwargs):
+            requests.append(kwargs['json'])
+            yield httpx.Response(200, content=body.encode(), request=httpx.Request(method, url))
+
+        monkeypatch.setattr(http_client, 'stream', stream)
+
+        for _ in range(2):
+            assert [piece async for piece in gpt4.stream_agronomist_advice(['leaf'], 'Why?', 'en')] == ['Spray']
+
+        assert len(requests) == 2
+
+
+class TestStreamingEndpoints:
+    """Test suite for /api/diagnose/stream and /api/v2/diagnose-enhanced/stream."""
+
+    @pytest.fixture(autouse=True)
+    def _pipeline(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+
+        async def analyze_image(image_bytes):
+            return ['leaf', 'rust']
+
+        async def stream_advice(tags, query, language, **kwargs):
+            for token in ('DISEASE: Leaf rust.\n', 'Remove leaves.'):
+                yield token
+
+        async def translate_text(text, target_lang):
+            return f'<{target_lang}>{text}'
+
+        async def translate_texts(texts, target_lang):
+            return [f'<{target_lang}>{text}' for text in texts]
+
+        async def synthesize_audio(text, language):
+            audio_id = audio_store.audio_id(text, speech.voice_for(language))
+            await audio_store.save(audio_id, b'mp3:' + text.encode())
+            return audio_id
+
+        async def synthesize_bytes(text, language):
+            return b'mp3:' + text.encode()
+
+        async def no_log(data):
+            return None
+
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(gpt4, 'stream_agronomist_advice', stream_advice)
+        monkeypatch.setattr(speech, 'translate_text', translate_text)
+        monkeypatch.setattr(speech, 'translate_texts', translate_texts)
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+        monkeypatch.setattr(speech, 'synthesize_bytes', synthesize_bytes)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis_event', no_log)
+        monkeypatch.setattr(diagnosis_router, 'log_diagnosis', no_log)
+        monkeypatch.setattr(enhanced_router, 'log_diagnosis_event', no_log)
+
+    def test_diagnose_stream_emits_stage_events(self, client):
+        """Test that tags, tokens, translation and audio arrive as separate events."""
+        response = client.post(
+            '/api/diagnose/stream',
+            files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+            data={'query': 'What is wrong?', 'language': 'sw'},
+        )
+
+        assert response.headers['content-type'].startswith('text/event-stream')
+        events = parse_events(response.text)
+        assert [event for event, _ in events] == [
+            'tags', 'token', 'token', 'diagnosis', 'translation', 'audio', 'done'
+        ]
+        assert events[0][1] == {'detected_tags': ['leaf', 'rust']}
+        assert events[1][1] == {'text': 'DISEASE: Leaf rust.\n'}
+        assert events[4][1]['translated_text'] == '<sw>DISEASE: Leaf rust.\n<sw>Remove leaves.'
+        audio_id = audio_store.audio_id('<sw>DISEASE: Leaf rust.\n<sw>Remove leaves.', 'sw-KE-ZuriNeural')
+        assert events[5][1]['url'] == f'/api/audio/{audio_id}'
+        assert audio_store.path_for(audio_id).read_bytes() == b'mp3:<sw>DISEASE: Leaf rust.mp3:<sw>Remove leaves.'
+        assert events[-1][1]['diagnosis']['original_text'] == 'DISEASE: Leaf rust.\nRemove leaves.'
+
+    def test_diagnose_stream_reports_errors_as_events(self, client, monkeypatch):
+        """Test that a failing stage ends the stream with an error event."""
+        async def vision_down(image_bytes):
+            raise RuntimeError('Vision unavailable')
+
+        monkeypatch.setattr(vision, 'analyze_image', vision_down)
+
+        response = client.post(
+            '/api/diagnose/stream',
+            files={'file': ('leaf.jpg', b'image-bytes', 'image/jpeg')},
+            data={'query': 'What is wrong?'},
+        )
+
+        assert parse_events(response.text) == [('error', {'error': 'Vision unavailable'})]
+
+    def test_enhanced_stream_ends_with_full_response(self, client):
+        """Test that the v2 stream ends with the regular structured response."""
+        response = client.post('/api/v2/diagnose-enhanced/stream', json={
+            'image_base64': base64.b64encode(b'image-bytes').decode(),
+            'question': 'Brown spots?',
+            'language': 'sw',
+        })
+
+        events = parse_events(response.text)
+        assert [event for event, _ in events] == [
+            'tags', 'token', 'token', 'diagnosis', 'translation', 'audio', 'done'
+        ]
+        done = events[-1][1]
+        assert done['disease_name'] == '<sw>Leaf rust.'
+        assert done['diagnosis_original'] == 'DISEASE: Leaf rust.\nRemove leaves.'
+        assert done['audio_url'].startswith('/api/audio/')
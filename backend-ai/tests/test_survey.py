@@ -0,0 +1,130 @@
+"""Tests for the batch field-survey endpoint."""
+import json
+
+import pytest
+
+from app.config import settings
+from app.routers import enhanced as enhanced_router
+from app.routers import survey as survey_router
+from app.services import audio_store, gpt4, speech, vision
+
+PHOTO_TAGS = {
+    b'rust-1': ['maize', 'leaf', 'rust', 'orange', 'powder'],
+    b'rust-2': ['maize', 'leaf', 'rust', 'pustules', 'orange'],
+    b'worm': ['maize', 'caterpillar', 'whorl', 'holes'],
+    b'plain-1': ['plant', 'green', 'outdoor'],
+    b'plain-2': ['outdoor', 'green', 'plant'],
+}
+
+
+def parse_events(body):
+    """[(event, data)] from an SSE response body"""
+    events = []
+    for message in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in message.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def upload(client, photos, **data):
+    return client.post(
+        '/api/survey/diagnose',
+        files=[('files', (f'{name.decode()}.jpg', name, 'image/jpeg')) for name in photos],
+        data={'query': 'What is wrong with my field?', 'language': 'en', **data},
+    )
+
+
+class TestSurveyGrouping:
+    """Test suite for grouping photos into shared diagnoses."""
+
+    def test_same_problem_grouped(self):
+        """Test that photos matching one problem share its group key."""
+        first, problem = survey_router.group_for(PHOTO_TAGS[b'rust-1'])
+        second, _ = survey_router.group_for(PHOTO_TAGS[b'rust-2'])
+
+        assert first == second
+        assert problem == 'Corn Rust'
+
+    def test_unmatched_tags_grouped_only_when_identical(self):
+        """Test that photos without a convincing match group by their exact tags."""
+        first, problem = survey_router.group_for(PHOTO_TAGS[b'plain-1'])
+        second, _ = survey_router.group_for(PHOTO_TAGS[b'plain-2'])
+        other, _ = survey_router.group_for(['plant', 'soil'])
+
+        assert problem is None
+        assert first == second != other
+
+
+class TestSurveyEndpoint:
+    """Test suite for POST /api/survey/diagnose."""
+
+    @pytest.fixture(autouse=True)
+    def _services(self, monkeypatch, tmp_path):
+        self.gpt_calls = []
+
+        async def analyze_image(image_bytes):
+            if image_bytes == b'broken':
+                raise RuntimeError('Vision could not read the image')
+            return PHOTO_TAGS[image_bytes]
+
+        async def gpt_advice(tags, question, language, **kwargs):
+            self.gpt_calls.append(sorted(tags))
+            return f'DISEASE: Problem with {", ".join(sorted(tags))}.'
+
+        async def synthesize_audio(text, language):
+            audio_id = audio_store.audio_id(text, speech.voice_for(language))
+            await audio_store.save(audio_id, b'mp3')
+            return audio_id
+
+        async def no_log(data):
+            return None
+
+        monkeypatch.setattr(settings, 'AUDIO_DIR', str(tmp_path / 'audio'))
+        monkeypatch.setattr(vision, 'analyze_image', analyze_image)
+        monkeypatch.setattr(gpt4, 'get_agronomist_advice', gpt_advice)
+        monkeypatch.setattr(speech, 'synthesize_audio', synthesize_audio)
+        monkeypatch.setattr(enhanced_router, 'log_diagnosis_event', no_log)
+
+    def test_one_gpt_call_per_group(self, client):
+        """Test that similar photos share one diagnosis and every photo gets a result."""
+        photos = [b'rust-1', b'worm', b'rust-2', b'plain-1', b'plain-2']
+
+        response = upload(client, photos, crop_type='maize')
+
+        events = parse_events(response.text)
+        done = events[-1]
+        assert done[0] == 'done'
+        assert len(self.gpt_calls) == 3
+        assert done[1]['gpt_calls'] == 3
+        assert sorted(group['images'] for group in done[1]['groups']) == [[0, 2], [1], [3, 4]]
+
+        results = {data['index']: data for event, data in events if event == 'result'}
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        assert results[0]['group'] == results[2]['group']
+        assert results[0]['problem'] == 'Corn Rust'
+
+        groups = [data for event, data in events if event == 'group']
+        assert len(groups) == 3
+        assert all(group['diagnosis']['audio_url'] for group in groups)
+
+    def test_failed_photo_does_not_stop_survey(self, client):
+        """Test that a photo Vision cannot read is reported and the rest are diagnosed."""
+        response = upload(client, [b'broken', b'worm'])
+
+        events = parse_events(response.text)
+        errors = [data for event, data in events if event == 'image_error']
+        assert errors == [{'index': 0, 'filename': 'broken.jpg', 'error': 'Vision could not read the image'}]
+        assert events[-1] == ('done', {
+            'images': 2,
+            'failed': [0],
+            'gpt_calls': 1,
+            'groups': [{'group': 'g1', 'problem': 'Fall Armyworm', 'images': [1]}],
+        })
+
+    def test_too_many_photos(self, client, monkeypatch):
+        """Test that surveys over SURVEY_MAX_IMAGES are refused."""
+        monkeypatch.setattr(settings, 'SURVEY_MAX_IMAGES', 2)
+
+        response = upload(client, [b'rust-1', b'rust-2', b'worm'])
+
+        assert response.status_code == 400
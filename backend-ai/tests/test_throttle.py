@@ -0,0 +1,147 @@
+"""Tests for client-side quota throttling."""
+import time
+
+import httpx
+import pytest
+
+from app.services import gpt4
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.throttle import Throttle, ThrottledError, TokenBucket, retry_after_seconds
+
+
+def _response(status_code, **headers):
+    return httpx.Response(status_code, headers=headers, request=httpx.Request('POST', 'https://azure.test/'))
+
+
+class TestRetryAfter:
+    """Test suite for reading back-off hints from 429 responses."""
+
+    def test_prefers_milliseconds_header(self):
+        """Test that retry-after-ms wins over Retry-After."""
+        response = _response(429, **{'retry-after-ms': '250', 'retry-after': '3'})
+
+        assert retry_after_seconds(response) == 0.25
+
+    def test_reads_seconds(self):
+        """Test that a plain Retry-After is read as seconds."""
+        assert retry_after_seconds(_response(429, **{'retry-after': '3'})) == 3.0
+
+    def test_missing_header(self):
+        """Test that a response without a hint gives None."""
+        assert retry_after_seconds(_response(429)) is None
+
+
+class TestTokenBucket:
+    """Test suite for the token bucket."""
+
+    def test_waits_for_refill_when_empty(self):
+        """Test that a reservation past the level reports the wait for the refill."""
+        bucket = TokenBucket(rate_per_second=10, capacity=10)
+
+        assert bucket.reserve(10) == 0
+        assert bucket.reserve(5) == pytest.approx(0.5, abs=0.01)
+
+
+class TestThrottle:
+    """Test suite for request and token quotas."""
+
+    async def test_smooths_burst(self):
+        """Test that a burst beyond the bucket is spaced out instead of sent at once."""
+        throttle = Throttle('test-burst', requests_per_minute=600, burst_seconds=0.2, max_wait_seconds=5)
+        started = time.monotonic()
+        for _ in range(4):
+            await throttle.acquire()
+
+        # 2 requests fit in the bucket, the next 2 wait 0.1s each
+        assert time.monotonic() - started >= 0.15
+        assert throttle.snapshot()['delayed_calls'] == 2
+
+    async def test_rejects_beyond_max_wait(self):
+        """Test that a call needing more quota than it may wait for fails fast."""
+        throttle = Throttle('test-tokens', requests_per_minute=0, tokens_per_minute=60, burst_seconds=10, max_wait_seconds=1)
+        await throttle.acquire(tokens=10)
+
+        with pytest.raises(ThrottledError):
+            await throttle.acquire(tokens=5)
+        assert throttle.snapshot()['tokens_available'] == pytest.approx(0, abs=1)
+        assert issubclass(ThrottledError, CircuitOpenError)
+
+    async def test_oversized_call_takes_a_full_bucket(self):
+        """Test that a call larger than the bucket is admitted once the bucket is full."""
+        throttle = Throttle('test-oversized', requests_per_minute=0, tokens_per_minute=60, burst_seconds=10, max_wait_seconds=1)
+
+        await throttle.acquire(tokens=50000)
+        throttle.settle(reserved=50000, used=50000)
+
+        stats = throttle.snapshot()
+        assert stats['rejected_calls'] == 0
+        assert stats['tokens_reserved'] == 50000
+        assert stats['tokens_available'] < 0
+
+    async def test_retries_after_retry_after(self):
+        """Test that a 429 is retried once its Retry-After has passed."""
+        throttle = Throttle('test-429', requests_per_minute=0, max_wait_seconds=5, max_retries=1)
+        responses = [_response(429, **{'retry-after-ms': '50'}), _response(200)]
+
+        async def send():
+            return responses.pop(0)
+
+        started = time.monotonic()
+        response = await throttle.call(send)
+
+        assert response.status_code == 200
+        assert time.monotonic() - started >= 0.05
+        stats = throttle.snapshot()
+        assert stats['rate_limited_responses'] == 1
+        assert stats['retries'] == 1
+
+    async def test_retry_keeps_first_reservation(self):
+        """Test that a retried 429 is not charged against the quota twice."""
+        throttle = Throttle('test-429-tokens', requests_per_minute=60, tokens_per_minute=600,
+                            burst_seconds=10, max_wait_seconds=5, max_retries=1)
+        responses = [_response(429, **{'retry-after-ms': '10'}), _response(200)]
+
+        async def send():
+            return responses.pop(0)
+
+        await throttle.call(send, tokens=40)
+
+        stats = throttle.snapshot()
+        assert stats['calls'] == 1
+        assert stats['tokens_reserved'] == 40
+        assert stats['tokens_available'] == pytest.approx(60, abs=1)
+        assert stats['requests_available'] == pytest.approx(9, abs=0.1)
+
+    async def test_final_429_refunds_reservation(self):
+        """Test that a call still throttled after its retries gives its quota back."""
+        throttle = Throttle('test-429-refund', requests_per_minute=60, tokens_per_minute=600,
+                            burst_seconds=10, max_wait_seconds=5, max_retries=1)
+
+        async def send():
+            return _response(429, **{'retry-after-ms': '10'})
+
+        response = await throttle.call(send, tokens=40)
+
+        assert response.status_code == 429
+        stats = throttle.snapshot()
+        assert stats['tokens_reserved'] == 0
+        assert stats['tokens_available'] == pytest.approx(100, abs=1)
+        assert stats['requests_available'] == pytest.approx(10, abs=0.1)
+
+    async def test_settle_refunds_unused_tokens(self):
+        """Test that unused completion tokens go back to the bucket."""
+        throttle = Throttle('test-settle', requests_per_minute=0, tokens_per_minute=600, burst_seconds=10)
+        await throttle.acquire(tokens=80)
+        throttle.settle(reserved=80, used=30)
+
+        assert throttle.snapshot()['tokens_available'] == pytest.approx(70, abs=1)
+
+
+class TestTokenEstimate:
+    """Test suite for GPT-4 token estimates."""
+
+    def test_counts_prompt_and_max_tokens(self):
+        """Test that the estimate reserves the prompt plus max_tokens."""
+        payload = {'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 150}
+
+        assert gpt4.estimate_tokens(payload) == 100 + gpt4.TOKENS_PER_MESSAGE + 150
@@ -0,0 +1,75 @@
+"""Tests for the batched Translator JSON client."""
+import httpx
+import pytest
+
+from app.config import settings
+from app.routers.enhanced import translate_fields
+from app.services import http_client, speech
+from app.services.cache import TieredCache
+from app.services.translation_memory import TranslationMemory
+
+
+@pytest.fixture
+def translator(monkeypatch):
+    """Fake Translator endpoint recording each request"""
+    monkeypatch.setattr(settings, 'AZURE_TRANSLATOR_KEY', 'key')
+    requests = []
+
+    async def post(url, dependency=None, params=None, json=None, **kwargs):
+        langs = [value for name, value in params if name == 'to']
+        requests.append({'langs': langs, 'texts': [item['Text'] for item in json]})
+        body = [
+            {'translations': [{'text': f'<{lang}>{item["Text"]}', 'to': lang} for lang in langs]}
+            for item in json
+        ]
+        return httpx.Response(200, json=body, request=httpx.Request('POST', url))
+
+    monkeypatch.setattr(http_client, 'post', post)
+    return requests
+
+
+class TestTranslateBatch:
+    """Test suite for speech.translate_batch."""
+
+    async def test_many_texts_one_request(self, translator):
+        """Test that all strings are translated in a single round trip."""
+        result = await speech.translate_batch(['Spray neem.', 'Remove leaves.'], 'sw')
+
+        assert result == {'sw': ['<sw>Spray neem.', '<sw>Remove leaves.']}
+        assert translator == [{'langs': ['sw'], 'texts': ['Spray neem.', 'Remove leaves.']}]
+
+    async def test_several_target_languages(self, translator):
+        """Test that one request can target several languages."""
+        result = await speech.translate_batch(['Spray neem.'], ['sw', 'fr'])
+
+        assert result == {'sw': ['<sw>Spray neem.'], 'fr': ['<fr>Spray neem.']}
+        assert len(translator) == 1
+
+    async def test_blank_strings_not_sent(self, translator):
+        """Test that blank strings are returned unchanged without a call."""
+        result = await speech.translate_batch(['', 'Spray neem.', '  '], 'sw')
+
+        assert result == {'sw': ['', '<sw>Spray neem.', '  ']}
+        assert translator[0]['texts'] == ['Spray neem.']
+
+    async def test_character_limit_splits_requests(self, translator, monkeypatch):
+        """Test that oversized input is split into several requests."""
+        monkeypatch.setattr(speech, 'TRANSLATOR_MAX_CHARS', 20)
+        result = await speech.translate_batch(['a' * 8, 'b' * 8, 'c' * 8], ['sw', 'fr'])
+
+        assert [request['texts'] for request in translator] == [['a' * 8], ['b' * 8], ['c' * 8]]
+        assert result['fr'] == ['<fr>' + 'a' * 8, '<fr>' + 'b' * 8, '<fr>' + 'c' * 8]
+
+
+class TestTranslateFields:
+    """Test suite for translating structured v2 fields together."""
+
+    async def test_fields_share_one_request(self, translator, monkeypatch, tmp_path):
+        """Test that the diagnosis and action items are sent in one call."""
+        memory = TranslationMemory(TieredCache('tm-fields-test', 64, 60, tmp_path / 'tm.sqlite3'))
+        monkeypatch.setattr(speech, 'translation_memory', memory)
+
+        result = await translate_fields([['Leaf rust.'], None, ['Remove leaves', 'Spray neem']], 'sw')
+
+        assert result == [['<sw>Leaf rust.'], None, ['<sw>Remove leaves', '<sw>Spray neem']]
+        assert len(translator) == 1
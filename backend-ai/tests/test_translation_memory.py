@@ -0,0 +1,101 @@
+"""Tests for the sentence-level translation memory."""
+import pytest
+
+from app.services import speech
+from app.services.cache import TieredCache
+from app.services.translation_memory import TranslationMemory, split_segments
+
+
+class TestSegmentation:
+    """Test suite for sentence segmentation."""
+
+    def test_round_trips_text(self):
+        """Test that joining the segments gives back the original text."""
+        text = 'Remove the leaves. Spray neem oil!\n1. Mix ash\n2. Dust the plants.  Done?'
+
+        assert ''.join(split_segments(text)) == text
+
+    def test_splits_sentences_not_list_numbers(self):
+        """Test that list numbers stay attached to their item."""
+        segments = split_segments('Remove the leaves. Spray neem oil.\n1. Mix ash')
+
+        assert segments[::2] == ['Remove the leaves.', 'Spray neem oil.', '1. Mix ash']
+
+
+class TestTranslationMemory:
+    """Test suite for serving known sentences locally."""
+
+    @pytest.fixture(autouse=True)
+    def _memory(self, tmp_path):
+        self.memory = TranslationMemory(TieredCache('tm-test', 64, 60, tmp_path / 'tm.sqlite3'))
+        self.sent = []
+
+        async def fake_translator(segments, target_lang):
+            self.sent.append(list(segments))
+            return [f'<{target_lang}>{segment}' for segment in segments]
+
+        self.translator = fake_translator
+
+    async def test_only_missing_sentences_sent(self):
+        """Test that a repeated sentence is not sent to Translator again."""
+        await self.memory.translate('Spray neem oil. Water early.', 'sw', self.translator)
+        result = await self.memory.translate('Spray neem oil. Remove weeds.', 'sw', self.translator)
+
+        assert result == '<sw>Spray neem oil. <sw>Remove weeds.'
+        assert self.sent == [['Spray neem oil.', 'Water early.'], ['Remove weeds.']]
+
+    async def test_languages_kept_apart(self):
+        """Test that memory entries are per target language."""
+        await self.memory.translate('Spray neem oil.', 'sw', self.translator)
+        result = await self.memory.translate('Spray neem oil.', 'ar', self.translator)
+
+        assert result == '<ar>Spray neem oil.'
+        assert len(self.sent) == 2
+
+    async def test_layout_preserved(self):
+        """Test that line breaks and spacing survive translation."""
+        result = await self.memory.translate('Act now.\n\n1. Mix ash', 'sw', self.translator)
+
+        assert result == '<sw>Act now.\n\n<sw>1. Mix ash'
+
+    async def test_translate_many_sends_one_call(self):
+        """Test that unknown sentences from several texts share one call."""
+        await self.memory.translate('Spray neem oil.', 'sw', self.translator)
+        result = await self.memory.translate_many(
+            ['Spray neem oil. Water early.', 'Water early.', ''], 'sw', self.translator
+        )
+
+        assert result == ['<sw>Spray neem oil. <sw>Water early.', '<sw>Water early.', '']
+        assert self.sent == [['Spray neem oil.'], ['Water early.']]
+
+    async def test_chars_saved_reported(self):
+        """Test that saved translator characters are counted."""
+        await self.memory.translate('Spray neem oil.', 'sw', self.translator)
+        await self.memory.translate('Spray neem oil.', 'sw', self.translator)
+
+        stats = self.memory.stats()
+        assert stats['chars_sent_to_translator'] == len('Spray neem oil.')
+        assert stats['chars_saved'] == len('Spray neem oil.')
+
+
+class TestTranslateText:
+    """Test suite for speech.translate_text using the memory."""
+
+    async def test_translate_text_uses_memory(self, monkeypatch, tmp_path):
+        """Test that translate_text only calls Translator for unknown sentences."""
+        memory = TranslationMemory(TieredCache('tm-speech-test', 64, 60, tmp_path / 'tm.sqlite3'))
+        monkeypatch.setattr(speech, 'translation_memory', memory)
+        calls = []
+
+        async def fake_request(texts, target_langs):
+            calls.extend(texts)
+            return [{lang: text.upper() for lang in target_langs} for text in texts]
+
+        monkeypatch.setattr(speech, '_translate_request', fake_request)
+
+        first = await speech.translate_text('Spray neem. Wait a week.', 'sw')
+        second = await speech.translate_text('Spray neem.', 'sw')
+
+        assert first == 'SPRAY NEEM. WAIT A WEEK.'
+        assert second == 'SPRAY NEEM.'
+        assert calls == ['Spray neem.', 'Wait a week.']
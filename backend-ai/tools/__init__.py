@@ -0,0 +1 @@
+"""Development tools (local Azure stand-in for load and latency testing)"""
@@ -0,0 +1,329 @@
+"""
+Fake Azure Services
+Local stand-in for the Vision, OpenAI, Translator and Speech endpoints used
+by app/services, with configurable latency, errors, 429 bursts and payload
+sizes for offline load and latency testing
+
+Run:
+    python -m uvicorn tools.fake_azure:app --port 8900
+
+Then point the app at it (any non-empty keys work):
+    AZURE_VISION_ENDPOINT=http://localhost:8900/vision/v3.2/
+    AZURE_OPENAI_ENDPOINT=http://localhost:8900
+    AZURE_TRANSLATOR_ENDPOINT=http://localhost:8900
+    AZURE_SPEECH_ENDPOINT=http://localhost:8900
+
+Behaviour per service is read from the JSON file named by FAKE_AZURE_CONFIG
+(same shape as GET /_fake/config) and can be changed while running with
+PUT /_fake/config, e.g. {"openai": {"latency": {"distribution": "lognormal",
+"median_ms": 1500, "sigma": 0.6}, "error_rate": 0.02}}
+
+POST /_fake/callbacks records any JSON body (e.g. job completion callbacks,
+callback_url=http://localhost:8900/_fake/callbacks) and GET lists them.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+SERVICES = ("vision", "openai", "translator", "tts", "stt")
+
+# Defaults roughly match healthy Azure latencies for the app's payloads
+DEFAULT_CONFIG: Dict[str, Dict] = {
+    "vision": {
+        "latency": {"distribution": "lognormal", "median_ms": 600, "sigma": 0.4},
+        "payload": {"tags": 12},
+    },
+    "openai": {
+        # First token latency; streamed tokens then arrive every token_interval_ms
+        "latency": {"distribution": "lognormal", "median_ms": 900, "sigma": 0.5},
+        "payload": {"completion_words": 90, "token_interval_ms": 15},
+    },
+    "translator": {
+        "latency": {"distribution": "lognormal", "median_ms": 150, "sigma": 0.4},
+        "payload": {"expansion": 1.1},
+    },
+    "tts": {
+        "latency": {"distribution": "lognormal", "median_ms": 300, "sigma": 0.4},
+        "payload": {"bytes_per_char": 60, "chunk_bytes": 4096, "chunk_interval_ms": 20},
+    },
+    "stt": {
+        "latency": {"distribution": "lognormal", "median_ms": 700, "sigma": 0.4},
+        "payload": {"words": 8},
+    },
+}
+
+# Applied to every service unless overridden
+SERVICE_DEFAULTS: Dict = {
+    "latency": {"distribution": "fixed", "ms": 0},
+    # Fraction of calls answered with a 500 or 503
+    "error_rate": 0.0,
+    # Every `every_seconds`, answer 429 for `duration_seconds` (with `rate`
+    # probability) and ask clients to wait `retry_after_ms`
+    "throttle_bursts": {"every_seconds": 0, "duration_seconds": 0, "rate": 1.0, "retry_after_ms": 1000},
+    "payload": {},
+}
+
+VISION_TAGS = [
+    "plant", "leaf", "green", "maize", "crop", "yellow", "spot", "brown", "disease", "field",
+    "rust", "blight", "wilting", "insect", "soil", "tomato", "cassava", "mildew", "lesion", "outdoor",
+]
+
+ADVICE_WORDS = (
+    "Remove the infected leaves and burn them away from the field. Mix two tablespoons of neem oil "
+    "with one litre of water and a little soap, then spray in the early morning every five days. "
+    "Dust wood ash around the base of the plants and keep the spacing wide for airflow. Water at "
+    "the roots, not the leaves. You should see new healthy growth within two weeks."
+).split()
+
+
+def _merge(base: Dict, override: Dict) -> Dict:
+    """Deep-merge override into a copy of base"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class FakeAzure:
+    """Behaviour settings and call counters for the fake services"""
+
+    def __init__(self, config: Optional[Dict] = None, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.config: Dict[str, Dict] = {}
+        self.configure(DEFAULT_CONFIG)
+        if config:
+            self.configure(config)
+        self.stats = {service: {"calls": 0, "errors": 0, "throttled": 0} for service in SERVICES}
+        self.callbacks: List[Dict] = []
+
+    def configure(self, config: Dict) -> None:
+        """Update per-service settings (missing keys keep their values)"""
+        for service in SERVICES:
+            current = self.config.get(service, SERVICE_DEFAULTS)
+            self.config[service] = _merge(current, config.get(service, {}))
+
+    def latency(self, service: str) -> float:
+        """Draw one latency in seconds from the service's distribution"""
+        spec = self.config[service]["latency"]
+        distribution = spec.get("distribution", "fixed")
+        if distribution == "uniform":
+            ms = self.random.uniform(spec.get("min_ms", 0), spec.get("max_ms", 0))
+        elif distribution == "normal":
+            ms = self.random.gauss(spec.get("mean_ms", 0), spec.get("stddev_ms", 0))
+        elif distribution == "lognormal":
+            ms = spec.get("median_ms", 0) * math.exp(self.random.gauss(0, spec.get("sigma", 0)))
+        elif distribution == "exponential":
+            mean = spec.get("mean_ms", 0)
+            ms = self.random.expovariate(1 / mean) if mean > 0 else 0
+        else:
+            ms = spec.get("ms", 0)
+        return max(ms, 0) / 1000
+
+    def payload(self, service: str) -> Dict:
+        return self.config[service]["payload"]
+
+    def fault(self, service: str) -> Optional[Response]:
+        """A 429 or 5xx response if this call should fail, else None"""
+        self.stats[service]["calls"] += 1
+        settings = self.config[service]
+        bursts = settings["throttle_bursts"]
+        every = bursts.get("every_seconds", 0)
+        if every > 0:
+            phase = (time.monotonic() - self.started) % every
+            if phase < bursts.get("duration_seconds", 0) and self.random.random() < bursts.get("rate", 1.0):
+                self.stats[service]["throttled"] += 1
+                retry_after_ms = bursts.get("retry_after_ms", 1000)
+                return JSONResponse(
+                    {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                    status_code=429,
+                    headers={"retry-after-ms": str(retry_after_ms), "Retry-After": str(math.ceil(retry_after_ms / 1000))},
+                )
+        if self.random.random() < settings.get("error_rate", 0):
+            self.stats[service]["errors"] += 1
+            status_code = self.random.choice((500, 503))
+            return JSONResponse({"error": {"code": str(status_code), "message": "Injected failure"}}, status_code=status_code)
+        return None
+
+
+def create_app(config: Optional[Dict] = None, seed: Optional[int] = None) -> FastAPI:
+    """
+    Build the fake server.
+
+    Args:
+        config: Per-service overrides of DEFAULT_CONFIG
+        seed: Seed for latency and fault draws (repeatable runs)
+    """
+    fake = FakeAzure(config, seed)
+    app = FastAPI(title="Fake Azure")
+    app.state.fake = fake
+
+    async def answer(service: str, respond) -> Response:
+        fault = fake.fault(service)
+        if fault is not None and fault.status_code == 429:
+            # Throttling is decided at the gateway, before any work is done
+            return fault
+        await asyncio.sleep(fake.latency(service))
+        return fault or await respond()
+
+    @app.get("/_fake/config")
+    async def get_config():
+        return fake.config
+
+    @app.put("/_fake/config")
+    async def put_config(request: Request):
+        fake.configure(await request.json())
+        return fake.config
+
+    @app.get("/_fake/stats")
+    async def get_stats():
+        return fake.stats
+
+    @app.post("/_fake/reset")
+    async def reset():
+        fake.stats = {service: {"calls": 0, "errors": 0, "throttled": 0} for service in SERVICES}
+        fake.started = time.monotonic()
+        fake.callbacks = []
+        return fake.stats
+
+    @app.post("/_fake/callbacks")
+    async def record_callback(request: Request):
+        fake.callbacks.append(await request.json())
+        return {"received": len(fake.callbacks)}
+
+    @app.get("/_fake/callbacks")
+    async def get_callbacks():
+        return fake.callbacks
+
+    # Dispatch on the path ending so any endpoint prefix (and a doubled
+    # slash from a trailing-slash endpoint setting) works
+    @app.post("/{path:path}")
+    async def dispatch(path: str, request: Request):
+        path = "/" + path.strip("/")
+        if path.endswith("/analyze"):
+            return await answer("vision", lambda: _vision(fake, request))
+        if path.endswith("/chat/completions"):
+            return await answer("openai", lambda: _chat(fake, request))
+        if path.endswith("/translate"):
+            return await answer("translator", lambda: _translate(fake, request))
+        if path.endswith("/speech/recognition/conversation/cognitiveservices/v1"):
+            return await answer("stt", lambda: _recognize(fake))
+        if path.endswith("/cognitiveservices/v1"):
+            return await answer("tts", lambda: _synthesize(fake, request))
+        return JSONResponse({"error": {"code": "404", "message": f"No fake for {path}"}}, status_code=404)
+
+    return app
+
+
+async def _vision(fake: FakeAzure, request: Request) -> Response:
+    await request.body()
+    count = fake.payload("vision").get("tags", 12)
+    tags = [
+        {"name": VISION_TAGS[i % len(VISION_TAGS)], "confidence": round(0.99 - i * 0.03, 2)}
+        for i in range(count)
+    ]
+    return JSONResponse({
+        "tags": tags,
+        "description": {"captions": [{"text": "a close up of a green leaf with brown spots", "confidence": 0.8}]},
+        "modelVersion": "latest",
+    })
+
+
+def _advice_words(count: int) -> List[str]:
+    return [ADVICE_WORDS[i % len(ADVICE_WORDS)] for i in range(count)]
+
+
+async def _chat(fake: FakeAzure, request: Request) -> Response:
+    body = await request.json()
+    payload = fake.payload("openai")
+    words = _advice_words(min(payload.get("completion_words", 90), body.get("max_tokens", 150)))
+    prompt_tokens = sum(len(message.get("content") or "") // 4 + 4 for message in body.get("messages", []))
+    completion_tokens = len(words)
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    interval = payload.get("token_interval_ms", 15) / 1000
+
+    async def events() -> AsyncIterator[bytes]:
+        for i, word in enumerate(words):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+            if interval:
+                await asyncio.sleep(interval)
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def _translate(fake: FakeAzure, request: Request) -> Response:
+    body = await request.json()
+    languages = request.query_params.getlist("to")
+    expansion = fake.payload("translator").get("expansion", 1.0)
+
+    def translated(text: str, lang: str) -> str:
+        # Marked with the language so tests can tell it was translated
+        padding = "~" * max(int(len(text) * (expansion - 1)), 0)
+        return f"[{lang}] {text}{padding}"
+
+    return JSONResponse([
+        {"translations": [{"text": translated(item.get("Text", ""), lang), "to": lang} for lang in languages]}
+        for item in body
+    ])
+
+
+async def _synthesize(fake: FakeAzure, request: Request) -> Response:
+    ssml = (await request.body()).decode("utf-8", errors="replace")
+    payload = fake.payload("tts")
+    size = max(len(ssml) * payload.get("bytes_per_char", 60), 1)
+    chunk_bytes = max(payload.get("chunk_bytes", 4096), 1)
+    interval = payload.get("chunk_interval_ms", 20) / 1000
+
+    async def audio() -> AsyncIterator[bytes]:
+        sent = 0
+        while sent < size:
+            chunk = min(chunk_bytes, size - sent)
+            # MPEG-1 Layer III frame sync followed by silence
+            yield (b"\xff\xfb\x90\x00" + b"\x00" * chunk)[:chunk]
+            sent += chunk
+            if interval and sent < size:
+                await asyncio.sleep(interval)
+
+    return StreamingResponse(audio(), media_type="audio/mpeg")
+
+
+async def _recognize(fake: FakeAzure) -> Response:
+    words = _advice_words(fake.payload("stt").get("words", 8))
+    return JSONResponse({"RecognitionStatus": "Success", "DisplayText": " ".join(words), "Offset": 0, "Duration": 10000000})
+
+
+def _load_config() -> Optional[Dict]:
+    path = os.getenv("FAKE_AZURE_CONFIG")
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+seed = os.getenv("FAKE_AZURE_SEED")
+app = create_app(_load_config(), int(seed) if seed else None)